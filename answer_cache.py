@@ -0,0 +1,156 @@
+# answer_cache.py - Cache persistente das respostas, invalidado pela versão das coleções
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import BASE_CHROMA_PERSIST_DIR
+from query_cache import normalize_query
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Nome do arquivo do cache dentro do diretório base das coleções
+ANSWER_CACHE_FILENAME = "_answer_cache.sqlite3"
+
+# Validade das respostas guardadas (segundos); os resultados de sites externos mudam com o tempo
+ANSWER_CACHE_MAX_AGE = 24 * 60 * 60
+
+
+class AnswerCache:
+    """
+    Cache em SQLite das respostas completas do chatbot (mensagens e links exibidos).
+
+    A chave combina desaparecido, conjunto de coleções consultadas, versão de cada
+    coleção, consulta normalizada, LLM escolhido e hash do prompt. A versão de uma
+    coleção é incrementada (bump_version) sempre que a ingestão a altera, então as
+    respostas antigas deixam de ser encontradas sem precisar apagá-las.
+    """
+
+    def __init__(self, db_path: str, max_age: float = ANSWER_CACHE_MAX_AGE):
+        self.db_path = db_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS collection_versions (
+                    person TEXT NOT NULL,
+                    collection TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    PRIMARY KEY (person, collection)
+                );
+                CREATE TABLE IF NOT EXISTS answers (
+                    cache_key TEXT PRIMARY KEY,
+                    person TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    entries TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+
+    def bump_version(self, person: str, collection: str):
+        """
+        Registra que a coleção do desaparecido foi alterada (invalida as respostas que a usaram).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO collection_versions VALUES (?, ?, 1) "
+                "ON CONFLICT(person, collection) DO UPDATE SET version = version + 1",
+                (person, collection))
+        logger.debug(f"[AnswerCache.bump_version] Coleção {person}/{collection} alterada.")
+
+    def versions(self, person: str, collections: list) -> dict:
+        """
+        Returns:
+            dict: Versão atual de cada coleção (0 se nunca alterada depois da criação do cache).
+        """
+        with self._lock:
+            rows = dict(self._conn.execute(
+                "SELECT collection, version FROM collection_versions WHERE person = ?", (person,)).fetchall())
+        return {collection: rows.get(collection, 0) for collection in collections}
+
+    def make_key(self, person: str, collections: list, query: str, llm_choice: str, prompt_template: str,
+                 scope: str = "") -> str:
+        """
+        Monta a chave da resposta.
+        Args:
+            person (str): Desaparecido.
+            collections (list): Coleções consultadas.
+            query (str): Consulta do usuário.
+            llm_choice (str): LLM escolhido ("Local", "OpenAI", "Deepseek").
+            prompt_template (str): Modelo de prompt em uso.
+            scope (str): Escopo selecionado na interface (ex.: um arquivo dentro de uma
+                coleção consolidada), quando não coincide com as coleções.
+        Returns:
+            str: Hash da chave.
+        """
+        versions = self.versions(person, sorted(set(collections)))
+        payload = json.dumps({
+            "person": person,
+            "scope": scope,
+            "collections": versions,
+            "query": normalize_query(query),
+            "llm": llm_choice,
+            "prompt": hashlib.sha256(prompt_template.encode('utf-8')).hexdigest(),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str):
+        """
+        Returns:
+            list | None: Entradas gravadas (ver put), ou None se ausente ou expirada.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entries, created_at FROM answers WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None or time.time() - row[1] > self.max_age:
+            return None
+        return json.loads(row[0])
+
+    def put(self, cache_key: str, person: str, query: str, entries: list):
+        """
+        Guarda a resposta.
+        Args:
+            entries (list): Pares [tipo, conteúdo] na ordem exibida (ex.: ["text", "..."],
+                ["files", [...]]).
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                               (cache_key, person, query, json.dumps(entries, ensure_ascii=False), time.time()))
+
+    def purge_expired(self) -> int:
+        """
+        Remove as respostas expiradas.
+        Returns:
+            int: Quantidade de respostas removidas.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM answers WHERE created_at < ?",
+                                      (time.time() - self.max_age,)).rowcount
+
+
+# Cache compartilhado pelo processo
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Returns:
+        AnswerCache: Cache de respostas em BASE_CHROMA_PERSIST_DIR, aberto no primeiro uso.
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(os.path.join(BASE_CHROMA_PERSIST_DIR, ANSWER_CACHE_FILENAME))
+        return _answer_cache
@@ -10,18 +10,36 @@ import logging
 import librosa
 import numpy as np
 import speech_recognition as sr
-import whisper
 import azure.cognitiveservices.speech as speechsdk
+from model_registry import models
+from extractors import IngestCancelled
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
-# Carrega o modelo Whisper para transcrição de áudio
-whisper_model = whisper.load_model("base", device="cpu")
-def transcribe_audio_whisper(file_path: str) -> str:
+
+# Modelo Whisper para transcrição de áudio: carregado no primeiro áudio e descartado
+# após WHISPER_IDLE_TIMEOUT segundos sem uso
+WHISPER_MODEL_NAME = "base"
+WHISPER_IDLE_TIMEOUT = 15 * 60
+# Duração (segundos) dos trechos transcritos um a um quando a transcrição pode ser
+# cancelada; o cancelamento é verificado entre os trechos
+WHISPER_SEGMENT_SECONDS = 120
+
+
+def _load_whisper_model():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL_NAME, device="cpu")
+
+
+models.register("whisper", _load_whisper_model, idle_timeout=WHISPER_IDLE_TIMEOUT)
+
+def transcribe_audio_whisper(file_path: str, cancel_check=None) -> str:
     """
     Transcreve um arquivo de áudio usando o modelo Whisper.
     Args:
         file_path (str): Caminho para o arquivo de áudio.
+        cancel_check (callable, opcional): Chamado entre trechos de WHISPER_SEGMENT_SECONDS;
+            lança IngestCancelled para interromper a transcrição.
     Returns:
         str: Texto transcrito do áudio.
     """
@@ -37,23 +55,37 @@ def transcribe_audio_whisper(file_path: str) -> str:
         if not any(os.path.isfile(os.path.join(path, "ffmpeg.exe")) for path in os.environ["PATH"].split(os.pathsep)):
             raise FileNotFoundError("FFmpeg não encontrado no PATH do sistema.")
         # Realiza a transcrição usando o modelo Whisper
-        result = whisper_model.transcribe(file_path, fp16=False)
-        return result["text"]
+        model = models.get("whisper")
+        if cancel_check is None:
+            return model.transcribe(file_path, fp16=False)["text"]
+        import whisper
+        audio = whisper.load_audio(file_path)
+        step = WHISPER_SEGMENT_SECONDS * whisper.audio.SAMPLE_RATE
+        texts = []
+        for start in range(0, len(audio), step):
+            cancel_check()
+            texts.append(model.transcribe(audio[start:start + step], fp16=False)["text"].strip())
+        return " ".join(text for text in texts if text)
+    except IngestCancelled:
+        raise
     except Exception as e:
         # Registra o erro e retorna uma string vazia
         logger.error(f"Erro na transcrição do áudio com Whisper: {e}", exc_info=True)
         return ""
-def process_audio(file_path: str) -> list:
+def process_audio(file_path: str, cancel_check=None) -> list:
     """
     Processa um arquivo de áudio, transcrevendo-o e extraindo metadados.
     Args:
         file_path (str): Caminho para o arquivo de áudio.
+        cancel_check (callable, opcional): Verificação de cancelamento (ver transcribe_audio_whisper).
     Returns:
         list: Lista contendo a transcrição e metadados do áudio.
     """
     try:
         # Tenta transcrever o áudio
-        text = transcribe_audio_whisper(file_path)
+        text = transcribe_audio_whisper(file_path, cancel_check=cancel_check)
+        if cancel_check:
+            cancel_check()
         if not text:
             recognizer = sr.Recognizer()
             with sr.AudioFile(file_path) as source:
@@ -66,6 +98,8 @@ def process_audio(file_path: str) -> list:
         metadata = f"Duração: {duration:.2f} segundos, Taxa de amostragem: {sr_rate} Hz"
         # Retorna a transcrição e os metadados em uma lista
         return [f"Transcrição do áudio: {text}\n{metadata}"]
+    except IngestCancelled:
+        raise
     except Exception as e:
         # Registra o erro e retorna uma lista vazia
         logger.error(f"Erro no processamento do áudio {file_path}: {e}", exc_info=True)
@@ -0,0 +1,214 @@
+# batch_query.py - Triagem em lote de dicas (planilhas da central) contra os documentos de um desaparecido
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import csv
+import os
+import logging
+import time
+from openpyxl import Workbook, load_workbook
+from config import VECTOR_QUANTIZATION, QUANTIZED_RESCORE
+from chroma_registry import get_registry
+from vector_store import consolidated_collections, per_file_collections, collection_store_name, person_where
+from quantized_store import quantized_query_batch
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Quantidade de embeddings de consulta enviados em cada chamada collection.query
+QUERY_BATCH_SIZE = 256
+
+# Nomes de coluna reconhecidos como o texto da dica nas planilhas (sem diferenciar maiúsculas)
+TIP_COLUMN_NAMES = ("dica", "dicas", "consulta", "relato", "texto", "descricao", "descrição")
+
+# Caracteres do trecho gravado na tabela de resultados
+TABLE_SNIPPET_CHARS = 300
+
+# Colunas da tabela de resultados
+RESULT_COLUMNS = ("posicao", "dica_n", "dica", "melhor_distancia", "rank", "distancia", "arquivo", "trecho",
+                  "file_path")
+
+
+def read_tips(path: str, column: str = None) -> list:
+    """
+    Lê as dicas de um arquivo: .txt (uma por linha), .csv ou .xlsx. Em planilhas, usa
+    a coluna informada, a primeira cujo cabeçalho está em TIP_COLUMN_NAMES ou, na
+    falta delas, a primeira coluna.
+    Returns:
+        list: Textos das dicas, na ordem do arquivo (linhas vazias ignoradas).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.txt':
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    if ext == '.csv':
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.reader(f))
+    elif ext == '.xlsx':
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = [["" if cell is None else str(cell) for cell in row]
+                    for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Formato de arquivo de dicas não suportado: {ext}")
+    if not rows:
+        return []
+    header = [name.strip().lower() for name in rows[0]]
+    if column is not None:
+        if column.lower() not in header:
+            raise ValueError(f"Coluna {column} não encontrada em {path}")
+        position, body = header.index(column.lower()), rows[1:]
+    else:
+        matches = [i for i, name in enumerate(header) if name in TIP_COLUMN_NAMES]
+        position, body = (matches[0], rows[1:]) if matches else (0, rows)
+    return [row[position].strip() for row in body if len(row) > position and row[position].strip()]
+
+
+def _merge(per_query: list, collection_name: str, results: dict, offset: int):
+    # Acrescenta o resultado de uma chamada multi-consulta às listas de cada dica
+    for position, (ids, docs, metas, distances) in enumerate(zip(results['ids'], results['documents'],
+                                                                   results['metadatas'], results['distances'])):
+        for chunk_id, doc, meta, distance in zip(ids, docs, metas, distances):
+            meta = meta or {}
+            per_query[offset + position].append({
+                "collection": meta.get('source_file', collection_name), "id": chunk_id, "document": doc,
+                "metadata": meta, "distance": distance})
+
+
+def screen_queries(client_name: str, queries: list, n_results: int = 3, registry=None) -> list:
+    """
+    Pesquisa uma lista de consultas nos documentos de um desaparecido de uma só vez:
+    as consultas são codificadas em uma única chamada batch_encode_texts e cada
+    coleção recebe chamadas collection.query com até QUERY_BATCH_SIZE embeddings
+    (em vez de uma chamada por consulta e por coleção). Com VECTOR_QUANTIZATION, as
+    coleções consolidadas são pontuadas por multiplicação de matrizes no índice quantizado.
+    Args:
+        client_name (str): Nome do desaparecido.
+        queries (list): Textos das consultas.
+        n_results (int): Resultados por consulta.
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+    Returns:
+        list: Para cada consulta, os n_results trechos mais próximos (formato de search_all).
+    """
+    # Importado aqui para que a leitura das dicas não carregue o modelo
+    from embedding_utils import batch_encode_texts, embeddings_for_collection
+
+    registry = registry or get_registry()
+    with registry.pinned():
+        if not queries:
+            return []
+        embeddings = batch_encode_texts(queries)
+        if len(embeddings) != len(queries):
+            raise RuntimeError("Falha ao gerar os embeddings das consultas.")
+
+        per_query = [[] for _ in queries]
+        # Embeddings recodificados para coleções de outro modelo (durante a troca do reprocessamento)
+        memo = {}
+        collections = []
+        for name in per_file_collections(client_name, registry):
+            try:
+                collections.append((registry.get_collection(client_name, name), None, False))
+            except Exception as e:
+                logger.error(f"[screen_queries] Erro ao abrir a coleção {name}: {str(e)}")
+        collections += [(collection, person_where(collection, client_name), True)
+                        for collection in consolidated_collections(client_name, registry)]
+        for collection, where, consolidated in collections:
+            try:
+                total = collection.count()
+                if total == 0:
+                    continue
+                collection_embeddings = embeddings_for_collection(collection, embeddings, queries, memo)
+                if collection_embeddings is None:
+                    continue
+                if VECTOR_QUANTIZATION and consolidated:
+                    # Todas as consultas contra o índice quantizado em multiplicações de matriz
+                    batches = quantized_query_batch(collection, collection_store_name(collection, client_name),
+                                                    collection_embeddings, n_results, VECTOR_QUANTIZATION,
+                                                    rescore=QUANTIZED_RESCORE,
+                                                    person=client_name if where else None, registry=registry)
+                    for position, hits in enumerate(batches):
+                        per_query[position].extend(
+                            dict(hit, collection=hit['metadata'].get('source_file', collection.name)) for hit in hits)
+                    continue
+                for start in range(0, len(collection_embeddings), QUERY_BATCH_SIZE):
+                    results = collection.query(query_embeddings=collection_embeddings[start:start + QUERY_BATCH_SIZE],
+                                               n_results=min(n_results, total), where=where,
+                                               include=['documents', 'metadatas', 'distances'])
+                    _merge(per_query, collection.name, results, start)
+            except Exception as e:
+                logger.error(f"[screen_queries] Erro ao pesquisar na coleção {collection.name}: {str(e)}")
+        return [sorted(hits, key=lambda hit: hit['distance'])[:n_results] for hits in per_query]
+
+
+def ranked_rows(queries: list, results: list) -> list:
+    """
+    Monta a tabela de resultados: as dicas são ordenadas pela distância do seu trecho
+    mais próximo (as que mais se parecem com os documentos do caso primeiro), com uma
+    linha por trecho encontrado.
+    Returns:
+        list: Dicionários com as colunas de RESULT_COLUMNS.
+    """
+    order = sorted(range(len(queries)),
+                   key=lambda i: results[i][0]['distance'] if results[i] else float('inf'))
+    rows = []
+    for position, i in enumerate(order, 1):
+        best = results[i][0]['distance'] if results[i] else None
+        for rank, hit in enumerate(results[i] or [None], 1):
+            rows.append({
+                "posicao": position,
+                "dica_n": i + 1,
+                "dica": queries[i],
+                "melhor_distancia": None if best is None else round(best, 4),
+                "rank": rank if hit else None,
+                "distancia": round(hit['distance'], 4) if hit else None,
+                "arquivo": hit['collection'] if hit else "",
+                "trecho": hit['document'][:TABLE_SNIPPET_CHARS].replace("\n", " ") if hit else "",
+                "file_path": hit['metadata'].get('file_path', '') if hit else "",
+            })
+    return rows
+
+
+def write_table(rows: list, path: str):
+    """
+    Grava a tabela de resultados em .csv ou .xlsx (pela extensão do arquivo).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.xlsx':
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Triagem")
+        sheet.append(list(RESULT_COLUMNS))
+        for row in rows:
+            sheet.append([row[column] for column in RESULT_COLUMNS])
+        workbook.save(path)
+    elif ext == '.csv':
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        raise ValueError(f"Formato da tabela de resultados não suportado: {ext} (use .csv ou .xlsx)")
+
+
+def screen_tips(client_name: str, tips_path: str, output_path: str, n_results: int = 3, column: str = None,
+                registry=None) -> dict:
+    """
+    Triagem de uma planilha de dicas: lê as dicas, pesquisa todas de uma vez nos
+    documentos do desaparecido e grava a tabela ordenada.
+    Returns:
+        dict: queries, rows, seconds e queries_per_second.
+    """
+    queries = read_tips(tips_path, column=column)
+    started = time.perf_counter()
+    results = screen_queries(client_name, queries, n_results=n_results, registry=registry)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rows = ranked_rows(queries, results)
+    write_table(rows, output_path)
+    logger.info(f"[screen_tips] {len(queries)} dicas de {tips_path} pesquisadas em {elapsed:.2f}s "
+                f"({len(queries) / elapsed:.1f} consultas/s) para {client_name}.")
+    return {"queries": len(queries), "rows": len(rows), "seconds": elapsed,
+            "queries_per_second": len(queries) / elapsed}
@@ -0,0 +1,274 @@
+# bm25_index.py - Índice léxico BM25 persistente, ao lado do repositório ChromaDB de cada desaparecido
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from query_cache import portuguese_stopwords, strip_accents
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Nome do arquivo do índice dentro da pasta do repositório ChromaDB
+BM25_INDEX_FILENAME = "_bm25.sqlite3"
+
+# Parâmetros do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Números com separadores (telefones, CPF, RG, boletins de ocorrência) viram um único termo
+_NUMBER_RE = re.compile(r'\d[\d.\-/]*\d')
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _light_stem(word: str) -> str:
+    """
+    Redução leve de plurais em português (ex.: "documentos" -> "documento",
+    "informações" -> "informacao" após remover acentos, "animais" -> "animal").
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix, replacement in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+                                ("ois", "ol"), ("ns", "m"), ("res", "r"), ("zes", "z")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[:-len(suffix)] + replacement
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+_folded_stopwords = None
+
+
+def tokenize(text: str) -> list:
+    """
+    Tokenização para o índice léxico: minúsculas, sem acentos, sem stopwords, com
+    redução leve de plurais e números com separadores normalizados para só dígitos
+    (ex.: "(41) 99999-1234" -> ["41", "999991234"]).
+    Args:
+        text (str): Texto a ser tokenizado.
+    Returns:
+        list: Termos, na ordem do texto.
+    """
+    global _folded_stopwords
+    if _folded_stopwords is None:
+        _folded_stopwords = {strip_accents(word) for word in portuguese_stopwords()}
+    text = _NUMBER_RE.sub(lambda match: re.sub(r'\D', '', match.group()), strip_accents(text.lower()))
+    return [_light_stem(token) for token in _TOKEN_RE.findall(text)
+            if token not in _folded_stopwords and (len(token) > 1 or token.isdigit())]
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 em SQLite. Cada chunk é identificado pelo mesmo id usado
+    no ChromaDB e guarda a coleção e o desaparecido de origem, para filtrar a busca.
+    As estatísticas do corpus (quantidade de chunks, soma dos comprimentos e
+    frequência de documentos de cada termo) são mantidas a cada atualização, então a
+    busca só lê as listas de postings dos termos da consulta.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS docs (
+                    chunk_id TEXT PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    person TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS docs_collection ON docs (collection);
+                CREATE TABLE IF NOT EXISTS terms (
+                    term TEXT PRIMARY KEY,
+                    df INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+                CREATE TABLE IF NOT EXISTS stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    n_docs INTEGER NOT NULL,
+                    total_length INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO stats VALUES (1, 0, 0);
+            """)
+
+    def _remove_locked(self, chunk_ids: list):
+        # Deve ser chamado com o lock e dentro de uma transação
+        for chunk_id in chunk_ids:
+            row = self._conn.execute("SELECT length FROM docs WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            terms = [term for (term,) in self._conn.execute(
+                "SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,))]
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+            self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM docs WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("UPDATE stats SET n_docs = n_docs - 1, total_length = total_length - ? WHERE id = 1",
+                               (row[0],))
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def add(self, chunk_ids: list, documents: list, collection: str, person: str):
+        """
+        Indexa (ou reindexa) chunks.
+        Args:
+            chunk_ids (list): Ids dos chunks no ChromaDB.
+            documents (list): Textos dos chunks.
+            collection (str): Coleção do ChromaDB onde os chunks estão gravados.
+            person (str): Desaparecido dono dos chunks.
+        """
+        if not chunk_ids:
+            return
+        tokenized = [Counter(tokenize(document)) for document in documents]
+        with self._lock, self._conn:
+            self._remove_locked(chunk_ids)
+            total_length = 0
+            for chunk_id, counts in zip(chunk_ids, tokenized):
+                length = sum(counts.values())
+                total_length += length
+                self._conn.execute("INSERT INTO docs VALUES (?, ?, ?, ?)", (chunk_id, collection, person, length))
+                self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                       [(term, chunk_id, tf) for term, tf in counts.items()])
+                self._conn.executemany(
+                    "INSERT INTO terms VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts])
+            self._conn.execute("UPDATE stats SET n_docs = n_docs + ?, total_length = total_length + ? WHERE id = 1",
+                               (len(chunk_ids), total_length))
+
+    def remove(self, chunk_ids):
+        """
+        Remove chunks do índice (ids ausentes são ignorados).
+        """
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
+        with self._lock, self._conn:
+            self._remove_locked(chunk_ids)
+
+    def remove_collection(self, collection: str):
+        """
+        Remove do índice todos os chunks de uma coleção (ex.: coleção por arquivo excluída).
+        """
+        with self._lock:
+            chunk_ids = [chunk_id for (chunk_id,) in self._conn.execute(
+                "SELECT chunk_id FROM docs WHERE collection = ?", (collection,))]
+        self.remove(chunk_ids)
+
+    def remove_prefix(self, id_prefix: str):
+        """
+        Remove do índice os chunks de um documento, pelo prefixo dos ids.
+        """
+        prefix = f"{id_prefix}:"
+        with self._lock:
+            chunk_ids = [chunk_id for (chunk_id,) in self._conn.execute(
+                "SELECT chunk_id FROM docs WHERE substr(chunk_id, 1, ?) = ?", (len(prefix), prefix))]
+        self.remove(chunk_ids)
+
+    def missing(self, chunk_ids: list) -> list:
+        """
+        Returns:
+            list: Ids (entre os informados) que ainda não estão no índice.
+        """
+        with self._lock:
+            return [chunk_id for chunk_id in chunk_ids if self._conn.execute(
+                "SELECT 1 FROM docs WHERE chunk_id = ?", (chunk_id,)).fetchone() is None]
+
+    def search(self, query: str, top_n: int = 10, collections: list = None, person: str = None) -> list:
+        """
+        Busca BM25 pelos termos da consulta.
+        Args:
+            query (str): Consulta do usuário.
+            top_n (int): Quantidade de resultados.
+            collections (list, opcional): Restringe às coleções informadas.
+            person (str, opcional): Restringe aos chunks do desaparecido (índice global).
+        Returns:
+            list: Tuplas (chunk_id, coleção, pontuação), da maior para a menor pontuação.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        allowed = set(collections) if collections is not None else None
+        with self._lock:
+            n_docs, total_length = self._conn.execute("SELECT n_docs, total_length FROM stats WHERE id = 1").fetchone()
+            if not n_docs:
+                return []
+            avg_length = total_length / n_docs
+            scores, meta = {}, {}
+            for term in terms:
+                row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None:
+                    continue
+                idf = math.log(1 + (n_docs - row[0] + 0.5) / (row[0] + 0.5))
+                for chunk_id, tf, collection, owner, length in self._conn.execute(
+                        "SELECT p.chunk_id, p.tf, d.collection, d.person, d.length FROM postings p "
+                        "JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term = ?", (term,)):
+                    if (allowed is not None and collection not in allowed) or (person and owner != person):
+                        continue
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+                    meta[chunk_id] = collection
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:top_n]
+        return [(chunk_id, meta[chunk_id], score) for chunk_id, score in ranked]
+
+    def count(self) -> int:
+        """
+        Returns:
+            int: Quantidade de chunks indexados.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT n_docs FROM stats WHERE id = 1").fetchone()[0]
+
+
+# Índices abertos no processo, por pasta do repositório
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(store_dir: str) -> BM25Index:
+    """
+    Retorna o índice BM25 do repositório (pasta do ChromaDB de um desaparecido ou
+    a global), aberto uma única vez por processo.
+    Args:
+        store_dir (str): Pasta do repositório ChromaDB.
+    Returns:
+        BM25Index: Índice léxico do repositório.
+    """
+    path = os.path.join(store_dir, BM25_INDEX_FILENAME)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = BM25Index(path)
+            _indexes[path] = index
+        return index
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> dict:
+    """
+    Combina rankings (listas de ids, do melhor para o pior) por Reciprocal Rank Fusion.
+    Args:
+        rankings (list): Listas de ids.
+        k (int): Constante de suavização do RRF.
+    Returns:
+        dict: Pontuação combinada por id.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return fused
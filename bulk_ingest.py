@@ -0,0 +1,248 @@
+# bulk_ingest.py - Ingestão em massa de arquivos e pastas com extração paralela
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import shutil
+import time
+import logging
+import multiprocessing
+from extractors import process_document, SUPPORTED_EXTENSIONS, IngestCancelled
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Status possíveis de cada arquivo no relatório final
+FILE_OK = "ok"
+FILE_EMPTY = "vazio"
+FILE_FAILED = "erro"
+
+# Intervalo (segundos) entre verificações de cancelamento enquanto se espera uma extração
+CANCEL_POLL_SECONDS = 0.5
+
+
+def default_worker_count() -> int:
+    """
+    Calcula o tamanho padrão do pool de extração, deixando um núcleo livre
+    para a etapa de embedding/gravação que roda no processo principal.
+    Returns:
+        int: Quantidade de processos de extração.
+    """
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def collect_files(directory: str) -> list:
+    """
+    Percorre uma pasta (recursivamente) e lista os arquivos suportados.
+    Args:
+        directory (str): Pasta a ser percorrida.
+    Returns:
+        list: Caminhos dos arquivos, em ordem estável (ordenados por caminho).
+    """
+    file_paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                file_paths.append(os.path.join(root, name))
+    return file_paths
+
+
+def _extract_file(file_path: str) -> list:
+    """
+    Extrai os textos de um arquivo. Executada nos processos do pool, por isso só
+    depende de extractors (sem modelos de embedding ou KeyBERT).
+    Args:
+        file_path (str): Caminho do arquivo.
+    Returns:
+        list: Textos extraídos.
+    """
+    return list(process_document(file_path))
+
+
+def _wait_extraction(result, cancel_check=None) -> list:
+    """
+    Aguarda a extração de um arquivo no pool, verificando o cancelamento a cada
+    CANCEL_POLL_SECONDS.
+    """
+    while cancel_check:
+        try:
+            return result.get(timeout=CANCEL_POLL_SECONDS)
+        except multiprocessing.TimeoutError:
+            cancel_check()
+    return result.get()
+
+
+def bulk_ingest(file_paths: list, client_name: str, registry=None, max_workers: int = None,
+                progress_callback=None, cache=None, layout: str = None, cancel_check=None) -> list:
+    """
+    Ingere vários arquivos: a extração roda em paralelo em um pool de processos e
+    alimenta uma única etapa de chunking/embedding/gravação em lote no processo principal.
+    Os arquivos são gravados na ordem recebida e falhas são isoladas por arquivo.
+    Args:
+        file_paths (list): Arquivos a serem ingeridos.
+        client_name (str): Nome do desaparecido.
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+        max_workers (int, opcional): Tamanho do pool de extração (padrão: núcleos - 1).
+        progress_callback (callable, opcional): Função (etapa, feitos, total); pode lançar
+            uma exceção para interromper a ingestão.
+        cache (IngestCache, opcional): Cache de ingestão; arquivos já conhecidos não
+            passam pelo pool de extração.
+        layout (str, opcional): Organização das coleções (padrão: STORAGE_LAYOUT).
+        cancel_check (callable, opcional): Verificação de cancelamento (ex.:
+            IngestJob.raise_if_cancelled) chamada enquanto se espera uma extração e
+            durante a gravação de cada arquivo. No cancelamento, os processos do pool
+            são encerrados sem esperar as extrações em andamento.
+    Returns:
+        list: Relatório com um dicionário por arquivo (file, status, chunks, seconds, error).
+    """
+    # Importado aqui para que os processos do pool não carreguem os modelos
+    from document_processor import process_and_add_to_chroma, can_skip_extraction
+    from vector_store import (open_ingest_collection, lexical_index_for, notify_collection_changed,
+                              collection_store_name, document_key, ingest_store_name)
+    from case_index import sync_document_cases
+    from ingest_cache import file_sha256
+    from chroma_registry import get_registry
+
+    registry = registry or get_registry()
+    max_workers = max_workers or default_worker_count()
+    total = len(file_paths)
+    report = []
+    store_name = ingest_store_name(client_name, layout)
+    # Identificações (document_key) já gravadas nesta ingestão
+    keys = set()
+    # Limita os arquivos extraídos aguardando gravação, mantendo a memória controlada
+    window = max_workers * 2
+
+    # Gravação de cada arquivo: só verifica o cancelamento (o progresso é o de "arquivos")
+    file_progress = (lambda stage, done, total: cancel_check()) if cancel_check else None
+
+    def submit(pool, position):
+        # Arquivos já presentes no cache de ingestão não precisam de extração
+        path = file_paths[position]
+        sha256 = None
+        try:
+            if cache is not None:
+                sha256 = file_sha256(path)
+                if can_skip_extraction(cache, sha256):
+                    return None, sha256
+            return pool.apply_async(_extract_file, (path,)), sha256
+        except Exception as e:
+            return e, sha256
+
+    # Os repositórios usados ficam abertos até o fim, mesmo que o LRU do registro os feche.
+    # Ao sair do bloco (inclusive por cancelamento) o pool é encerrado com terminate():
+    # extrações em andamento (PDFs grandes, áudio) são interrompidas, e não aguardadas
+    with multiprocessing.Pool(processes=max_workers) as pool, registry.pinned():
+        futures = {}
+        next_to_submit = 0
+        for index, file_path in enumerate(file_paths):
+            # Mantém o pool abastecido à frente da etapa de gravação
+            while next_to_submit < total and next_to_submit < index + window:
+                futures[next_to_submit] = submit(pool, next_to_submit)
+                next_to_submit += 1
+
+            if progress_callback:
+                progress_callback("arquivos", index, total)
+
+            started = time.time()
+            entry = {"file": file_path, "status": FILE_OK, "chunks": 0, "seconds": 0.0, "error": ""}
+            try:
+                future, sha256 = futures.pop(index)
+                if isinstance(future, Exception):
+                    raise future
+                # Fora da pasta de upload (ingestão no local) os arquivos são identificados
+                # só pelo nome: um segundo arquivo de mesmo nome sobrescreveria o primeiro
+                key = document_key(client_name, file_path)
+                if key in keys:
+                    raise ValueError(f"Outro arquivo desta ingestão já foi gravado como {key}")
+                keys.add(key)
+                textos = _wait_extraction(future, cancel_check) if future is not None else None
+                # A trava de gravação impede que o reprocessamento troque a coleção durante a gravação
+                with registry.writing(store_name):
+                    collection = None
+                    try:
+                        collection = open_ingest_collection(client_name, file_path, layout=layout,
+                                                            registry=registry)
+                        entry["chunks"] = process_and_add_to_chroma(
+                            file_path, client_name, collection, cache=cache, textos=textos, sha256=sha256,
+                            lexical_index=lexical_index_for(collection, client_name, registry),
+                            progress_callback=file_progress, cancel_check=cancel_check)
+                    finally:
+                        if collection is not None:
+                            sync_document_cases(collection, client_name, file_path, registry)
+                            notify_collection_changed(client_name, collection.name,
+                                                      collection_store_name(collection, client_name))
+                if entry["chunks"] == 0:
+                    entry["status"] = FILE_EMPTY
+            except IngestCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"[bulk_ingest] Falha ao ingerir {file_path}: {str(e)}", exc_info=True)
+                entry["status"] = FILE_FAILED
+                entry["error"] = str(e)
+            entry["seconds"] = time.time() - started
+            report.append(entry)
+
+    if progress_callback:
+        progress_callback("arquivos", total, total)
+
+    ok = sum(1 for entry in report if entry["status"] == FILE_OK)
+    logger.info(f"[bulk_ingest] {ok}/{total} arquivos ingeridos para {client_name}.")
+    return report
+
+
+def ingest_folder(folder: str, client_name: str, copy_to_uploads: bool = True, max_workers: int = None,
+                  progress_callback=None, cache=None, layout: str = None, cancel_check=None) -> list:
+    """
+    Ingere uma pasta inteira no repositório do desaparecido em BASE_CHROMA_PERSIST_DIR,
+    na organização de coleções configurada (ver vector_store).
+    Usada pela interface gráfica e pela linha de comando (não depende do Tk).
+    Args:
+        folder (str): Pasta com os arquivos.
+        client_name (str): Nome do desaparecido.
+        copy_to_uploads (bool): Se True, copia a pasta para PDF_DIR/<desaparecido> antes
+            da ingestão, como no upload pela interface; se False, ingere no local.
+        max_workers (int, opcional): Tamanho do pool de extração.
+        progress_callback (callable, opcional): Função (etapa, feitos, total) de progresso.
+        cache (IngestCache, opcional): Cache de ingestão.
+        layout (str, opcional): Organização das coleções (padrão: STORAGE_LAYOUT).
+        cancel_check (callable, opcional): Verificação de cancelamento (ver bulk_ingest).
+    Returns:
+        list: Relatório por arquivo (ver bulk_ingest).
+    """
+    from config import PDF_DIR
+
+    if copy_to_uploads:
+        target_dir = os.path.join(PDF_DIR, client_name, os.path.basename(os.path.normpath(folder)))
+        if progress_callback:
+            progress_callback("cópia", None, None)
+        shutil.copytree(folder, target_dir, dirs_exist_ok=True)
+        folder = target_dir
+    file_paths = collect_files(folder)
+    return bulk_ingest(file_paths, client_name, max_workers=max_workers,
+                       progress_callback=progress_callback, cache=cache, layout=layout,
+                       cancel_check=cancel_check)
+
+
+def format_report(report: list) -> str:
+    """
+    Formata o relatório da ingestão em massa, um arquivo por linha.
+    Args:
+        report (list): Relatório retornado por bulk_ingest.
+    Returns:
+        str: Texto do relatório.
+    """
+    lines = []
+    for entry in report:
+        line = f"[{entry['status']}] {os.path.basename(entry['file'])}: {entry['chunks']} chunks ({entry['seconds']:.1f}s)"
+        if entry["error"]:
+            line += f" - {entry['error']}"
+        lines.append(line)
+    ok = sum(1 for entry in report if entry["status"] == FILE_OK)
+    failed = sum(1 for entry in report if entry["status"] == FILE_FAILED)
+    lines.append(f"Total: {len(report)} arquivos, {ok} ok, {failed} com erro.")
+    return "\n".join(lines)
@@ -0,0 +1,267 @@
+# case_index.py - Índice global de casos: compara um documento com os chunks de todos os desaparecidos
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import logging
+from config import (BASE_CHROMA_PERSIST_DIR, CASE_INDEX_STORE_NAME, CASE_INDEX_COLLECTION_NAME,
+                    CONSOLIDATED_COLLECTION_NAME, GLOBAL_STORE_NAME, LAYOUT_PER_FILE, LAYOUT_GLOBAL)
+from chroma_registry import get_registry
+from chroma_utils import sanitize_collection_name
+from extractors import get_document_type
+from embedding_utils import (collection_model_metadata, embeddings_for_collection, collection_embedding_model,
+                             get_embedding_model_for)
+from vector_store import (READ_PAGE_SIZE, and_where, collection_layout, document_where, document_key,
+                          list_source_files, per_file_collections)
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Chunks candidatos lidos do índice por consulta, antes do agrupamento por desaparecido
+CASE_CANDIDATES = 50
+
+# Trechos guardados por desaparecido no resultado de find_similar_cases
+CASE_TOP_CHUNKS = 3
+
+
+def open_case_index(registry=None):
+    """
+    Returns:
+        Coleção do índice global de casos (criada no primeiro uso).
+    """
+    registry = registry or get_registry()
+    return registry.get_collection(CASE_INDEX_STORE_NAME, CASE_INDEX_COLLECTION_NAME, create=True,
+                                   metadata=collection_model_metadata())
+
+
+def _case_id(client_name: str, source_id: str) -> str:
+    """
+    Id do chunk no índice de casos: o id da coleção de origem prefixado pelo desaparecido.
+    """
+    return f"{sanitize_collection_name(client_name)}/{source_id}"
+
+
+def _source_where(collection, client_name: str, file_path: str) -> dict:
+    """
+    Filtro dos chunks de um arquivo no índice de casos. Coleções por arquivo são
+    identificadas só pelo nome, já que contêm um único arquivo.
+    """
+    clauses = [{"autor": client_name}, {"colecao_origem": collection.name}]
+    if collection_layout(collection) != LAYOUT_PER_FILE:
+        clauses.append({"source_file": document_key(client_name, file_path)})
+    return and_where(*clauses)
+
+
+def _paged_ids(collection, where=None) -> list:
+    ids, offset = [], 0
+    while True:
+        page = collection.get(where=where, include=[], limit=READ_PAGE_SIZE, offset=offset)
+        ids.extend(page['ids'])
+        if len(page['ids']) < READ_PAGE_SIZE:
+            return ids
+        offset += READ_PAGE_SIZE
+
+
+def sync_document_cases(collection, client_name: str, file_path: str, registry=None) -> int:
+    """
+    Espelha no índice de casos os chunks de um arquivo gravados na coleção do
+    desaparecido: copia os embeddings dos chunks novos (sem passar pelo modelo) e
+    remove os que não existem mais. Chamado ao final de cada ingestão, inclusive
+    canceladas, então um arquivo descartado também sai do índice.
+    Na organização global a coleção já contém todos os desaparecidos e é consultada
+    diretamente por find_similar_cases.
+    Args:
+        collection: Coleção onde o arquivo foi gravado.
+        client_name (str): Nome do desaparecido.
+        file_path (str): Arquivo ingerido.
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+    Returns:
+        int: Quantidade de chunks do arquivo no índice de casos.
+    """
+    if collection_layout(collection) == LAYOUT_GLOBAL:
+        return 0
+    try:
+        index = open_case_index(registry)
+        source_ids = {_case_id(client_name, source_id): source_id
+                      for source_id in _paged_ids(collection, document_where(collection, client_name, file_path))}
+        where = _source_where(collection, client_name, file_path)
+        indexed = set(_paged_ids(index, where))
+
+        stale = [case_id for case_id in indexed if case_id not in source_ids]
+        for start in range(0, len(stale), READ_PAGE_SIZE):
+            index.delete(ids=stale[start:start + READ_PAGE_SIZE])
+
+        missing = [case_id for case_id in source_ids if case_id not in indexed]
+        # Durante a troca do reprocessamento, a coleção e o índice podem usar modelos diferentes
+        same_model = collection_embedding_model(collection) == collection_embedding_model(index)
+        for start in range(0, len(missing), READ_PAGE_SIZE):
+            batch = missing[start:start + READ_PAGE_SIZE]
+            found = collection.get(ids=[source_ids[case_id] for case_id in batch],
+                                   include=['documents', 'metadatas', 'embeddings'])
+            metadatas = []
+            for meta in found['metadatas']:
+                meta = meta or {}
+                source_file = meta.get('source_file') or document_key(client_name, file_path)
+                metadatas.append({"autor": client_name, "colecao_origem": collection.name,
+                                  "source_file": source_file,
+                                  "document_type": meta.get('document_type') or get_document_type(source_file),
+                                  "file_path": meta.get('file_path', '')})
+            if same_model:
+                embeddings = [list(embedding) for embedding in found['embeddings']]
+            else:
+                embeddings = get_embedding_model_for(index).encode(found['documents']).tolist()
+            index.upsert(ids=[_case_id(client_name, source_id) for source_id in found['ids']],
+                         documents=found['documents'], metadatas=metadatas, embeddings=embeddings)
+        logger.debug(f"[sync_document_cases] {client_name}/{document_key(client_name, file_path)}: "
+                     f"{len(missing)} chunks adicionados, {len(stale)} removidos.")
+        return len(source_ids)
+    except Exception as e:
+        # O índice de casos não deve interromper a ingestão; o comando indexar-casos o reconstrói
+        logger.error(f"[sync_document_cases] Falha ao atualizar o índice de casos com {file_path}: {str(e)}",
+                     exc_info=True)
+        return 0
+
+
+def remove_collection_cases(client_name: str, collection_name: str, file_path: str = None, registry=None):
+    """
+    Remove do índice de casos os chunks de uma coleção do desaparecido (ou só os de
+    um arquivo, em uma coleção consolidada).
+    """
+    clauses = [{"autor": client_name}, {"colecao_origem": collection_name}]
+    if file_path:
+        clauses.append({"source_file": document_key(client_name, file_path)})
+    try:
+        open_case_index(registry).delete(where=and_where(*clauses))
+    except Exception as e:
+        logger.error(f"[remove_collection_cases] Falha ao remover {client_name}/{collection_name} do índice de casos: "
+                     f"{str(e)}")
+
+
+def rebuild_case_index(client_names: list = None, registry=None) -> int:
+    """
+    Reconstrói o índice de casos a partir das coleções gravadas (ex.: repositórios
+    criados antes do índice), sincronizando cada arquivo de cada desaparecido.
+    Args:
+        client_names (list, opcional): Desaparecidos (padrão: todas as pastas em
+            BASE_CHROMA_PERSIST_DIR, exceto as internas, iniciadas por "_").
+    Returns:
+        int: Quantidade de chunks no índice após a reconstrução.
+    """
+    registry = registry or get_registry()
+    if client_names is None:
+        client_names = sorted(name for name in os.listdir(BASE_CHROMA_PERSIST_DIR)
+                              if not name.startswith('_')
+                              and os.path.isdir(os.path.join(BASE_CHROMA_PERSIST_DIR, name)))
+    for client_name in client_names:
+        for col_name in per_file_collections(client_name, registry):
+            sync_document_cases(registry.get_collection(client_name, col_name), client_name, col_name, registry)
+        if CONSOLIDATED_COLLECTION_NAME in registry.list_collections(client_name):
+            collection = registry.get_collection(client_name, CONSOLIDATED_COLLECTION_NAME)
+            for source_file in list_source_files(collection, client_name):
+                sync_document_cases(collection, client_name, source_file, registry)
+        logger.info(f"[rebuild_case_index] {client_name} sincronizado no índice de casos.")
+    return open_case_index(registry).count()
+
+
+def _case_collections(registry) -> list:
+    """
+    Coleções consultadas por find_similar_cases: o índice de casos e, se existir, a
+    coleção global (que já reúne todos os desaparecidos).
+    """
+    collections = [open_case_index(registry)]
+    if (os.path.isdir(registry.client_path(GLOBAL_STORE_NAME))
+            and CONSOLIDATED_COLLECTION_NAME in registry.list_collections(GLOBAL_STORE_NAME)):
+        collections.append(registry.get_collection(GLOBAL_STORE_NAME, CONSOLIDATED_COLLECTION_NAME))
+    return collections
+
+
+def find_similar_cases(query_embeddings: list, n_results: int = 5, n_chunks: int = CASE_CANDIDATES,
+                       exclude_person: str = None, registry=None, query_texts: list = None) -> list:
+    """
+    Responde "com quais casos este documento se parece" com uma única busca ANN no
+    índice de casos (todos os embeddings do documento na mesma consulta), agrupando
+    os chunks encontrados por desaparecido.
+    Args:
+        query_embeddings (list): Embeddings do documento (um por chunk) ou da consulta.
+        n_results (int): Quantidade de desaparecidos retornados.
+        n_chunks (int): Chunks candidatos lidos por embedding da consulta.
+        exclude_person (str, opcional): Desaparecido a ignorar (ex.: o dono do documento).
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+        query_texts (list, opcional): Textos dos embeddings, recodificados para coleções
+            gravadas com outro modelo (sem eles, essas coleções são ignoradas).
+    Returns:
+        list: Dicionários com person, distance (menor distância), matches (chunks
+        encontrados) e chunks (os CASE_TOP_CHUNKS mais próximos, com id, source_file,
+        document e distance), do caso mais parecido para o menos parecido.
+    """
+    registry = registry or get_registry()
+    if hasattr(query_embeddings, 'tolist'):
+        query_embeddings = query_embeddings.tolist()
+    where = {"autor": {"$ne": exclude_person}} if exclude_person else None
+
+    best = {}
+    memo = {}
+    for collection in _case_collections(registry):
+        total = collection.count()
+        if total == 0:
+            continue
+        try:
+            collection_embeddings = embeddings_for_collection(collection, query_embeddings, query_texts, memo)
+            if collection_embeddings is None:
+                continue
+            results = collection.query(query_embeddings=collection_embeddings, n_results=min(n_chunks, total),
+                                       where=where, include=['documents', 'metadatas', 'distances'])
+        except Exception as e:
+            logger.error(f"[find_similar_cases] Erro ao consultar {collection.name}: {str(e)}")
+            continue
+        for ids, documents, metadatas, distances in zip(results['ids'], results['documents'],
+                                                         results['metadatas'], results['distances']):
+            for chunk_id, doc, meta, distance in zip(ids, documents, metadatas, distances):
+                meta = meta or {}
+                # Vários embeddings da consulta podem encontrar o mesmo chunk: vale a menor distância
+                key = (collection.name, chunk_id)
+                if key not in best or distance < best[key]['distance']:
+                    best[key] = {"person": meta.get('autor', ''), "id": chunk_id, "distance": distance,
+                                 "source_file": meta.get('source_file', ''), "document": doc}
+
+    cases = {}
+    for chunk in sorted(best.values(), key=lambda chunk: chunk['distance']):
+        case = cases.setdefault(chunk['person'], {"person": chunk['person'], "distance": chunk['distance'],
+                                                  "matches": 0, "chunks": []})
+        case['matches'] += 1
+        if len(case['chunks']) < CASE_TOP_CHUNKS:
+            case['chunks'].append(chunk)
+    cases.pop('', None)
+    return sorted(cases.values(), key=lambda case: case['distance'])[:n_results]
+
+
+def find_cases_for_text(text: str, n_results: int = 5, exclude_person: str = None, registry=None) -> list:
+    """
+    Divide o texto (ex.: relato de um avistamento) em chunks, codifica-os em lote e
+    busca os casos semelhantes (ver find_similar_cases).
+    """
+    # Importado aqui para que o módulo possa ser usado sem carregar o modelo
+    from chunking import chunk_texts
+    from embedding_utils import batch_encode_texts, count_tokens
+
+    chunks = list(chunk_texts([text], token_counter=count_tokens)) or [text]
+    embeddings = batch_encode_texts(chunks)
+    if not embeddings:
+        return []
+    return find_similar_cases(embeddings, n_results=n_results, exclude_person=exclude_person, registry=registry,
+                              query_texts=chunks)
+
+
+def find_cases_for_file(file_path: str, n_results: int = 5, exclude_person: str = None, registry=None) -> list:
+    """
+    Extrai o texto de um arquivo e busca os casos semelhantes (ver find_cases_for_text).
+    """
+    from extractors import process_document
+
+    text = "\n".join(process_document(file_path))
+    if not text.strip():
+        return []
+    return find_cases_for_text(text, n_results=n_results, exclude_person=exclude_person, registry=registry)
@@ -11,13 +11,27 @@ import os
 import shutil
 import logging
 import webbrowser
-import chromadb
-from document_processor import process_document, split_into_chunks, generate_metadata
-from embedding_utils import embedding_model
-from chroma_utils import get_snippet_chroma, refine_snippet_chroma, sanitize_collection_name
+from document_processor import process_and_add_to_chroma
+from embedding_utils import get_embedding_model, get_embedding_model_for
+from chroma_utils import retrieve_context
+from query_cache import get_query_embedding, cache_stats
 from llm_utils import ChatOpenAI
 from langchain_openai import ChatOpenAI
 from image_utils import analyze_image, search_missing_persons
+from ingest_worker import IngestWorker, IngestJob, IngestCancelled
+from bulk_ingest import ingest_folder, format_report
+from ingest_cache import IngestCache, INGEST_CACHE_FILENAME
+from chroma_registry import get_registry
+from vector_store import (open_ingest_collection, has_document, discard_document, collection_layout,
+                          list_scopes, resolve_scope, search_all, lexical_index_for, delete_file_collection,
+                          person_collections, notify_collection_changed, collection_store_name,
+                          ingest_store_name)
+from answer_cache import get_answer_cache
+from model_registry import models
+from case_index import sync_document_cases, find_cases_for_text
+from embedding_migration import start_background_reembedding
+# Diretórios principais do projeto (em config.py, para uso também sem interface gráfica)
+from config import BASE_CHROMA_PERSIST_DIR, PDF_DIR, FOTOS_DIR, LAYOUT_PER_FILE
 import requests
 from bs4 import BeautifulSoup
 from PIL import Image, ImageTk
@@ -30,10 +44,18 @@ logger = logging.getLogger(__name__)
 OPENAI_API_KEY = "colocar sua chave aqui"
 DEEPSEEK_API_KEY = "colocar sua chave aqui"
 
-# Diretórios principais do projeto.
-BASE_CHROMA_PERSIST_DIR = "C:/colecoes"
-PDF_DIR = "C:/uploads"
-FOTOS_DIR = os.path.join(os.getcwd(), "C:/uploads/2025")
+# Intervalo (ms) da leitura dos eventos da fila de ingestão pela interface
+INGEST_POLL_INTERVAL_MS = 200
+
+# Quantidade de trechos exibidos na pesquisa em todas as coleções
+SEARCH_ALL_TOP_K = 5
+
+# Modelos pré-aquecidos em segundo plano depois que a janela aparece (os demais,
+# como Whisper e legendas de imagem, só são carregados quando usados)
+STARTUP_WARM_UP_MODELS = ("embedding", "keybert")
+WARM_UP_POLL_INTERVAL_MS = 500
+
+models.mark("importações")
 
 
 class ChatbotGUI(tk.Tk):
@@ -53,8 +75,29 @@ class ChatbotGUI(tk.Tk):
 
         self.client_var = tk.StringVar(value="Selecionar Desaparecido")
         self.collection_var = tk.StringVar(value="Selecionar Coleção")
+        self.ingest_status_var = tk.StringVar(value="Nenhum upload em andamento")
+        # Clientes e coleções do ChromaDB abertos uma única vez e reaproveitados entre consultas
+        self.chroma_registry = get_registry()
+        # Cache de respostas: mensagens exibidas durante uma resposta são gravadas em
+        # _answer_entries (None fora de uma resposta) e reproduzidas em perguntas repetidas
+        self.answer_cache = get_answer_cache()
+        self._answer_entries = None
+        self._answer_failed = False
+        self.answer_cache.purge_expired()
         self.setup_ui()
         self.bind_events()
+
+        # Cache de ingestão por conteúdo (SHA-256), compartilhado por todos os desaparecidos
+        self.ingest_cache = IngestCache(os.path.join(BASE_CHROMA_PERSIST_DIR, INGEST_CACHE_FILENAME))
+
+        # Fila de ingestão em segundo plano; o progresso volta para a interface via after()
+        self.ingest_worker = IngestWorker(self._run_upload_job)
+        self.after(INGEST_POLL_INTERVAL_MS, self.poll_ingest_events)
+
+        # Modelos: carregados sob demanda; os principais são pré-aquecidos assim que a
+        # janela aparece e os ociosos são descartados periodicamente
+        models.mark("interface")
+        self.after(0, self.start_model_warm_up)
         
         # Adicionando suporte para pesquisa em sites externos
         self.external_sites = [
@@ -63,15 +106,42 @@ class ChatbotGUI(tk.Tk):
         ]
 
 
+    def start_model_warm_up(self):
+        # Executado na thread do Tk, após a primeira renderização da janela
+        models.start_idle_reaper()
+        thread = models.warm_up(STARTUP_WARM_UP_MODELS)
+        self.after(WARM_UP_POLL_INTERVAL_MS, self._check_model_warm_up, thread)
+        # Modelo de embedding trocado em config.py: reprocessa as coleções em segundo
+        # plano; as consultas usam o modelo anterior até a troca
+        try:
+            job = start_background_reembedding(registry=self.chroma_registry)
+        except Exception as e:
+            logger.error(f"[start_model_warm_up] Falha ao iniciar o reprocessamento dos embeddings: {str(e)}")
+            job = None
+        if job is not None:
+            status = job.status()
+            self.display_message(f"Reprocessando os embeddings de {status['active']} para {status['target']} "
+                                 f"em segundo plano.")
+
+    def _check_model_warm_up(self, thread):
+        # Aguarda o fim do pré-aquecimento para registrar o relatório de inicialização
+        if thread.is_alive():
+            self.after(WARM_UP_POLL_INTERVAL_MS, self._check_model_warm_up, thread)
+            return
+        models.mark("pré-aquecimento")
+        models.log_startup_report()
+
     def search_external_sites(self, query):
         """
         Pesquisa informações sobre pessoas desaparecidas em sites externos.
         Args:
             query (str): Termo de busca.
         Returns:
-            list: Lista de resultados encontrados nos sites externos.
+            list: Lista de resultados encontrados nos sites externos. Falhas de acesso
+            marcam a resposta como falha (não vai para o cache de respostas).
         """
         results = []
+        failed = []
         for site in self.external_sites:
             try:
                 response = requests.get(site)
@@ -84,9 +154,15 @@ class ChatbotGUI(tk.Tk):
                         results.append(f"{name}: {details} ({link})")
                 else:
                     logger.warning(f"Falha ao acessar {site}: {response.status_code}")
+                    failed.append(site)
             except Exception as e:
                 logger.error(f"Erro ao pesquisar no site {site}: {str(e)}", exc_info=True)
+                failed.append(site)
 
+        if failed:
+            # Resultado parcial ou vazio por falha de acesso: não deve ser reaproveitado
+            self._answer_failed = True
+            results.append(f"⚠️ Falha ao acessar {len(failed)} de {len(self.external_sites)} sites externos.")
         return results if results else ["Nenhum resultado encontrado nos sites externos."]
 
 
@@ -115,6 +191,16 @@ class ChatbotGUI(tk.Tk):
         self.upload_btn = tk.Button(left_frame, text="Upload Documento", command=self.upload_document)
         self.upload_btn.pack(fill='x', pady=5)
 
+        self.upload_folder_btn = tk.Button(left_frame, text="Upload Pasta", command=self.upload_folder)
+        self.upload_folder_btn.pack(fill='x', pady=5)
+
+        self.cancel_upload_btn = tk.Button(left_frame, text="Cancelar Upload", command=self.cancel_upload)
+        self.cancel_upload_btn.pack(fill='x', pady=2)
+
+        self.ingest_status_label = tk.Label(left_frame, textvariable=self.ingest_status_var,
+                                            wraplength=200, justify='left', anchor='w')
+        self.ingest_status_label.pack(fill='x', pady=2)
+
         tk.Label(left_frame, text="Modelo LLM:").pack(fill='x', pady=2)
         self.llm_menu = tk.OptionMenu(left_frame, self.llm_choice, "Local", "OpenAI", "Deepseek")
         self.llm_menu.pack(fill='x', pady=2)
@@ -126,6 +212,10 @@ class ChatbotGUI(tk.Tk):
         self.process_images_btn = tk.Button(left_frame, text="Processar Imagens", command=self.process_images)
         self.process_images_btn.pack(fill='x', pady=5)
 
+        # Compara o texto digitado (ex.: relato de avistamento) com os documentos de todos os desaparecidos
+        self.similar_cases_btn = tk.Button(left_frame, text="Casos Semelhantes", command=self.find_similar_cases)
+        self.similar_cases_btn.pack(fill='x', pady=5)
+
         self.chat_area = tk.Text(self, height=20, width=50, state="disabled")
         self.chat_area.grid(row=1, column=1, columnspan=2, pady=10, padx=5, sticky="nsew")
 
@@ -141,6 +231,27 @@ class ChatbotGUI(tk.Tk):
         self.clear_btn = tk.Button(btn_frame, text="Limpar", command=self.clear_chat)
         self.clear_btn.pack(side='left', fill='x', expand=True)
 
+    def find_similar_cases(self):
+        # Compara o texto digitado com os documentos de todos os desaparecidos (índice de casos)
+        try:
+            text = self.input_area.get("1.0", END).strip()
+            if not text:
+                raise ValueError("Digite ou cole o relato a ser comparado com os casos.")
+            client_name = self.client_var.get()
+            exclude = client_name if client_name != "Selecionar Desaparecido" else None
+            cases = find_cases_for_text(text, exclude_person=exclude, registry=self.chroma_registry)
+            if not cases:
+                self.display_message("Nenhum caso semelhante encontrado.")
+                return
+            self.display_message("🔗 Casos semelhantes:")
+            for position, case in enumerate(cases, 1):
+                self.display_message(f"{position}. {case['person']} (distância {case['distance']:.3f}, "
+                                     f"{case['matches']} trechos)")
+                for chunk in case['chunks']:
+                    self.display_message(f"   - {chunk['source_file']}: {chunk['document'][:200]}")
+        except Exception as e:
+            self.handle_error("busca de casos semelhantes", e)
+
     def process_images(self):
         """Processa imagens no diretório 'fotos' e exibe resultados."""
         if not os.path.exists(FOTOS_DIR):
@@ -191,45 +302,113 @@ class ChatbotGUI(tk.Tk):
         # Inicia o processo de upload de documento
         try:
             file_types = [("Documentos", "*.pdf *.docx *.xlsx *.txt *.png *.jpg *.jpeg *.gif *.mp3 *.wav *.ogg")]
-            file_path = filedialog.askopenfilename(filetypes=file_types)
-            if file_path:
+            file_paths = filedialog.askopenfilenames(filetypes=file_types)
+            for file_path in file_paths:
                 self.process_upload(file_path)
         except Exception as e:
             self.handle_error("upload", e)
 
+    def upload_folder(self):
+        # Inicia a ingestão em massa de uma pasta (ex.: pendrive entregue pela família)
+        try:
+            folder = filedialog.askdirectory()
+            if folder:
+                self.process_upload(folder)
+        except Exception as e:
+            self.handle_error("upload de pasta", e)
+
     def process_upload(self, file_path):
-        # Processa o upload do documento
+        # Enfileira o upload do documento para processamento em segundo plano
         try:
             client_name = self.client_var.get()
             if not client_name or client_name == "Selecionar Desaparecido":
                 raise ValueError("Selecione um desaparecido antes de fazer upload.")
-            client_upload_dir = os.path.join(PDF_DIR, client_name)
-            os.makedirs(client_upload_dir, exist_ok=True)
-            new_file_path = os.path.join(client_upload_dir, os.path.basename(file_path))
-            shutil.copy(file_path, new_file_path)
-            client_path = os.path.join(BASE_CHROMA_PERSIST_DIR, client_name)
-            client = chromadb.PersistentClient(path=client_path)
-            collection_name = sanitize_collection_name(os.path.basename(new_file_path))
-            collection = client.get_or_create_collection(collection_name)
-            textos = process_document(new_file_path)
-            for idx, texto in enumerate(textos):
-                chunks = split_into_chunks(texto)
-                for chunk_idx, chunk in enumerate(chunks):
-                    metadata = generate_metadata(chunk, os.path.basename(new_file_path), client_name, new_file_path)
-                    embedding = embedding_model.encode(chunk).tolist()
-                    collection.add(
-                        ids=[f"{collection_name}chunk{idx}{chunk_idx}"],
-                        documents=[chunk],
-                        metadatas=[metadata],
-                        embeddings=[embedding]
-                    )
-            self.update_collection_menu()
-            self.display_message(f"Documento {os.path.basename(new_file_path)} processado com sucesso!")
-        except chromadb.errors.UniqueConstraintError as e:
-            self.display_message(f"Documento já existe: {str(e)}")
+            job = self.ingest_worker.submit(
+                IngestJob(file_path, client_name, label=os.path.basename(file_path)))
+            self.display_message(f"Documento {job.label} adicionado à fila de processamento.")
         except Exception as e:
             self.handle_error("processamento de upload", e)
 
+    def _run_upload_job(self, job, report):
+        # Executado na thread de ingestão: não deve acessar widgets do Tk
+        if os.path.isdir(job.file_path):
+            return self._run_folder_job(job, report)
+        client_upload_dir = os.path.join(PDF_DIR, job.client_name)
+        os.makedirs(client_upload_dir, exist_ok=True)
+        new_file_path = os.path.join(client_upload_dir, os.path.basename(job.file_path))
+        report("cópia")
+        shutil.copy(job.file_path, new_file_path)
+        # A trava de gravação impede que o reprocessamento troque a coleção durante a gravação
+        with self.chroma_registry.pinned(), self.chroma_registry.writing(ingest_store_name(job.client_name)):
+            collection = open_ingest_collection(job.client_name, new_file_path, registry=self.chroma_registry)
+            existed = has_document(collection, job.client_name, new_file_path)
+            try:
+                return process_and_add_to_chroma(new_file_path, job.client_name, collection,
+                                                 progress_callback=report, cache=self.ingest_cache,
+                                                 lexical_index=lexical_index_for(collection, job.client_name,
+                                                                                 self.chroma_registry),
+                                                 cancel_check=job.raise_if_cancelled)
+            except IngestCancelled:
+                # Descarta os chunks parciais de um documento novo (a coleção inteira, se for por arquivo)
+                if not existed:
+                    if collection_layout(collection) == LAYOUT_PER_FILE:
+                        delete_file_collection(job.client_name, collection.name, self.chroma_registry)
+                    else:
+                        discard_document(collection, job.client_name, new_file_path, self.chroma_registry)
+                raise
+            finally:
+                sync_document_cases(collection, job.client_name, new_file_path, self.chroma_registry)
+                notify_collection_changed(job.client_name, collection.name,
+                                          collection_store_name(collection, job.client_name))
+
+    def _run_folder_job(self, job, report):
+        # Copia a pasta para o diretório do desaparecido e ingere todos os arquivos em paralelo
+        return ingest_folder(job.file_path, job.client_name, progress_callback=report,
+                             cache=self.ingest_cache, cancel_check=job.raise_if_cancelled)
+
+    def cancel_upload(self):
+        # Cancela o upload em andamento
+        if not self.ingest_worker.cancel():
+            self.display_message("Nenhum upload em andamento para cancelar.")
+
+    def poll_ingest_events(self):
+        # Consome os eventos publicados pela thread de ingestão (executado na thread do Tk)
+        try:
+            for event in self.ingest_worker.poll_events():
+                self._handle_ingest_event(event)
+        except Exception as e:
+            self.handle_error("acompanhamento de upload", e)
+        finally:
+            self.after(INGEST_POLL_INTERVAL_MS, self.poll_ingest_events)
+
+    def _handle_ingest_event(self, event):
+        label = event['label']
+        pending = self.ingest_worker.pending_count()
+        queued = f" | {pending} na fila" if pending > 1 else ""
+        if event['type'] == "progress":
+            status = f"{label}: {event['stage']}"
+            if event.get('total'):
+                status += f" {event['done']}/{event['total']}"
+            if event.get('eta') is not None:
+                status += f" (restam ~{event['eta']:.0f}s)"
+            self.ingest_status_var.set(status + queued)
+        elif event['type'] == "done":
+            self.ingest_status_var.set(f"{label}: concluído em {event['elapsed']:.1f}s{queued}")
+            self.update_collection_menu()
+            if isinstance(event.get('result'), list):
+                self.display_message(f"Pasta {label} processada:\n{format_report(event['result'])}")
+            else:
+                self.display_message(f"Documento {label} processado com sucesso!")
+        elif event['type'] == "cancelled":
+            self.ingest_status_var.set(f"{label}: cancelado{queued}")
+            self.display_message(f"Upload de {label} cancelado.")
+        elif event['type'] == "error":
+            self.ingest_status_var.set(f"{label}: erro{queued}")
+            if event.get('error_type') == "UniqueConstraintError":
+                self.display_message(f"Documento já existe: {event['error']}")
+            else:
+                self.display_message(f"⚠️ Erro em processamento de upload ({label}): {event['error']}")
+
     def send_message(self, event=None):
         try:
             query = self.input_area.get("1.0", END).strip()
@@ -244,52 +423,71 @@ class ChatbotGUI(tk.Tk):
 
             self.display_message(f"\nVocê: {query}")
 
-            # Pesquisa em coleções locais
-            if collection_name == "Pesquisar em Todas as Coleções":
-                self.search_all_collections(client_name, query)
-            else:
-                client_path = os.path.join(BASE_CHROMA_PERSIST_DIR, client_name)
-                client = chromadb.PersistentClient(path=client_path)
-                collection = client.get_collection(collection_name)
-                self.process_query(collection, query)
-
-            # Pesquisa em sites externos
-            external_results = self.search_external_sites(query)  # Corrigido aqui
-            if external_results:
-                self.display_message("\nResultados de sites externos:")
-                for result in external_results:
-                    self.display_message(result)
+            # Os repositórios consultados ficam abertos até a resposta, mesmo que o LRU os feche
+            with self.chroma_registry.pinned():
+                # Resposta já dada para a mesma pergunta, com as mesmas coleções (mesma versão), LLM e prompt
+                if collection_name == "Pesquisar em Todas as Coleções":
+                    collection, where = None, None
+                    collections = person_collections(client_name, registry=self.chroma_registry)
+                else:
+                    collection, where = resolve_scope(client_name, collection_name, registry=self.chroma_registry)
+                    collections = [collection.name]
+                cache_key = self.answer_cache.make_key(client_name, collections, query, self.llm_choice.get(),
+                                                       self.current_prompt.get(), scope=collection_name)
+                cached = self.answer_cache.get(cache_key)
+                if cached is not None:
+                    self.replay_answer(cached)
+                    self.input_area.delete("1.0", END)
+                    return
+
+                self._answer_entries, self._answer_failed = [], False
+                try:
+                    # Pesquisa em coleções locais
+                    if collection is None:
+                        self.search_all_collections(client_name, query)
+                    else:
+                        self.process_query(collection, query, where=where, client_name=client_name)
+
+                    # Pesquisa em sites externos
+                    external_results = self.search_external_sites(query)  # Corrigido aqui
+                    if external_results:
+                        self.display_message("\nResultados de sites externos:")
+                        for result in external_results:
+                            self.display_message(result)
+                    entries = self._answer_entries
+                finally:
+                    self._answer_entries = None
+            if not self._answer_failed:
+                self.answer_cache.put(cache_key, client_name, query, entries)
 
             self.input_area.delete("1.0", END)
 
         except Exception as e:
             self.handle_error("envio de mensagem", e)
 
+    def replay_answer(self, entries):
+        # Reexibe uma resposta do cache de respostas, sem consulta nem chamada ao LLM
+        for kind, content in entries:
+            if kind == "files":
+                self.display_file_links(content)
+            else:
+                self.display_message(content)
+        self.display_message("(resposta do cache)")
+
 
 
     def search_all_collections(self, client_name, query):
-        # Pesquisa em todas as coleções do desaparecido
-        client_path = os.path.join(BASE_CHROMA_PERSIST_DIR, client_name)
-        client = chromadb.PersistentClient(path=client_path)
-        collection_names = client.list_collections()
+        # Pesquisa em todas as coleções do desaparecido: a consulta é codificada uma única
+        # vez; coleções consolidadas são uma única busca e as por arquivo rodam em paralelo
+        query_embedding = get_query_embedding(query, get_embedding_model())
+        hits = search_all(client_name, query_embedding, n_results=SEARCH_ALL_TOP_K,
+                          registry=self.chroma_registry, query_text=query)
         combined_context = []
         all_files = set()
-        for col_name in collection_names:
-            try:
-                current_collection = client.get_collection(col_name)
-                results = current_collection.query(
-                    query_texts=[query],
-                    n_results=3,
-                    include=['documents', 'metadatas']
-                )
-                if results and results.get('documents'):
-                    for doc, meta in zip(results['documents'][0], results['metadatas'][0]):
-                        if query.lower() in doc.lower():
-                            combined_context.append(f"Coleção: {col_name}\n{doc[:500]}...")
-                            if 'file_path' in meta:
-                                all_files.add(meta['file_path'])
-            except Exception as e:
-                logger.error(f"Erro ao pesquisar na coleção {col_name}: {str(e)}")
+        for hit in hits:
+            combined_context.append(f"Coleção: {hit['collection']}\n{hit['document'][:500]}...")
+            if hit['metadata'].get('file_path'):
+                all_files.add(hit['metadata']['file_path'])
         if combined_context:
             response_text = "\n\n".join(combined_context)
             self.display_message(f"Chatbot (Pesquisa em Todas):\n{response_text}")
@@ -300,32 +498,35 @@ class ChatbotGUI(tk.Tk):
             context = "\n\n".join(combined_context)[:2000]
             self.generate_llm_response(context, query, list(all_files))
 
-    def process_query(self, collection, query):
-        # Processa a consulta em uma coleção específica
+    def process_query(self, collection, query, where=None, client_name=None):
+        # Processa a consulta em uma coleção específica (where restringe a um arquivo
+        # quando a coleção é consolidada); com client_name, a busca também usa o índice BM25
         if self.llm_choice.get() != "Local":
             if self.llm_choice.get() == "Deepseek" and not DEEPSEEK_API_KEY:
+                self._answer_failed = True
                 self.display_message("Erro: Chave Deepseek não configurada!")
                 return
             if self.llm_choice.get() == "OpenAI" and not OPENAI_API_KEY:
+                self._answer_failed = True
                 self.display_message("Erro: Chave OpenAI não configurada!")
                 return
-            snippet_result = get_snippet_chroma(collection, query, embedding_model)
-            refined_result = refine_snippet_chroma(collection, snippet_result['text'], embedding_model)
-            context = refined_result['text']
-            if not context.strip():
-                results = collection.query(
-                    query_texts=[query],
-                    n_results=3,
-                    include=['documents']
-                )
-                context = "\n\n".join([doc if isinstance(doc, str) else ' '.join(doc) for doc in results['documents'][0]])[:2000]
-            self.generate_llm_response(context, query, refined_result['files'])
+            # Uma única codificação e consulta ANN, fundida por RRF com os candidatos do BM25
+            lexical_index = (lexical_index_for(collection, client_name, self.chroma_registry)
+                             if client_name else None)
+            result = retrieve_context(collection, query, get_embedding_model_for(collection), where=where,
+                                      lexical_index=lexical_index, person=client_name)
+            if result.get('error'):
+                self._answer_failed = True
+                self.display_message(f"⚠️ Erro ao recuperar o contexto: {result['error']}")
+                return
+            self.generate_llm_response(result['text'], query, result['files'])
         else:
             total_docs = collection.count()
             n_results = min(5, total_docs) if total_docs > 0 else 1
             results = collection.query(
-                query_texts=[query],
+                query_embeddings=[get_query_embedding(query, get_embedding_model_for(collection))],
                 n_results=n_results,
+                where=where,
                 include=['documents', 'metadatas']
             )
             response_text = "\n\n".join([
@@ -361,6 +562,16 @@ class ChatbotGUI(tk.Tk):
             self.handle_error("geração de resposta LLM", e)
 
     def display_file_links(self, files):
+        # Na gravação da resposta os links entram como uma única entrada (não como mensagens)
+        entries, self._answer_entries = self._answer_entries, None
+        if entries is not None:
+            entries.append(["files", list(files)])
+        try:
+            self._display_file_links(files)
+        finally:
+            self._answer_entries = entries
+
+    def _display_file_links(self, files):
         unique_files = list(set([f for f in files if f]))
         if unique_files:
             self.display_message("\n🔗 Documentos relacionados:")
@@ -402,8 +613,7 @@ class ChatbotGUI(tk.Tk):
                 f"Erro: Desaparecido '{client}' não encontrado.")
             return False
         try:
-            chroma_client = chromadb.PersistentClient(path=client_path)
-            collection_names = chroma_client.list_collections()
+            collection_names = list_scopes(client, registry=self.chroma_registry)
             if collection != "Pesquisar em Todas as Coleções" and collection not in collection_names:
                 raise ValueError(f"Coleção {collection} não existe")
             return True
@@ -417,10 +627,7 @@ class ChatbotGUI(tk.Tk):
         client_name = self.client_var.get()
         if client_name and client_name != "Selecionar Desaparecido":
             try:
-                client_path = os.path.join(
-                    BASE_CHROMA_PERSIST_DIR, client_name)
-                client = chromadb.PersistentClient(path=client_path)
-                collection_names = client.list_collections()
+                collection_names = list_scopes(client_name, registry=self.chroma_registry)
                 menu = self.collection_menu['menu']
                 menu.delete(0, 'end')
                 menu.add_command(
@@ -437,6 +644,8 @@ class ChatbotGUI(tk.Tk):
                 self.handle_error("atualização de coleções", e)
 
     def display_message(self, message):
+        if self._answer_entries is not None:
+            self._answer_entries.append(["text", message])
         self.chat_area.config(state="normal")
         self.chat_area.insert(END, f"\n{message}")
         self.chat_area.see(END)
@@ -448,6 +657,8 @@ class ChatbotGUI(tk.Tk):
         self.chat_area.config(state="disabled")
 
     def handle_error(self, context, error):
+        # Respostas com erro não vão para o cache de respostas
+        self._answer_failed = True
         error_msg = f"Erro em {context}: {str(error)}"
         logger.error(error_msg, exc_info=True)
         self.display_message(f"⚠️ {error_msg}")
@@ -455,6 +666,10 @@ class ChatbotGUI(tk.Tk):
     def safe_shutdown(self):
         try:
             self.display_message("\nSistema: Encerrando o chatbot...")
+            # Registra a eficácia dos caches de consulta da sessão
+            for stats in cache_stats():
+                logger.info(f"Cache de {stats['cache']}: {stats['hits']} acertos, {stats['misses']} falhas "
+                            f"({stats['hit_rate']:.0%}), {stats['entries']} entradas.")
             self.update_idletasks()
             self.destroy()
         except Exception as e:
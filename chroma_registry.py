@@ -0,0 +1,287 @@
+# chroma_registry.py - Registro dos clientes e coleções do ChromaDB abertos no processo
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import chromadb
+from config import BASE_CHROMA_PERSIST_DIR, REEMBED_SHADOW_PREFIX
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de repositórios (pastas de desaparecidos) abertos ao mesmo tempo
+MAX_OPEN_STORES = 32
+
+
+class _OpenStore:
+    """
+    Cliente aberto de um desaparecido e os handles de coleção já obtidos dele.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.client = chromadb.PersistentClient(path=path)
+        self.collections = {}
+        self.collection_names = None
+        self.lock = threading.Lock()
+        # Blocos pinned() que usam o repositório; fechado pelo LRU enquanto em uso, só é
+        # liberado quando o último termina
+        self.refs = 0
+        self.evicted = False
+
+
+class ChromaRegistry:
+    """
+    Mantém abertos, por pasta de desaparecido em base_dir, o cliente ChromaDB e os
+    handles das suas coleções, para que consultas e uploads não reabram o SQLite e
+    os índices HNSW a cada chamada.
+
+    Os repositórios são mantidos em ordem de uso (LRU); ao ultrapassar max_open, o
+    menos usado é fechado (o registro descarta o cliente e os handles guardados).
+    Operações longas que guardam handles (busca, ingestão, reprocessamento) rodam
+    dentro de pinned(): os blocos de todas as threads que usam um repositório são
+    contados, e um repositório fechado pelo LRU nesse meio tempo só é liberado quando
+    o último termina (se reaberto antes disso, é reaproveitado).
+
+    Gravações (ingestão, remoção de documentos, troca do reprocessamento) rodam
+    dentro de writing(), que serializa as gravações em cada repositório.
+    """
+
+    def __init__(self, base_dir: str = BASE_CHROMA_PERSIST_DIR, max_open: int = MAX_OPEN_STORES):
+        self.base_dir = base_dir
+        self.max_open = max_open
+        self._stores = OrderedDict()
+        # Repositórios fechados pelo LRU mas ainda em uso (refs > 0), por pasta
+        self._draining = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Travas de gravação por pasta; sobrevivem ao fechamento do repositório pelo LRU
+        self._write_locks = {}
+
+    def client_path(self, client_name: str) -> str:
+        """
+        Returns:
+            str: Pasta do repositório ChromaDB do desaparecido.
+        """
+        return os.path.join(self.base_dir, client_name)
+
+    def _store(self, client_name: str) -> _OpenStore:
+        path = self.client_path(client_name)
+        released = []
+        with self._lock:
+            store = self._stores.get(path)
+            if store is not None:
+                self._stores.move_to_end(path)
+            else:
+                # Fechado pelo LRU mas ainda em uso: volta a ser o repositório aberto
+                store = self._draining.pop(path, None)
+                if store is not None:
+                    store.evicted = False
+                else:
+                    store = _OpenStore(path)
+                    logger.debug(f"[ChromaRegistry] Repositório aberto: {path} ({len(self._stores) + 1} abertos).")
+                self._stores[path] = store
+                while len(self._stores) > self.max_open:
+                    _, evicted = self._stores.popitem(last=False)
+                    released.extend(self._evict(evicted))
+            self._pin(store)
+        for evicted in released:
+            self._release(evicted)
+        return store
+
+    def _pin(self, store: _OpenStore):
+        # Chamado com self._lock: conta o repositório no bloco pinned() mais interno da thread
+        stack = getattr(self._local, "pins", None)
+        if stack and store not in stack[-1]:
+            stack[-1].add(store)
+            store.refs += 1
+
+    def _evict(self, store: _OpenStore) -> list:
+        # Chamado com self._lock: adia o fechamento de um repositório em uso
+        if store.refs > 0:
+            store.evicted = True
+            self._draining[store.path] = store
+            return []
+        return [store]
+
+    @contextmanager
+    def pinned(self):
+        """
+        Mantém abertos os repositórios usados pela thread dentro do bloco, mesmo que
+        o LRU os feche nesse meio tempo, para que os handles obtidos continuem válidos.
+        """
+        stack = self._local.__dict__.setdefault("pins", [])
+        pins = set()
+        stack.append(pins)
+        try:
+            yield self
+        finally:
+            stack.pop()
+            released = []
+            with self._lock:
+                for store in pins:
+                    store.refs -= 1
+                    if store.refs == 0 and store.evicted:
+                        self._draining.pop(store.path, None)
+                        released.append(store)
+            for store in released:
+                self._release(store)
+
+    def _release(self, store: _OpenStore):
+        # Apenas descarta as referências do registro (cliente, handles e lista de coleções),
+        # sem parar o System do ChromaDB nem acessar atributos internos: handles obtidos
+        # antes do fechamento, inclusive por threads fora de pinned(), continuam válidos
+        store.collections.clear()
+        store.collection_names = None
+        store.client = None
+        logger.debug(f"[ChromaRegistry] Repositório fechado: {store.path}.")
+
+    def write_lock(self, client_name: str) -> threading.RLock:
+        """
+        Returns:
+            threading.RLock: Trava de gravação do repositório do desaparecido.
+        """
+        path = self.client_path(client_name)
+        with self._lock:
+            return self._write_locks.setdefault(path, threading.RLock())
+
+    @contextmanager
+    def writing(self, *client_names):
+        """
+        Bloqueia as gravações de outras threads nos repositórios informados enquanto o
+        bloco executa (ex.: a troca de coleções do reprocessamento não acontece no meio
+        de uma ingestão, que guarda o handle da coleção antiga). As travas são obtidas
+        sempre na mesma ordem, para que quem grava em mais de um repositório não entre
+        em impasse.
+        """
+        locks = [self.write_lock(name) for name in sorted(set(client_names))]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield self
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def get_client(self, client_name: str):
+        """
+        Args:
+            client_name (str): Nome do desaparecido.
+        Returns:
+            Cliente ChromaDB do desaparecido (aberto uma única vez por processo).
+        """
+        return self._store(client_name).client
+
+    def list_collections(self, client_name: str, include_shadow: bool = False) -> list:
+        """
+        Lista os nomes das coleções do desaparecido. A lista fica em memória e é
+        atualizada quando coleções são criadas ou removidas pelo registro.
+        Args:
+            client_name (str): Nome do desaparecido.
+            include_shadow (bool): Se True, inclui as coleções temporárias do
+                reprocessamento de embeddings (REEMBED_SHADOW_PREFIX).
+        Returns:
+            list: Nomes das coleções.
+        """
+        store = self._store(client_name)
+        with store.lock:
+            if store.collection_names is None:
+                store.collection_names = list(store.client.list_collections())
+            return [name for name in store.collection_names
+                    if include_shadow or not name.startswith(REEMBED_SHADOW_PREFIX)]
+
+    def get_collection(self, client_name: str, collection_name: str, create: bool = False, metadata: dict = None):
+        """
+        Args:
+            client_name (str): Nome do desaparecido.
+            collection_name (str): Nome da coleção.
+            create (bool): Se True, cria a coleção quando ela não existir.
+            metadata (dict, opcional): Metadados da coleção, usados apenas na criação.
+        Returns:
+            Handle da coleção, reaproveitado entre chamadas.
+        """
+        store = self._store(client_name)
+        with store.lock:
+            collection = store.collections.get(collection_name)
+            if collection is None:
+                if create:
+                    collection = store.client.get_or_create_collection(collection_name, metadata=metadata)
+                else:
+                    collection = store.client.get_collection(collection_name)
+                store.collections[collection_name] = collection
+                if store.collection_names is not None and collection_name not in store.collection_names:
+                    store.collection_names.append(collection_name)
+            return collection
+
+    def delete_collection(self, client_name: str, collection_name: str):
+        """
+        Remove a coleção do repositório e descarta o handle guardado.
+        """
+        store = self._store(client_name)
+        with store.lock:
+            store.client.delete_collection(collection_name)
+            store.collections.pop(collection_name, None)
+            if store.collection_names is not None and collection_name in store.collection_names:
+                store.collection_names.remove(collection_name)
+
+    def invalidate(self, client_name: str):
+        """
+        Descarta os handles e a lista de coleções guardados para o desaparecido
+        (ex.: após alterações feitas por outro processo).
+        """
+        store = self._store(client_name)
+        with store.lock:
+            store.collections.clear()
+            store.collection_names = None
+
+    def close(self, client_name: str = None):
+        """
+        Fecha o repositório de um desaparecido ou, se client_name for None, todos.
+        Repositórios em uso em blocos pinned() são liberados quando o último termina.
+        """
+        released = []
+        with self._lock:
+            if client_name is None:
+                stores = list(self._stores.values())
+                self._stores.clear()
+            else:
+                store = self._stores.pop(self.client_path(client_name), None)
+                stores = [store] if store is not None else []
+            for store in stores:
+                released.extend(self._evict(store))
+        for store in released:
+            self._release(store)
+
+    def open_count(self) -> int:
+        """
+        Returns:
+            int: Quantidade de repositórios abertos.
+        """
+        with self._lock:
+            return len(self._stores)
+
+
+# Registro compartilhado pelo processo
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ChromaRegistry:
+    """
+    Returns:
+        ChromaRegistry: Registro compartilhado pelo processo, criado no primeiro uso.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ChromaRegistry()
+        return _registry
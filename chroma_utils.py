@@ -9,148 +9,305 @@ import chromadb
 import logging
 import re
 import hashlib
-from keybert import KeyBERT
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from query_cache import get_query_embedding, extract_query_keywords, query_keyword_cache, normalize_query
+from embedding_utils import extract_keywords
+from bm25_index import reciprocal_rank_fusion
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
 
-# Inicialização do modelo KeyBERT para extração de palavras-chave
-kw_model = KeyBERT('neuralmind/bert-base-portuguese-cased')
+# Extração das palavras-chave da consulta: "leve" (stopwords, sem modelo) ou "keybert"
+# (o mesmo KeyBERT da ingestão, sobre o modelo de embedding compartilhado)
+QUERY_KEYWORD_EXTRACTOR = "leve"
 
+# Pesquisa em várias coleções: threads do pool e prazo (segundos) de cada coleção
+SEARCH_MAX_WORKERS = 8
+SEARCH_COLLECTION_TIMEOUT = 5.0
+_search_executor = None
+_search_executor_lock = threading.Lock()
+# Coleções cuja consulta excedeu o prazo e ainda não terminou: não são consultadas de
+# novo até terminar, para que uma coleção travada não ocupe várias threads
+_late_collections = set()
+_late_collections_lock = threading.Lock()
 
-def get_snippet_chroma(collection, query, model, window=800):
+# Quantidade de candidatos buscados de cada lado (vetorial e BM25) para a fusão em retrieve_context
+RETRIEVE_CANDIDATES = 20
+
+
+def get_query_keywords(query: str, top_n: int = 3) -> list:
+    """
+    Extrai as palavras-chave da consulta com o extrator configurado em
+    QUERY_KEYWORD_EXTRACTOR. Em ambos os casos o resultado fica no cache de consultas.
+
+    Args:
+        query (str): Consulta do usuário.
+        top_n (int): Quantidade de palavras-chave.
+
+    Returns:
+        list: Palavras-chave em minúsculas.
     """
-    Recupera snippets relevantes do ChromaDB com base na consulta.
+    if QUERY_KEYWORD_EXTRACTOR == "keybert":
+        return query_keyword_cache.get_or_compute(
+            ("keybert", normalize_query(query), top_n),
+            lambda: [kw[0].lower() for kw in extract_keywords([query], top_n=top_n)[0]])
+    return extract_query_keywords(query, top_n=top_n)
+
+
+def retrieve_context(collection, query, model, where=None, n_candidates=RETRIEVE_CANDIDATES,
+                     top_k=3, window=800, max_chars=2000, lexical_index=None, person=None):
+    """
+    Recupera o contexto de uma consulta em uma única passada: a consulta é codificada
+    uma vez e um conjunto maior de candidatos é buscado com uma única consulta ANN.
+    Com lexical_index, os candidatos do índice BM25 da coleção (termos exatos como
+    nomes, documentos e telefones, independentemente do top-k vetorial) entram na
+    disputa; os rankings vetorial, BM25 e de palavras-chave (metadado palavras_chave)
+    são combinados por Reciprocal Rank Fusion, como em vector_store.search_all.
 
     Args:
         collection: Objeto de coleção do ChromaDB.
         query (str): Consulta do usuário.
         model: Modelo de embedding usado para codificar a consulta.
-        window (int): Tamanho da janela de contexto ao redor da correspondência.
+        where (dict, opcional): Filtro de metadados (ex.: arquivo em uma coleção consolidada),
+            aplicado também aos candidatos do BM25.
+        n_candidates (int): Quantidade de candidatos buscados de cada lado.
+        top_k (int): Quantidade de chunks usados no contexto.
+        window (int): Tamanho da janela ao redor da ocorrência literal da consulta.
+        max_chars (int): Tamanho máximo do contexto.
+        lexical_index (BM25Index, opcional): Índice léxico do repositório da coleção
+            (vector_store.lexical_index_for).
+        person (str, opcional): Desaparecido dono dos chunks no índice léxico.
 
     Returns:
-        dict: Dicionário contendo o texto do snippet e os arquivos relacionados.
+        dict: "text" (contexto), "files" (arquivos dos chunks usados) e "chunks"
+        (candidatos na ordem da fusão, com text, metadata, distance e score); em caso
+        de falha, contexto vazio e "error" com a mensagem.
     """
     try:
-        # Obtém o número total de documentos na coleção
         total_docs = collection.count()
-        # Define o número de resultados a serem retornados (máximo 10)
-        n_results = min(10, total_docs) if total_docs > 0 else 1
-
-        # Codifica a consulta usando o modelo de embedding
-        query_embedding = model.encode(query).tolist()
+        if total_docs == 0:
+            return {"text": "", "files": [], "chunks": []}
 
-        # Realiza a consulta no ChromaDB
+        query_embedding = get_query_embedding(query, model)
         results = collection.query(
             query_embeddings=[query_embedding],
-            n_results=n_results,
+            n_results=min(n_candidates, total_docs),
+            where=where,
             include=['documents', 'metadatas', 'distances']
         )
-
-        # Extrai palavras-chave da consulta usando o modelo KeyBERT
-        query_keywords = kw_model.extract_keywords(
-            query, keyphrase_ngram_range=(1, 2), top_n=3)
-        query_keywords = [kw[0].lower() for kw in query_keywords]
-
-        best_chunks = []
-        for doc, meta, distance in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
-            # Extrai palavras-chave do documento
-            doc_keywords = [kw.strip().lower()
-                            for kw in meta.get('palavras_chave', '').split(',')]
-            # Calcula a correspondência de palavras-chave
-            keyword_match = len(set(query_keywords) & set(doc_keywords))
-            # Calcula a pontuação combinando distância e correspondência de palavras-chave
-            score = (1 - distance) * 0.6 + keyword_match * 0.4
-
-            # Adiciona o chunk à lista se a pontuação for alta ou se a consulta estiver no texto
-            if score > 0.3 or query.lower() in doc.lower():
-                best_chunks.append({
-                    "text": doc,
-                    "score": score,
-                    "position": meta.get('chunk_position', 0),
-                    "file_path": meta.get('file_path', '')
-                })
-
-        if not best_chunks:
-            logger.warning(
-                f"[get_snippet_chroma] Nenhum snippet encontrado para consulta '{query}'.")
-            return {"text": "", "files": []}
-
-        # Ordena os chunks por pontuação e posição
-        best_chunks.sort(key=lambda x: (-x['score'], x['position']))
-
-        combined_text = []
-        current_end = -1
-        for chunk in best_chunks[:3]:
-            start_pos = chunk['text'].lower().find(query.lower())
+        query_lower = query.lower()
+
+        candidates = {}
+        vector_ranking = []
+        for chunk_id, doc, meta, distance in zip(results['ids'][0], results['documents'][0],
+                                                 results['metadatas'][0], results['distances'][0]):
+            candidates[chunk_id] = {"text": doc, "metadata": meta or {}, "distance": distance}
+            vector_ranking.append(chunk_id)
+
+        lexical_ranking = []
+        if lexical_index is not None:
+            lexical_ids = [chunk_id for chunk_id, _, _ in lexical_index.search(
+                query, top_n=n_candidates, collections=[collection.name], person=person)]
+            missing = [chunk_id for chunk_id in lexical_ids if chunk_id not in candidates]
+            if missing:
+                # O filtro where vale também para os candidatos encontrados só pelo BM25
+                found = collection.get(ids=missing, where=where, include=['documents', 'metadatas'])
+                for chunk_id, doc, meta in zip(found['ids'], found['documents'], found['metadatas']):
+                    candidates[chunk_id] = {"text": doc, "metadata": meta or {}, "distance": None}
+            lexical_ranking = [chunk_id for chunk_id in lexical_ids if chunk_id in candidates]
+
+        # Ranking pelas palavras-chave gravadas na ingestão (só candidatos com alguma em comum)
+        query_keywords = set(get_query_keywords(query, top_n=3))
+        overlap = {chunk_id: len(query_keywords & {kw.strip().lower() for kw in
+                                                   chunk['metadata'].get('palavras_chave', '').split(',')})
+                   for chunk_id, chunk in candidates.items()}
+        keyword_ranking = sorted((chunk_id for chunk_id in vector_ranking + lexical_ranking if overlap[chunk_id]),
+                                 key=lambda chunk_id: -overlap[chunk_id])
+
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking, keyword_ranking])
+        chunks = []
+        for chunk_id in sorted(fused, key=lambda chunk_id: -fused[chunk_id]):
+            chunk = candidates[chunk_id]
+            chunks.append(dict(chunk, id=chunk_id, score=fused[chunk_id],
+                               exact=query_lower in chunk['text'].lower()))
+        selected = chunks[:top_k]
+
+        parts = []
+        for chunk in selected:
+            text = chunk['text']
+            start_pos = text.lower().find(query_lower)
             if start_pos != -1:
-                start = max(0, start_pos - window//2)
-                end = min(len(chunk['text']), start_pos + window//2)
-                if start > current_end:
-                    combined_text.append(chunk['text'][start:end])
-                    current_end = end
+                # Janela ao redor da ocorrência literal da consulta
+                text = text[max(0, start_pos - window // 2):start_pos + window // 2]
+            if len(text.strip()) > 50 or chunk['exact']:
+                parts.append(text)
+        if not parts:
+            parts = [chunk['text'] for chunk in selected]
 
         return {
-            "text": "\n\n[...]\n\n".join(combined_text) if combined_text else "",
-            "files": list(set([chunk['file_path'] for chunk in best_chunks if chunk['file_path']]))
+            "text": "\n\n[...]\n\n".join(parts)[:max_chars],
+            "files": list({chunk['metadata'].get('file_path', '') for chunk in selected} - {''}),
+            "chunks": chunks,
         }
 
     except Exception as e:
         logger.error(
-            f"[get_snippet_chroma] Erro ao recuperar snippet para consulta '{query}': {str(e)}", exc_info=True)
-        return {"text": "", "files": []}
+            f"[retrieve_context] Erro ao recuperar contexto para consulta '{query}': {str(e)}", exc_info=True)
+        return {"text": "", "files": [], "chunks": [], "error": str(e)}
 
 
-def refine_snippet_chroma(collection, snippet, model):
+def _submit_search(fn, *args) -> tuple:
     """
-    Refina o snippet obtido do ChromaDB.
-
-    Args:
-        collection: Objeto de coleção do ChromaDB.
-        snippet (str): Texto do snippet inicial.
-        model: Modelo de embedding usado para codificar o snippet.
-
+    Envia uma consulta ao pool de threads compartilhado pelas pesquisas em várias
+    coleções, criado no primeiro uso. A obtenção do pool e o envio acontecem sob a
+    mesma trava de _retire_search_executor, para que nenhuma consulta seja enviada a
+    um pool já encerrado.
     Returns:
-        dict: Dicionário contendo o texto refinado e os arquivos relacionados.
+        tuple: (pool usado, future da consulta).
     """
-    try:
-        if not snippet.strip():
-            logger.warning(
-                "[refine_snippet_chroma] Snippet vazio recebido para refinamento.")
-            return {"text": "", "files": []}
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS,
+                                                  thread_name_prefix="chroma-search")
+        return _search_executor, _search_executor.submit(fn, *args)
 
-        # Obtém o número total de documentos na coleção
-        total_docs = collection.count()
-        # Define o número de resultados a serem retornados (máximo 3)
-        n_results = min(3, total_docs) if total_docs > 0 else 1
 
-        # Codifica o snippet usando o modelo de embedding
-        snippet_embedding = model.encode(snippet).tolist()
+def _retire_search_executor(executor: ThreadPoolExecutor):
+    """
+    Substitui o pool compartilhado depois que uma consulta excedeu o prazo. Uma consulta
+    ao ChromaDB não pode ser interrompida, então a thread presa sai do pool: as próximas
+    pesquisas usam threads novas e as do pool antigo terminam sozinhas com as consultas.
+    """
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is executor:
+            _search_executor = None
+        # As consultas já enviadas ao pool antigo (inclusive de outras pesquisas) continuam
+        executor.shutdown(wait=False)
+
 
-        # Realiza a consulta no ChromaDB
-        results = collection.query(
-            query_embeddings=[snippet_embedding],
-            n_results=n_results,
-            include=['documents', 'metadatas'],
-            where={"document_type": {"$ne": "image"}}
-        )
+def _discard_late(key: tuple):
+    # Chamado quando a consulta presa de uma coleção finalmente termina
+    with _late_collections_lock:
+        _late_collections.discard(key)
 
-        # Combina os documentos retornados em um texto refinado
-        refined_texts = [doc for doc in results['documents']
-                         [0] if len(doc.strip()) > 50]
-        refined_text = "\n\n".join(refined_texts)[
-            :2000] if refined_texts else snippet[:2000]
 
-        # Extrai os caminhos dos arquivos dos metadados
-        files = list(set([meta.get('file_path', '')
-                     for meta in results['metadatas'][0]]))
+def _query_collection(registry, client_name: str, col_name: str, query_embedding, n_results: int) -> list:
+    """
+    Consulta uma coleção e devolve os resultados no formato de query_all_collections.
+    """
+    collection = registry.get_collection(client_name, col_name)
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        include=['documents', 'metadatas', 'distances']
+    )
+    return [{"collection": col_name, "id": chunk_id, "document": doc, "metadata": meta or {}, "distance": distance}
+            for chunk_id, doc, meta, distance in zip(results['ids'][0], results['documents'][0],
+                                                     results['metadatas'][0], results['distances'][0])]
+
+
+def query_all_collections(client_name: str, query_embedding, n_results: int = 3, registry=None,
+                          collection_names: list = None, timeout: float = SEARCH_COLLECTION_TIMEOUT) -> list:
+    """
+    Consulta todas as coleções de um desaparecido com um embedding já calculado e
+    combina os resultados em uma única lista ordenada por distância (top-k global).
+
+    As coleções são consultadas em paralelo em um pool de threads compartilhado. Cada
+    coleção tem o seu prazo (timeout), contado a partir do início da sua consulta;
+    coleções que não respondem dentro do prazo, ou que falham, são registradas no log
+    e ignoradas, sem atrasar o restante da pesquisa. Uma coleção que excede o prazo
+    tira a sua thread do pool (ver _retire_search_executor) e fica fora das pesquisas
+    seguintes até a consulta presa terminar. Com mais coleções que threads, as que
+    nem começaram dentro do prazo total (timeout vezes a quantidade de ondas) também
+    são ignoradas.
 
-        return {"text": refined_text, "files": files}
+    Args:
+        client_name (str): Nome do desaparecido.
+        query_embedding (list): Embedding da consulta (calculado uma única vez pelo chamador).
+        n_results (int): Quantidade de resultados por coleção e no total.
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos
+            (padrão: o registro compartilhado do processo).
+        collection_names (list, opcional): Coleções a consultar (padrão: todas).
+        timeout (float): Prazo, em segundos, da consulta de cada coleção.
 
-    except Exception as e:
-        logger.error(
-            f"[refine_snippet_chroma] Erro ao refinar snippet: {str(e)}", exc_info=True)
-        return {"text": snippet, "files": []}
+    Returns:
+        list: Dicionários com collection, id, document, metadata e distance.
+    """
+    if registry is None:
+        from chroma_registry import get_registry
+        registry = get_registry()
+    if collection_names is None:
+        collection_names = registry.list_collections(client_name)
+    if not collection_names:
+        return []
+    if hasattr(query_embedding, 'tolist'):
+        query_embedding = query_embedding.tolist()
+
+    with _late_collections_lock:
+        late = [col_name for col_name in collection_names if (client_name, col_name) in _late_collections]
+    if late:
+        logger.warning(f"[query_all_collections] Coleções ainda presas em uma consulta anterior, ignoradas: {late}")
+        collection_names = [col_name for col_name in collection_names if col_name not in late]
+
+    started = {}
+
+    def run(col_name):
+        # Marca o início da consulta: o prazo da coleção conta a partir daqui
+        started[col_name] = time.monotonic()
+        return _query_collection(registry, client_name, col_name, query_embedding, n_results)
+
+    executors = set()
+    futures = {}
+    for col_name in collection_names:
+        executor, future = _submit_search(run, col_name)
+        executors.add(executor)
+        futures[future] = col_name
+    # Com mais coleções que threads, as consultas rodam em ondas; o prazo total acompanha
+    waves = -(-len(futures) // SEARCH_MAX_WORKERS)
+    overall_deadline = time.monotonic() + timeout * waves
+
+    hits = []
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        deadlines = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+        next_deadline = min(deadlines + [overall_deadline])
+        done, pending = wait(pending, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                hits.extend(future.result())
+            except Exception as e:
+                logger.error(f"[query_all_collections] Erro ao pesquisar na coleção {futures[future]}: {str(e)}")
+
+        now = time.monotonic()
+        expired = {future for future in pending
+                   if futures[future] in started and now - started[futures[future]] >= timeout}
+        if now >= overall_deadline:
+            # Prazo total esgotado: as que não começaram são canceladas, as em curso expiram
+            for future in pending - expired:
+                if future.cancel():
+                    logger.warning(f"[query_all_collections] Coleção {futures[future]} não começou dentro do "
+                                   f"prazo total; ignorada.")
+                else:
+                    expired.add(future)
+            pending = set()
+        for future in expired:
+            col_name = futures[future]
+            logger.warning(f"[query_all_collections] Coleção {col_name} excedeu o prazo de {timeout}s; ignorada.")
+            with _late_collections_lock:
+                _late_collections.add((client_name, col_name))
+            future.add_done_callback(lambda _, key=(client_name, col_name): _discard_late(key))
+        if expired:
+            for executor in executors:
+                _retire_search_executor(executor)
+            pending -= expired
+
+    hits.sort(key=lambda hit: hit['distance'])
+    return hits[:n_results]
 
 
 def sanitize_collection_name(name: str) -> str:
@@ -0,0 +1,136 @@
+# chunking.py - Divisão dos documentos em chunks por quantidade de tokens
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import hashlib
+import logging
+import re
+from collections import deque
+from typing import Callable, Iterable, Iterator, List
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de cada chunk e sobreposição entre chunks consecutivos, em tokens
+# do modelo de embedding ('all-MiniLM-L6-v2' trunca a entrada em 256 tokens)
+CHUNK_MAX_TOKENS = 250
+CHUNK_OVERLAP_TOKENS = 40
+
+# Fronteiras de unidade: fim de sentença seguido de espaço, ou quebra de linha
+UNIT_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+|\s*\n\s*')
+
+
+def word_token_counter(units: List[str]) -> List[int]:
+    """
+    Contador de tokens aproximado (palavras), usado quando não há tokenizador.
+    """
+    return [len(unit.split()) for unit in units]
+
+
+def iter_units(texts: Iterable[str], token_counter: Callable = word_token_counter) -> Iterator[tuple]:
+    """
+    Junta o fluxo de páginas/parágrafos de um documento em uma sequência única de
+    unidades (sentenças ou linhas) com a respectiva contagem de tokens.
+    As fronteiras entre páginas/parágrafos não interrompem o empacotamento: uma
+    sentença que continua na página seguinte vai para o mesmo chunk.
+
+    Args:
+        texts (Iterable[str]): Textos extraídos, na ordem do documento.
+        token_counter (Callable): Função que recebe uma lista de textos e devolve a
+            quantidade de tokens de cada um.
+
+    Returns:
+        Iterator[tuple]: Pares (unidade, tokens).
+    """
+    for text in texts:
+        units = [unit.strip() for unit in UNIT_BOUNDARY_RE.split(text)]
+        units = [unit for unit in units if unit]
+        if not units:
+            continue
+        # Uma chamada ao contador por texto mantém o custo linear no tamanho da entrada
+        yield from zip(units, token_counter(units))
+
+
+def _split_long_unit(unit: str, tokens: int, max_tokens: int) -> Iterator[tuple]:
+    """
+    Divide por palavras uma unidade maior que max_tokens (ex.: linha de tabela sem pontuação).
+    """
+    words = unit.split()
+    tokens_per_word = max(tokens / max(len(words), 1), 1e-6)
+    words_per_piece = max(1, int(max_tokens / tokens_per_word))
+    for start in range(0, len(words), words_per_piece):
+        piece = words[start:start + words_per_piece]
+        yield ' '.join(piece), min(max_tokens, int(len(piece) * tokens_per_word) + 1)
+
+
+def chunk_texts(texts: Iterable[str], max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                token_counter: Callable = word_token_counter) -> Iterator[str]:
+    """
+    Empacota o fluxo de textos de um documento em chunks de até max_tokens tokens,
+    respeitando fronteiras de sentença/linha e repetindo no início de cada chunk as
+    últimas unidades do anterior (até overlap_tokens tokens).
+
+    Cada unidade entra e sai da janela uma única vez, então o custo é linear no
+    tamanho do documento, mesmo para entradas de vários megabytes.
+
+    Args:
+        texts (Iterable[str]): Textos extraídos (páginas, parágrafos, blocos...).
+        max_tokens (int): Tamanho máximo de cada chunk, em tokens.
+        overlap_tokens (int): Sobreposição máxima entre chunks consecutivos, em tokens.
+        token_counter (Callable): Contador de tokens (lista de textos -> lista de inteiros).
+
+    Returns:
+        Iterator[str]: Chunks de texto, na ordem do documento.
+    """
+    window = deque()
+    window_tokens = 0
+    has_new_content = False
+
+    def units():
+        for unit, tokens in iter_units(texts, token_counter):
+            if tokens > max_tokens:
+                yield from _split_long_unit(unit, tokens, max_tokens)
+            else:
+                yield unit, tokens
+
+    for unit, tokens in units():
+        if window and window_tokens + tokens > max_tokens:
+            yield ' '.join(u for u, _ in window)
+            has_new_content = False
+            # Mantém no início do próximo chunk apenas a cauda que cabe na sobreposição
+            while window and (window_tokens > overlap_tokens or window_tokens + tokens > max_tokens):
+                _, removed = window.popleft()
+                window_tokens -= removed
+        window.append((unit, tokens))
+        window_tokens += tokens
+        has_new_content = True
+
+    # Último chunk, desde que não seja só a sobreposição do anterior
+    if window and has_new_content:
+        yield ' '.join(u for u, _ in window)
+
+
+def make_chunk_key(chunk: str, occurrence: int = 0) -> str:
+    """
+    Gera a chave estável de um chunk a partir do seu conteúdo.
+
+    Args:
+        chunk (str): Texto do chunk.
+        occurrence (int): Quantas vezes o mesmo texto já apareceu antes no documento.
+
+    Returns:
+        str: Hash do conteúdo (com sufixo para repetições).
+    """
+    digest = hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:32]
+    return f"{digest}-{occurrence}" if occurrence else digest
+
+
+def chunk_id(id_prefix: str, key: str) -> str:
+    """
+    Monta o id do chunk no ChromaDB: identificador do documento + chave do conteúdo.
+    """
+    return f"{id_prefix}:{key}"
@@ -0,0 +1,411 @@
+# cli.py - Ingestão em massa e consultas pela linha de comando, sem interface gráfica
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import argparse
+import logging
+import os
+import sys
+import time
+import numpy as np
+from config import (BASE_CHROMA_PERSIST_DIR, LAYOUTS, LAYOUT_PER_PERSON, EMBEDDING_MODEL_NAME,
+                    REEMBED_MAX_CHUNKS_PER_SECOND)
+from bulk_ingest import ingest_folder, format_report, FILE_FAILED
+from ingest_cache import IngestCache, INGEST_CACHE_FILENAME
+
+# Configuração do logging no mesmo arquivo usado pela interface gráfica
+logging.basicConfig(
+    filename='log.txt',
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - %(message)s',
+    filemode='a'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def cmd_ingerir(args) -> int:
+    """
+    Ingere uma pasta no repositório de um desaparecido e mostra a vazão obtida.
+    """
+    if not os.path.isdir(args.pasta):
+        print(f"Pasta não encontrada: {args.pasta}", file=sys.stderr)
+        return 1
+    cache = None if args.sem_cache else IngestCache(os.path.join(BASE_CHROMA_PERSIST_DIR, INGEST_CACHE_FILENAME))
+
+    def progress(stage, done=None, total=None):
+        if stage == "arquivos" and total:
+            print(f"\r{done}/{total} arquivos", end="", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    report = ingest_folder(args.pasta, args.desaparecido, copy_to_uploads=not args.sem_copia,
+                           max_workers=args.workers, progress_callback=progress, cache=cache,
+                           layout=args.layout)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(file=sys.stderr)
+
+    print(format_report(report))
+    chunks = sum(entry["chunks"] for entry in report)
+    print(f"Tempo: {elapsed:.1f}s | {len(report) / elapsed:.2f} arquivos/s | {chunks / elapsed:.1f} chunks/s")
+    return 0 if all(entry["status"] != FILE_FAILED for entry in report) else 2
+
+
+def cmd_consultar(args) -> int:
+    """
+    Executa as consultas de um arquivo (uma por linha) e mostra as latências p50/p95.
+    """
+    from embedding_utils import encode_text
+    from vector_store import search_all
+
+    client_path = os.path.join(BASE_CHROMA_PERSIST_DIR, args.desaparecido)
+    if not os.path.isdir(client_path):
+        print(f"Desaparecido não encontrado: {args.desaparecido}", file=sys.stderr)
+        return 1
+    with open(args.consultas, encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        embedding = encode_text(query)
+        # encode_text devolve uma lista vazia quando o modelo falha
+        if len(embedding) == 0:
+            print(f"Falha ao gerar o embedding da consulta: {query}", file=sys.stderr)
+            return 1
+        hits = search_all(args.desaparecido, embedding, n_results=args.k, query_text=query,
+                          lexical=not args.sem_bm25)
+        latencies.append(time.perf_counter() - started)
+        print(f"\n> {query}")
+        for hit in hits:
+            snippet = hit['document'][:args.trecho].replace("\n", " ")
+            print(f"  [{hit['distance']:.3f}] {hit['collection']}: {snippet}")
+
+    if latencies:
+        latencies_ms = np.array(latencies) * 1000
+        print(f"\n{len(queries)} consultas | {len(queries) / sum(latencies):.2f} consultas/s | "
+              f"p50 {np.percentile(latencies_ms, 50):.1f} ms | p95 {np.percentile(latencies_ms, 95):.1f} ms")
+    return 0
+
+
+def cmd_migrar(args) -> int:
+    """
+    Move as coleções por arquivo de um ou mais desaparecidos para a coleção consolidada.
+    """
+    from vector_store import migrate_person
+
+    status = 0
+    for client_name in args.desaparecidos:
+        if not os.path.isdir(os.path.join(BASE_CHROMA_PERSIST_DIR, client_name)):
+            print(f"Desaparecido não encontrado: {client_name}", file=sys.stderr)
+            status = 1
+            continue
+        started = time.perf_counter()
+        report = migrate_person(client_name, layout=args.layout, delete_source=args.remover_origem)
+        chunks = sum(entry["chunks"] for entry in report)
+        print(f"{client_name}: {len(report)} coleções, {chunks} chunks migrados "
+              f"({time.perf_counter() - started:.1f}s)")
+    return status
+
+
+def cmd_indexar(args) -> int:
+    """
+    Reconstrói o índice léxico BM25 de um ou mais desaparecidos a partir das coleções.
+    """
+    from vector_store import rebuild_lexical_index
+
+    for client_name in args.desaparecidos:
+        started = time.perf_counter()
+        indexed = rebuild_lexical_index(client_name)
+        print(f"{client_name}: {indexed} chunks indexados ({time.perf_counter() - started:.1f}s)")
+    return 0
+
+
+def cmd_casos(args) -> int:
+    """
+    Mostra os desaparecidos cujos documentos mais se parecem com um arquivo ou texto.
+    """
+    from case_index import find_cases_for_file, find_cases_for_text
+
+    if args.texto:
+        cases = find_cases_for_text(args.entrada, n_results=args.k, exclude_person=args.excluir)
+    elif os.path.isfile(args.entrada):
+        cases = find_cases_for_file(args.entrada, n_results=args.k, exclude_person=args.excluir)
+    else:
+        print(f"Arquivo não encontrado: {args.entrada}", file=sys.stderr)
+        return 1
+    if not cases:
+        print("Nenhum caso semelhante encontrado.")
+    for position, case in enumerate(cases, 1):
+        print(f"{position}. {case['person']} [{case['distance']:.3f}] {case['matches']} trechos")
+        for chunk in case['chunks']:
+            snippet = chunk['document'][:args.trecho].replace("\n", " ")
+            print(f"     [{chunk['distance']:.3f}] {chunk['source_file']}: {snippet}")
+    return 0
+
+
+def cmd_indexar_casos(args) -> int:
+    """
+    Reconstrói o índice global de casos a partir das coleções dos desaparecidos.
+    """
+    from case_index import rebuild_case_index
+
+    started = time.perf_counter()
+    total = rebuild_case_index(args.desaparecidos or None)
+    print(f"Índice de casos: {total} chunks ({time.perf_counter() - started:.1f}s)")
+    return 0
+
+
+def cmd_quantizar(args) -> int:
+    """
+    Mostra o tamanho dos vetores quantizados, o efeito real no repositório (disco e
+    memória residente) e a revocação perdida pela quantização das coleções de um desaparecido.
+    """
+    from chroma_registry import get_registry
+    from quantized_store import quantization_report, store_footprint
+
+    registry = get_registry()
+    if not os.path.isdir(registry.client_path(args.desaparecido)):
+        print(f"Desaparecido não encontrado: {args.desaparecido}", file=sys.stderr)
+        return 1
+    for col_name in registry.list_collections(args.desaparecido):
+        collection = registry.get_collection(args.desaparecido, col_name)
+        for entry in quantization_report(collection, kinds=args.tipo, sample=args.amostra, k=args.k):
+            footprint = store_footprint(collection, args.desaparecido, entry['kind'], registry)
+            rss = "n/d" if footprint['index_rss_mb'] is None else f"+{footprint['index_rss_mb']:.2f} MB"
+            print(f"{col_name} [{entry['kind']}] {entry['vectors']} vetores | "
+                  f"vetores {entry['float32_mb']:.2f} MB (float32) / {entry['quantized_mb']:.2f} MB ({entry['kind']}) | "
+                  f"repositório {footprint['store_disk_mb']:.2f} MB em disco, índice quantizado "
+                  f"+{footprint['index_disk_mb']:.2f} MB em disco e {rss} de RSS | "
+                  f"recall@{args.k} {entry['recall']:.3f} | com reavaliação {entry['recall_rescored']:.3f}")
+    return 0
+
+
+def cmd_triagem(args) -> int:
+    """
+    Pesquisa todas as dicas de uma planilha nos documentos de um desaparecido e grava a tabela ordenada.
+    """
+    from batch_query import screen_tips
+
+    if not os.path.isdir(os.path.join(BASE_CHROMA_PERSIST_DIR, args.desaparecido)):
+        print(f"Desaparecido não encontrado: {args.desaparecido}", file=sys.stderr)
+        return 1
+    if not os.path.isfile(args.dicas):
+        print(f"Arquivo de dicas não encontrado: {args.dicas}", file=sys.stderr)
+        return 1
+    summary = screen_tips(args.desaparecido, args.dicas, args.saida, n_results=args.k, column=args.coluna)
+    print(f"{summary['queries']} dicas | {summary['rows']} linhas em {args.saida} | "
+          f"{summary['seconds']:.2f}s | {summary['queries_per_second']:.1f} consultas/s")
+    return 0
+
+
+def cmd_exportar_onnx(args) -> int:
+    """
+    Exporta o modelo de embedding para ONNX (fp32 e int8) e mostra a concordância com o PyTorch.
+    """
+    from onnx_backend import export_onnx_model, model_dir, AGREEMENT_MIN_COSINE
+
+    config = export_onnx_model(args.modelo, quantize=not args.sem_int8)
+    print(f"Modelo exportado em {model_dir(args.modelo)}")
+    status = 0
+    for variant, agreement in config["agreement"].items():
+        ok = agreement["min_cosine"] >= AGREEMENT_MIN_COSINE
+        status = status if ok else 2
+        print(f"  {variant}: cosseno médio {agreement['mean_cosine']:.4f} | mínimo {agreement['min_cosine']:.4f} | "
+              f"vizinho mais próximo igual {agreement['top1_agreement']:.0%} {'OK' if ok else 'ABAIXO DO LIMITE'}")
+    return status
+
+
+def cmd_benchmark_embedding(args) -> int:
+    """
+    Compara vazão, latência e memória do modelo de embedding em PyTorch e ONNX Runtime (CPU).
+    """
+    from onnx_backend import benchmark_backends
+
+    texts = None
+    if args.textos:
+        with open(args.textos, encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    for entry in benchmark_backends(texts, batch_size=args.lote, model_name=args.modelo):
+        rss = "n/d" if entry["rss_mb"] is None else f"{entry['rss_mb']:.0f} MB"
+        agreement = "" if entry["agreement"] is None else f" | cosseno mín. {entry['agreement']['min_cosine']:.4f}"
+        print(f"{entry['backend']:<10} carga {entry['load_seconds']:.1f}s | RSS +{rss} | "
+              f"{entry['texts_per_second']:.1f} textos/s | p50 {entry['p50_ms']:.1f} ms | "
+              f"p95 {entry['p95_ms']:.1f} ms{agreement}")
+    return 0
+
+
+def cmd_servidor_embedding(args) -> int:
+    """
+    Executa o servidor de modelos em primeiro plano (Ctrl+C encerra).
+    """
+    from config import EMBEDDING_SERVER_ADDRESS
+    from embedding_server import EmbeddingServer
+
+    if not EMBEDDING_SERVER_ADDRESS:
+        print("Defina EMBEDDING_SERVER_ADDRESS em config.py.", file=sys.stderr)
+        return 1
+    server = EmbeddingServer(max_batch_texts=args.lote, max_batch_delay=args.espera_ms / 1000)
+    print(f"Servidor de embedding em {EMBEDDING_SERVER_ADDRESS} (Ctrl+C encerra)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        print(server.stats())
+    return 0
+
+
+def cmd_status_embedding(args) -> int:
+    """
+    Mostra as estatísticas do servidor de modelos (fila e tamanho dos micro-lotes).
+    """
+    from config import EMBEDDING_SERVER_ADDRESS
+    from embedding_server import RemoteEncoder
+
+    if not EMBEDDING_SERVER_ADDRESS:
+        print("Defina EMBEDDING_SERVER_ADDRESS em config.py.", file=sys.stderr)
+        return 1
+    stats = RemoteEncoder(EMBEDDING_SERVER_ADDRESS).stats()
+    print(f"Conexões: {stats['connections']} | fila: {stats['queue_depth']} (máx. {stats['max_queue_depth']})")
+    print(f"Pedidos: {stats['requests']} | textos: {stats['texts']} | lotes: {stats['batches']} "
+          f"(média {stats['mean_batch_size']:.1f} textos)")
+    print(f"Espera média na fila: {stats['mean_wait_ms']:.1f} ms | codificação média por lote: "
+          f"{stats['mean_encode_ms']:.1f} ms")
+    for size, count in stats["batch_sizes"].items():
+        print(f"  lote de {size:>4} textos: {count}")
+    return 0
+
+
+def cmd_reprocessar_embeddings(args) -> int:
+    """
+    Reprocessa os embeddings de todas as coleções com o modelo de config.py (retomável).
+    """
+    from embedding_migration import ReembeddingJob, needs_reembedding
+
+    job = ReembeddingJob(max_chunks_per_second=args.limite or None)
+    status = job.status()
+    if args.status:
+        print(f"Modelo em uso: {status['active']} | configurado: {status['target']}")
+        if needs_reembedding():
+            print(f"Progresso: {status['chunks_done']}/{status['chunks_total']} chunks | "
+                  f"{status['collections_done']}/{status['collections_total']} coleções")
+        return 0
+    print(f"Reprocessando de {status['active']} para {status['target']} (Ctrl+C interrompe; o progresso é mantido)")
+    try:
+        result = job.run(cut_over=not args.sem_troca)
+    except KeyboardInterrupt:
+        job.stop()
+        result = dict(job.status(), completed=False)
+    print(f"{result['chunks_done']}/{result['chunks_total']} chunks | "
+          f"{result['collections_done']}/{result['collections_total']} coleções | "
+          f"{'troca concluída' if result['completed'] else 'troca pendente'} | modelo em uso: {result['active']}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Busca de pessoas desaparecidas - linha de comando")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    ingerir = subparsers.add_parser("ingerir", help="Ingere uma pasta no repositório de um desaparecido")
+    ingerir.add_argument("desaparecido", help="Nome do desaparecido (pasta em BASE_CHROMA_PERSIST_DIR)")
+    ingerir.add_argument("pasta", help="Pasta com os documentos")
+    ingerir.add_argument("--workers", type=int, default=None, help="Processos de extração (padrão: núcleos - 1)")
+    ingerir.add_argument("--sem-copia", action="store_true", help="Não copia os arquivos para PDF_DIR")
+    ingerir.add_argument("--sem-cache", action="store_true", help="Não usa o cache de ingestão")
+    ingerir.add_argument("--layout", choices=LAYOUTS, default=None,
+                         help="Organização das coleções (padrão: STORAGE_LAYOUT em config.py)")
+    ingerir.set_defaults(func=cmd_ingerir)
+
+    consultar = subparsers.add_parser("consultar", help="Executa consultas de um arquivo (uma por linha)")
+    consultar.add_argument("desaparecido", help="Nome do desaparecido")
+    consultar.add_argument("consultas", help="Arquivo texto com uma consulta por linha")
+    consultar.add_argument("-k", type=int, default=3, help="Resultados por consulta")
+    consultar.add_argument("--trecho", type=int, default=120, help="Caracteres exibidos de cada resultado")
+    consultar.add_argument("--sem-bm25", action="store_true", help="Apenas busca vetorial (sem o índice léxico)")
+    consultar.set_defaults(func=cmd_consultar)
+
+    migrar = subparsers.add_parser("migrar", help="Move as coleções por arquivo para uma coleção consolidada")
+    migrar.add_argument("desaparecidos", nargs="+", help="Nomes dos desaparecidos")
+    migrar.add_argument("--layout", choices=LAYOUTS[1:], default=LAYOUT_PER_PERSON,
+                        help="Coleção de destino: uma por desaparecido ou a global")
+    migrar.add_argument("--remover-origem", action="store_true",
+                        help="Remove cada coleção por arquivo após a cópia")
+    migrar.set_defaults(func=cmd_migrar)
+
+    indexar = subparsers.add_parser("indexar", help="Reconstrói o índice léxico BM25 a partir das coleções")
+    indexar.add_argument("desaparecidos", nargs="+", help="Nomes dos desaparecidos (ou _global)")
+    indexar.set_defaults(func=cmd_indexar)
+
+    triagem = subparsers.add_parser("triagem", help="Pesquisa em lote uma planilha de dicas")
+    triagem.add_argument("desaparecido", help="Nome do desaparecido")
+    triagem.add_argument("dicas", help="Dicas (.txt com uma por linha, .csv ou .xlsx)")
+    triagem.add_argument("saida", help="Tabela de resultados (.csv ou .xlsx)")
+    triagem.add_argument("-k", type=int, default=3, help="Trechos por dica")
+    triagem.add_argument("--coluna", default=None, help="Coluna com o texto das dicas (padrão: detectada)")
+    triagem.set_defaults(func=cmd_triagem)
+
+    quantizar = subparsers.add_parser("quantizar", help="Relatório de memória e revocação da busca quantizada")
+    quantizar.add_argument("desaparecido", help="Nome do desaparecido (ou _global)")
+    quantizar.add_argument("--tipo", nargs="+", choices=("float16", "int8"), default=("float16", "int8"),
+                           help="Quantizações avaliadas")
+    quantizar.add_argument("--amostra", type=int, default=200, help="Chunks usados como consultas")
+    quantizar.add_argument("-k", type=int, default=10, help="Tamanho do top-k comparado")
+    quantizar.set_defaults(func=cmd_quantizar)
+
+    exportar_onnx = subparsers.add_parser("exportar-onnx", help="Exporta o modelo de embedding para ONNX Runtime")
+    exportar_onnx.add_argument("--modelo", default=EMBEDDING_MODEL_NAME, help="Modelo SentenceTransformer")
+    exportar_onnx.add_argument("--sem-int8", action="store_true", help="Não gera a versão quantizada em int8")
+    exportar_onnx.set_defaults(func=cmd_exportar_onnx)
+
+    benchmark = subparsers.add_parser("benchmark-embedding", help="Compara PyTorch e ONNX Runtime em CPU")
+    benchmark.add_argument("--modelo", default=EMBEDDING_MODEL_NAME, help="Modelo SentenceTransformer")
+    benchmark.add_argument("--textos", default=None, help="Arquivo com um texto por linha (padrão: frases de exemplo)")
+    benchmark.add_argument("--lote", type=int, default=64, help="Tamanho do lote na medição de vazão")
+    benchmark.set_defaults(func=cmd_benchmark_embedding)
+
+    servidor = subparsers.add_parser("servidor-embedding", help="Executa o servidor local de modelos")
+    servidor.add_argument("--lote", type=int, default=256, help="Máximo de textos por micro-lote")
+    servidor.add_argument("--espera-ms", type=float, default=10.0,
+                          help="Espera máxima (ms) para juntar pedidos em um micro-lote")
+    servidor.set_defaults(func=cmd_servidor_embedding)
+
+    status_embedding = subparsers.add_parser("status-embedding", help="Estatísticas do servidor de modelos")
+    status_embedding.set_defaults(func=cmd_status_embedding)
+
+    reprocessar = subparsers.add_parser("reprocessar-embeddings",
+                                        help="Reprocessa as coleções com o modelo de embedding de config.py")
+    reprocessar.add_argument("--limite", type=float, default=REEMBED_MAX_CHUNKS_PER_SECOND,
+                             help="Máximo de chunks por segundo (0: sem limite)")
+    reprocessar.add_argument("--sem-troca", action="store_true",
+                             help="Apenas sincroniza as coleções temporárias, sem trocar o modelo em uso")
+    reprocessar.add_argument("--status", action="store_true", help="Mostra o progresso e sai")
+    reprocessar.set_defaults(func=cmd_reprocessar_embeddings)
+
+    casos = subparsers.add_parser("casos", help="Busca os casos mais parecidos com um documento")
+    casos.add_argument("entrada", help="Arquivo (ex.: relato de avistamento) ou, com --texto, o próprio texto")
+    casos.add_argument("--texto", action="store_true", help="Trata a entrada como texto, não como arquivo")
+    casos.add_argument("-k", type=int, default=5, help="Quantidade de desaparecidos")
+    casos.add_argument("--excluir", default=None, help="Desaparecido a ignorar (ex.: o dono do documento)")
+    casos.add_argument("--trecho", type=int, default=120, help="Caracteres exibidos de cada trecho")
+    casos.set_defaults(func=cmd_casos)
+
+    indexar_casos = subparsers.add_parser("indexar-casos", help="Reconstrói o índice global de casos")
+    indexar_casos.add_argument("desaparecidos", nargs="*", help="Desaparecidos (padrão: todos)")
+    indexar_casos.set_defaults(func=cmd_indexar_casos)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.critical(f"[cli] Falha ao executar '{args.comando}': {str(e)}", exc_info=True)
+        print(f"Erro: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
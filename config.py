@@ -0,0 +1,67 @@
+# config.py - Configurações compartilhadas pela interface gráfica e pela linha de comando
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+
+# Modelo (SentenceTransformer) compartilhado pelos embeddings e pela extração de
+# palavras-chave da ingestão e das consultas. Ex.: 'all-MiniLM-L6-v2' (padrão) ou
+# 'paraphrase-multilingual-MiniLM-L12-v2' (multilíngue). Coleções gravadas com outro
+# modelo precisam ser reprocessadas.
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Versão do modelo acima: incremente ao trocar os pesos mantendo o nome. Cada coleção
+# registra o modelo e a versão com que foi gravada; ao mudar o nome ou a versão, as
+# coleções são reprocessadas em segundo plano (ver embedding_migration.py) e as
+# consultas continuam usando o modelo anterior até a troca.
+EMBEDDING_MODEL_VERSION = 1
+
+# Reprocessamento dos embeddings: limite de chunks por segundo (None: sem limite) e
+# prefixo das coleções temporárias (ocultas das consultas até a troca)
+REEMBED_MAX_CHUNKS_PER_SECOND = 200
+REEMBED_SHADOW_PREFIX = "reemb-"
+
+# Backend de inferência do modelo de embedding (ver onnx_backend.py): "pytorch"
+# (padrão), "onnx" (ONNX Runtime fp32) ou "onnx-int8" (pesos quantizados em int8, CPU)
+EMBEDDING_BACKEND = "pytorch"
+EMBEDDING_BACKENDS = ("pytorch", "onnx", "onnx-int8")
+
+# Servidor local de modelos (ver embedding_server.py). Com um endereço, embeddings,
+# contagem de tokens e palavras-chave são calculados no servidor em vez de carregar os
+# modelos em cada processo. Ex.: ("127.0.0.1", 50551) ou, em Linux, "/tmp/embedding.sock".
+# A chave de autenticação vem da variável de ambiente EMBEDDING_SERVER_KEY ou é gerada
+# na primeira execução em BASE_CHROMA_PERSIST_DIR (permissão 0600). Endereços TCP fora
+# do loopback só são aceitos com EMBEDDING_SERVER_ALLOW_REMOTE.
+EMBEDDING_SERVER_ADDRESS = None
+EMBEDDING_SERVER_ALLOW_REMOTE = False
+
+# Diretórios principais do projeto.
+BASE_CHROMA_PERSIST_DIR = "C:/colecoes"
+PDF_DIR = "C:/uploads"
+FOTOS_DIR = os.path.join(os.getcwd(), "C:/uploads/2025")
+
+# Organizações possíveis das coleções no ChromaDB (ver vector_store.py):
+#   - por arquivo: uma coleção por arquivo enviado (organização original);
+#   - por desaparecido: uma única coleção por desaparecido;
+#   - global: uma única coleção para todos os desaparecidos, em GLOBAL_STORE_NAME.
+LAYOUT_PER_FILE = "por_arquivo"
+LAYOUT_PER_PERSON = "por_desaparecido"
+LAYOUT_GLOBAL = "global"
+LAYOUTS = (LAYOUT_PER_FILE, LAYOUT_PER_PERSON, LAYOUT_GLOBAL)
+STORAGE_LAYOUT = LAYOUT_PER_FILE
+CONSOLIDATED_COLLECTION_NAME = "documentos"
+GLOBAL_STORE_NAME = "_global"
+
+# Busca vetorial compacta nas coleções consolidadas (ver quantized_store.py):
+# None (busca do ChromaDB, float32), "float16" ou "int8". Com QUANTIZED_RESCORE, os
+# melhores candidatos são reavaliados com os embeddings float32 originais.
+VECTOR_QUANTIZATION = None
+QUANTIZED_RESCORE = True
+
+# Índice global de casos: embeddings dos chunks de todos os desaparecidos em uma
+# única coleção, para comparar um documento novo com todos os casos (ver case_index.py)
+CASE_INDEX_STORE_NAME = "_casos"
+CASE_INDEX_COLLECTION_NAME = "casos"
@@ -8,86 +8,95 @@
 
 import os
 import logging
-from pdf_utils import process_pdf
-from excel_utils import process_excel
-from docx_utils import process_docx
-from text_utils import process_txt
-from image_utils import process_image
-from audio_utils import process_audio
-from embedding_utils import embedding_model
-from chroma_utils import sanitize_collection_name
-from keybert import KeyBERT
-from nltk.corpus import stopwords
+from extractors import process_document, get_document_type, EXTRACTOR_VERSION
+from embedding_utils import (get_embedding_model, get_embedding_model_for, uses_active_model,
+                             extract_keywords, EMBEDDING_BATCH_SIZE, count_tokens)
+from chunking import chunk_texts, make_chunk_key, chunk_id, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from ingest_cache import file_sha256
+from vector_store import document_id_prefix, document_where, document_key
 from datetime import datetime
-import re
-import nltk
-
-nltk.download('stopwords')
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
 
-# Inicialização do modelo KeyBERT para extração de palavras-chave
-kw_model = KeyBERT('distilbert-base-nli-mean-tokens')
+# Parâmetros da extração de palavras-chave. O KeyBERT usa a mesma instância do
+# modelo de embedding dos chunks (ver embedding_utils.extract_keywords), o que permite
+# reaproveitar os embeddings já calculados na ingestão
+KEYWORD_TOP_N = 5
+# Quantidade de chunks processados em cada chamada ao KeyBERT
+KEYWORD_BATCH_SIZE = 256
+
+# Quantidade máxima de chunks gravados em cada chamada ao collection.add
+CHROMA_WRITE_BATCH_SIZE = 256
+
+# Versão do chunking; deve ser incrementada sempre que a divisão em chunks mudar,
+# para invalidar os chunks guardados no cache de ingestão
+CHUNKING_VERSION = "3"
 
-def process_document(file_path: str) -> list:
+# Metadados que dependem do upload (e não do conteúdo) e por isso não vão para o cache
+UPLOAD_METADATA_KEYS = ("titulo", "autor", "data_publicacao", "file_path", "source_file", "document_type")
+
+def _build_metadata(keywords: list, doc_name: str, client_name: str, file_path: str) -> dict:
     """
-    Identifica a extensão do arquivo e delega para o módulo adequado.
+    Monta o dicionário de metadados a partir das palavras-chave extraídas.
     Args:
-        file_path (str): Caminho completo do arquivo a ser processado.
+        keywords (list): Lista de tuplas (palavra-chave, pontuação).
+        doc_name (str): Nome do documento.
+        client_name (str): Nome do cliente.
+        file_path (str): Caminho do arquivo.
     Returns:
-        list: Lista de textos extraídos do documento.
+        dict: Dicionário com os metadados gerados.
     """
-    # Obtém a extensão do arquivo
-    ext = os.path.splitext(file_path)[1].lower()
-
-    try:
-        # Delega o processamento para o módulo específico baseado na extensão
-        if ext == '.pdf':
-            return process_pdf(file_path)
-        elif ext in ['.xls', '.xlsx']:
-            return process_excel(file_path)
-        elif ext == '.docx':
-            return process_docx(file_path)
-        elif ext in ['.png', '.jpg', '.jpeg', '.gif']:
-            return process_image(file_path)
-        elif ext in ['.mp3', '.wav', '.ogg']:
-            return process_audio(file_path)
-        else:
-            # Para outros tipos de arquivo, assume-se que é texto
-            return process_txt(file_path)
-    except Exception as e:
-        # Registra o erro no log e propaga a exceção
-        logger.error(f"Erro ao processar documento {file_path}: {e}", exc_info=True)
-        raise
+    return {
+        "titulo": os.path.splitext(doc_name)[0],
+        "autor": client_name,
+        "data_publicacao": datetime.now().strftime("%Y-%m-%d"),
+        "colecoes": ', '.join([kw[0] for kw in keywords[:2]]) if keywords else "default",
+        "palavras_chave": ', '.join([kw[0] for kw in keywords]) if keywords else "default",
+        "file_path": file_path,
+        # Campos usados nos filtros (where) das coleções consolidadas
+        "source_file": document_key(client_name, file_path),
+        "document_type": get_document_type(doc_name)
+    }
 
-def split_into_chunks(text: str, max_chunk_size: int = 1000) -> list:
+def extract_keywords_batch(texts: list, embeddings=None) -> list:
     """
-    Divide o texto em chunks menores.
+    Extrai palavras-chave de vários textos em uma única passada do KeyBERT.
+    O vocabulário candidato é construído uma vez para o lote inteiro, de modo que
+    cada n-grama comum aos chunks é codificado uma única vez.
     Args:
-        text (str): Texto a ser dividido.
-        max_chunk_size (int): Tamanho máximo de cada chunk.
+        texts (list): Textos dos chunks.
+        embeddings (numpy.ndarray, opcional): Embeddings já calculados para os textos.
     Returns:
-        list: Lista de chunks de texto.
+        list: Para cada texto, a lista de tuplas (palavra-chave, pontuação).
     """
-    # Divide o texto em sentenças
-    sentences = re.split(r'(?<=[.!?]) +', text)
-    chunks, current_chunk, current_length = [], [], 0
+    return extract_keywords(texts, top_n=KEYWORD_TOP_N, embeddings=embeddings)
 
-    # Agrupa sentenças em chunks
-    for sentence in sentences:
-        sent_length = len(sentence)
-        if current_length + sent_length > max_chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            current_chunk, current_length = [], 0
-        current_chunk.append(sentence)
-        current_length += sent_length
-
-    # Adiciona o último chunk se houver
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-
-    return chunks
+def generate_metadata_batch(texts: list, doc_name: str, client_name: str, file_path: str,
+                            embeddings=None) -> list:
+    """
+    Gera metadados para vários chunks, extraindo as palavras-chave em lote.
+    Args:
+        texts (list): Textos dos chunks.
+        doc_name (str): Nome do documento.
+        client_name (str): Nome do cliente.
+        file_path (str): Caminho do arquivo.
+        embeddings (numpy.ndarray, opcional): Embeddings dos chunks gerados pelo modelo de embedding.
+    Returns:
+        list: Lista de dicionários de metadados, na mesma ordem dos textos.
+    """
+    metadatas = []
+    for start in range(0, len(texts), KEYWORD_BATCH_SIZE):
+        batch = texts[start:start + KEYWORD_BATCH_SIZE]
+        batch_embeddings = embeddings[start:start + KEYWORD_BATCH_SIZE] if embeddings is not None else None
+        try:
+            keywords = extract_keywords_batch(batch, batch_embeddings)
+        except Exception as e:
+            # Ex.: lote sem nenhum termo fora das stopwords; usa os metadados padrão
+            logger.error(f"Erro ao gerar metadados em lote: {e}", exc_info=True)
+            keywords = [[] for _ in batch]
+        metadatas.extend(_build_metadata(kws, doc_name, client_name, file_path) for kws in keywords)
+    return metadatas
 
 def generate_metadata(text: str, doc_name: str, client_name: str, file_path: str) -> dict:
     """
@@ -100,128 +109,395 @@ def generate_metadata(text: str, doc_name: str, client_name: str, file_path: str
     Returns:
         dict: Dicionário com os metadados gerados.
     """
-    try:
-        # Extrai palavras-chave do texto
-        keywords = kw_model.extract_keywords(
-            text,
-            keyphrase_ngram_range=(1, 2),
-            stop_words=stopwords.words('portuguese'),
-            top_n=5
-        )
+    return generate_metadata_batch([text], doc_name, client_name, file_path)[0]
 
-        # Gera o dicionário de metadados
-        return {
-            "titulo": os.path.splitext(doc_name)[0],
-            "autor": client_name,
-            "data_publicacao": datetime.now().strftime("%Y-%m-%d"),
-            "colecoes": ', '.join([kw[0] for kw in keywords[:2]]),
-            "palavras_chave": ', '.join([kw[0] for kw in keywords]),
-            "file_path": file_path
-        }
-    except Exception as e:
-        # Registra o erro no log e retorna um dicionário vazio
-        logger.error(f"Erro ao gerar metadados: {e}", exc_info=True)
-        return {
-            "titulo": os.path.splitext(doc_name)[0],
-            "autor": client_name,
-            "data_publicacao": datetime.now().strftime("%Y-%m-%d"),
-            "colecoes": "default",
-            "palavras_chave": "default",
-            "file_path": file_path
-        }
+def iter_chunk_records(textos, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """
+    Junta os textos extraídos de um documento e gera os chunks com suas chaves.
+    Os chunks são empacotados por quantidade de tokens do modelo de embedding,
+    atravessando as fronteiras entre páginas/parágrafos (ver chunking.chunk_texts).
+    Args:
+        textos (iterable): Textos extraídos do documento (páginas, parágrafos, blocos...).
+        max_tokens (int): Tamanho máximo de cada chunk, em tokens.
+        overlap_tokens (int): Sobreposição entre chunks consecutivos, em tokens.
+    Returns:
+        generator: Tuplas (chave, chunk) na ordem do documento. A chave deriva do
+        conteúdo do chunk (ver make_chunk_key), então não depende da sua posição.
+    """
+    # Não ultrapassa o comprimento máximo de entrada do modelo (descontando [CLS]/[SEP])
+    max_seq_length = getattr(get_embedding_model(), "max_seq_length", None)
+    if max_seq_length:
+        max_tokens = min(max_tokens, max_seq_length - 2)
+    chunks = chunk_texts(textos, max_tokens=max_tokens, overlap_tokens=overlap_tokens,
+                         token_counter=count_tokens)
+    occurrences = {}
+    for chunk in chunks:
+        key = make_chunk_key(chunk)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        yield make_chunk_key(chunk, occurrence), chunk
 
-# Função auxiliar para processar e adicionar documento ao ChromaDB
-def process_and_add_to_chroma(file_path: str, client_name: str, collection):
+def _stored_ids(collection, id_prefix: str, where: dict = None, page_size: int = CHROMA_WRITE_BATCH_SIZE * 4) -> set:
     """
-    Processa um documento e adiciona ao ChromaDB.
+    Lista os ids já gravados na coleção para o documento identificado por id_prefix.
+    A leitura é paginada e traz apenas os ids (sem documentos ou embeddings); em
+    coleções consolidadas, o filtro where limita a leitura aos chunks do documento.
+    """
+    prefix = f"{id_prefix}:"
+    stored, offset = set(), 0
+    while True:
+        page = collection.get(where=where, include=[], limit=page_size, offset=offset)['ids']
+        stored.update(chunk_id for chunk_id in page if chunk_id.startswith(prefix))
+        if len(page) < page_size:
+            return stored
+        offset += page_size
+
+def _delete_ids(collection, ids, write_batch_size: int = CHROMA_WRITE_BATCH_SIZE):
+    """
+    Remove da coleção, em lotes, os ids informados.
+    """
+    ids = sorted(ids)
+    for start in range(0, len(ids), write_batch_size):
+        collection.delete(ids=ids[start:start + write_batch_size])
+
+def _cacheable_metadata(metadata: dict) -> dict:
+    """
+    Remove dos metadados os campos que dependem do upload (título, autor, data e
+    caminho), mantendo apenas o que deriva do conteúdo e pode ir para o cache.
+    """
+    return {key: value for key, value in metadata.items() if key not in UPLOAD_METADATA_KEYS}
+
+def add_chunks_to_collection(collection, records, client_name: str, file_path: str,
+                             batch_size: int = EMBEDDING_BATCH_SIZE,
+                             write_batch_size: int = CHROMA_WRITE_BATCH_SIZE,
+                             progress_callback=None, total: int = None,
+                             id_prefix: str = "", cache_writer=None, where: dict = None,
+                             lexical_index=None) -> int:
+    """
+    Sincroniza os chunks de um documento com a coleção do ChromaDB.
+    Os ids derivam do conteúdo dos chunks (ver chunk_id), então na reingestão de um
+    documento editado só os chunks novos ou alterados são codificados e gravados
+    (com upsert, em lotes de write_batch_size codificados em passadas de batch_size),
+    e os chunks que deixaram de existir são removidos ao final.
     Args:
-        file_path (str): Caminho do arquivo a ser processado.
+        collection: Objeto de coleção do ChromaDB.
+        records (iterable): Tuplas (chave, chunk) do documento, na ordem original.
         client_name (str): Nome do cliente.
+        file_path (str): Caminho do arquivo de origem.
+        batch_size (int): Tamanho dos lotes enviados ao modelo de embedding.
+        write_batch_size (int): Quantidade máxima de chunks por chamada ao ChromaDB.
+        progress_callback (callable, opcional): Função (etapa, feitos, total) chamada após cada lote.
+        total (int, opcional): Quantidade esperada de chunks, usada no progresso.
+        id_prefix (str): Prefixo que identifica o documento nos ids (ver vector_store.document_id_prefix).
+        cache_writer (_ChunkWriter, opcional): Gravador do cache de ingestão
+            (IngestCache.chunk_writer); cada lote é gravado nele assim que sai do modelo.
+        where (dict, opcional): Filtro dos chunks do documento em coleções consolidadas.
+        lexical_index (BM25Index, opcional): Índice léxico atualizado junto com a coleção.
+    Returns:
+        int: Quantidade de chunks do documento presentes na coleção.
+    """
+    doc_name = os.path.basename(file_path)
+    stored = _stored_ids(collection, id_prefix, where)
+    seen = set()
+    written = 0
+    processed = 0
+    keys, chunks = [], []
+    # Início da etapa antes do primeiro lote, para que a estimativa de tempo o inclua
+    if progress_callback:
+        progress_callback("embeddings", 0, total)
+    # Os chunks são codificados com o modelo da coleção (o anterior, se ela ainda não
+    # foi trocada pelo reprocessamento), para nunca misturar vetores de modelos diferentes
+    model = get_embedding_model_for(collection)
+    same_model = uses_active_model(collection)
+
+    def flush():
+        ids = [chunk_id(id_prefix, key) for key in keys]
+        seen.update(ids)
+        selected = [i for i, cid in enumerate(ids) if cid not in stored]
+        embeddings_by_id, metadatas_by_id = {}, {}
+        if selected:
+            batch_chunks = [chunks[i] for i in selected]
+            # Codifica o lote inteiro, reaproveita os embeddings na extração de
+            # palavras-chave e grava tudo de uma vez
+            embeddings = model.encode(batch_chunks, batch_size=batch_size)
+            # O KeyBERT usa o modelo em uso: só reaproveita embeddings do mesmo modelo
+            metadatas = generate_metadata_batch(batch_chunks, doc_name, client_name, file_path,
+                                                embeddings=embeddings if same_model else None)
+            collection.upsert(
+                ids=[ids[i] for i in selected],
+                documents=batch_chunks,
+                metadatas=metadatas,
+                embeddings=embeddings.tolist()
+            )
+            for i, embedding, metadata in zip(selected, embeddings, metadatas):
+                embeddings_by_id[ids[i]] = embedding
+                metadatas_by_id[ids[i]] = metadata
+            if lexical_index is not None:
+                lexical_index.add([ids[i] for i in selected], batch_chunks, collection.name, client_name)
+            logger.debug(f"[add_chunks_to_collection] Lote de {len(selected)} chunks gravado em {collection.name}.")
+        if lexical_index is not None:
+            # Chunks gravados antes da existência do índice léxico entram nele agora
+            selected_ids = set(embeddings_by_id)
+            unindexed = set(lexical_index.missing([cid for cid in ids if cid not in selected_ids]))
+            if unindexed:
+                lexical_index.add([cid for cid in ids if cid in unindexed],
+                                  [chunk for cid, chunk in zip(ids, chunks) if cid in unindexed],
+                                  collection.name, client_name)
+        if cache_writer is not None:
+            # Chunks inalterados entram no cache com os vetores já gravados na coleção
+            unchanged = [cid for cid in ids if cid not in embeddings_by_id]
+            if unchanged:
+                previous = collection.get(ids=unchanged, include=['embeddings', 'metadatas'])
+                for cid, embedding, metadata in zip(previous['ids'], previous['embeddings'], previous['metadatas']):
+                    embeddings_by_id[cid] = embedding
+                    metadatas_by_id[cid] = metadata
+            cache_writer.add(keys, chunks, [_cacheable_metadata(metadatas_by_id[cid]) for cid in ids],
+                             [embeddings_by_id[cid] for cid in ids])
+        return len(selected)
+
+    for key, chunk in records:
+        keys.append(key)
+        chunks.append(chunk)
+        if len(chunks) >= write_batch_size:
+            written += flush()
+            processed += len(chunks)
+            keys, chunks = [], []
+            if progress_callback:
+                progress_callback("embeddings", processed, total)
+
+    # Grava o último lote parcial, se houver
+    if chunks:
+        written += flush()
+        processed += len(chunks)
+        if progress_callback:
+            progress_callback("embeddings", processed, total)
+
+    # Remove os chunks que não existem mais na nova versão do documento
+    stale = stored - seen
+    if stale and seen:
+        _delete_ids(collection, stale, write_batch_size)
+        if lexical_index is not None:
+            lexical_index.remove(stale)
+
+    logger.info(f"[add_chunks_to_collection] {doc_name}: {written} chunks novos, "
+                f"{len(seen) - written} inalterados, {len(stale) if seen else 0} removidos.")
+    return len(seen)
+
+def link_cached_chunks(entry: dict, collection, client_name: str, file_path: str,
+                       write_batch_size: int = CHROMA_WRITE_BATCH_SIZE, id_prefix: str = "",
+                       where: dict = None, lexical_index=None) -> int:
+    """
+    Grava na coleção os chunks e embeddings de um arquivo já presente no cache de
+    ingestão, sem extração nem modelo de embedding. Só os metadados do upload são refeitos.
+    Assim como em add_chunks_to_collection, chunks já presentes são mantidos e
+    chunks de uma versão anterior do documento são removidos.
+    Args:
+        entry (dict): Entrada retornada por IngestCache.get_chunks.
         collection: Objeto de coleção do ChromaDB.
+        client_name (str): Nome do cliente.
+        file_path (str): Caminho do arquivo de origem neste upload.
+        write_batch_size (int): Quantidade máxima de chunks por chamada ao ChromaDB.
+        id_prefix (str): Prefixo que identifica o documento nos ids.
+        where (dict, opcional): Filtro dos chunks do documento em coleções consolidadas.
+        lexical_index (BM25Index, opcional): Índice léxico atualizado junto com a coleção.
+    Returns:
+        int: Quantidade de chunks do documento presentes na coleção.
+    """
+    doc_name = os.path.basename(file_path)
+    stored = _stored_ids(collection, id_prefix, where)
+    ids = [chunk_id(id_prefix, key) for key in entry["keys"]]
+    selected = [i for i, cid in enumerate(ids) if cid not in stored]
+    for start in range(0, len(selected), write_batch_size):
+        batch = selected[start:start + write_batch_size]
+        metadatas = []
+        for i in batch:
+            metadata = _build_metadata([], doc_name, client_name, file_path)
+            metadata.update(entry["metadatas"][i])
+            metadatas.append(metadata)
+        collection.upsert(
+            ids=[ids[i] for i in batch],
+            documents=[entry["documents"][i] for i in batch],
+            metadatas=metadatas,
+            embeddings=entry["embeddings"][batch].tolist()
+        )
+    stale = stored - set(ids)
+    if stale and ids:
+        _delete_ids(collection, stale, write_batch_size)
+    if lexical_index is not None:
+        if stale and ids:
+            lexical_index.remove(stale)
+        unindexed = set(lexical_index.missing(ids))
+        lexical_index.add([cid for cid in ids if cid in unindexed],
+                          [doc for cid, doc in zip(ids, entry["documents"]) if cid in unindexed],
+                          collection.name, client_name)
+    return len(ids)
+
+def _checked(textos, cancel_check):
+    """
+    Repassa os textos de um iterável, verificando o cancelamento antes de cada um
+    (a extração de documentos longos roda enquanto os textos são consumidos).
     """
+    for texto in textos:
+        cancel_check()
+        yield texto
+
+def _stream_to_cache(textos, writer, block_size: int = 64):
+    """
+    Repassa os textos de um iterável, gravando-os no cache de ingestão em blocos de
+    block_size (sem guardar o documento inteiro). A entrada só é concluída quando a
+    extração termina; se ela for interrompida, os blocos gravados são descartados.
+    """
+    pending = []
+    completed = False
     try:
-        # Processa o documento
-        textos = process_document(file_path)
-        collection_name = sanitize_collection_name(os.path.basename(file_path))
-
-        # Processa cada texto extraído do documento
-        for idx, texto in enumerate(textos):
-            chunks = split_into_chunks(texto)
-            for chunk_idx, chunk in enumerate(chunks):
-                # Gera metadados para o chunk
-                metadata = generate_metadata(chunk, os.path.basename(file_path), client_name, file_path)
-                # Gera embedding para o chunk
-                embedding = embedding_model.encode(chunk).tolist()
-                # Adiciona o chunk à coleção do ChromaDB
-                collection.add(
-                    ids=[f"{collection_name}chunk{idx}{chunk_idx}"],
-                    documents=[chunk],
-                    metadatas=[metadata],
-                    embeddings=[embedding]
-                )
-
-        logger.info(f"Documento {file_path} processado e adicionado com sucesso.")
-    except Exception as e:
-        logger.error(f"Erro ao processar e adicionar documento {file_path}: {e}", exc_info=True)
-        raise
+        for texto in textos:
+            pending.append(texto)
+            if len(pending) >= block_size:
+                writer.add(pending)
+                pending = []
+            yield texto
+        if pending:
+            writer.add(pending)
+        completed = writer.position > 0
+        if completed:
+            writer.commit()
+    finally:
+        if not completed:
+            writer.discard()
 
-def process_document(file_path: str) -> list:
+def _pipeline_version() -> str:
+    """
+    Versão combinada de extração e chunking, usada na chave do cache de chunks.
+    """
+    return f"{EXTRACTOR_VERSION}-{CHUNKING_VERSION}"
+
+def _cache_model_key(collection) -> str:
+    """
+    Chave do modelo no cache de ingestão: modelo, versão e backend que codificam a
+    coleção (embedding_model_key). Vetores de backends diferentes (ex.: ONNX int8 e
+    PyTorch) não são intercambiáveis.
     """
-    Identifica a extensão do arquivo e delega para o módulo adequado.
+    return get_embedding_model_for(collection).embedding_model_key
+
+def can_skip_extraction(cache, sha256: str) -> bool:
+    """
+    Indica se o arquivo com este SHA-256 pode ser ingerido sem executar os extratores.
     Args:
-        file_path (str): Caminho completo do arquivo a ser processado.
+        cache (IngestCache): Cache de ingestão.
+        sha256 (str): Hash do arquivo.
     Returns:
-        list: Lista de textos extraídos do documento.
+        bool: True se os chunks ou os textos extraídos estão no cache.
     """
-    # Obtém a extensão do arquivo
-    ext = os.path.splitext(file_path)[1].lower()
+    return (cache.has_chunks(sha256, _pipeline_version(), get_embedding_model().embedding_model_key)
+            or cache.has_texts(sha256, EXTRACTOR_VERSION))
 
+def add_texts_to_chroma(textos, file_path: str, client_name: str, collection,
+                        batch_size: int = EMBEDDING_BATCH_SIZE, progress_callback=None,
+                        cache=None, sha256: str = None, lexical_index=None) -> int:
+    """
+    Divide em chunks os textos já extraídos de um documento e grava no ChromaDB.
+    Args:
+        textos (iterable): Textos extraídos do documento.
+        file_path (str): Caminho do arquivo de origem.
+        client_name (str): Nome do cliente.
+        collection: Objeto de coleção do ChromaDB.
+        batch_size (int): Tamanho dos lotes enviados ao modelo de embedding.
+        progress_callback (callable, opcional): Função (etapa, feitos, total) de progresso.
+        cache (IngestCache, opcional): Cache onde chunks e embeddings serão guardados.
+        sha256 (str, opcional): Hash do arquivo (obrigatório se cache for informado).
+        lexical_index (BM25Index, opcional): Índice léxico atualizado junto com a coleção.
+    Returns:
+        int: Quantidade de chunks do documento presentes na coleção.
+    """
+    id_prefix = document_id_prefix(collection, client_name, file_path)
+
+    # Gera os chunks à medida que os textos chegam (ex.: páginas de um PDF) e grava em lotes.
+    # O total só é conhecido de antemão quando os textos já estão em uma lista.
+    total = None
+    if isinstance(textos, list):
+        records = list(iter_chunk_records(textos))
+        total = len(records)
+    else:
+        records = iter_chunk_records(textos)
+    cache_writer = None
+    if cache is not None:
+        cache_writer = cache.chunk_writer(sha256, _pipeline_version(),
+                                          _cache_model_key(collection))
     try:
-        # Delega o processamento para o módulo específico baseado na extensão
-        if ext == '.pdf':
-            return process_pdf(file_path)
-        elif ext in ['.xls', '.xlsx']:
-            return process_excel(file_path)
-        elif ext == '.docx':
-            return process_docx(file_path)
-        elif ext in ['.png', '.jpg', '.jpeg', '.gif']:
-            return process_image(file_path)
-        elif ext in ['.mp3', '.wav', '.ogg']:
-            return process_audio(file_path)
-        else:
-            # Para outros tipos de arquivo, assume-se que é texto
-            return process_txt(file_path)
-    except Exception as e:
-        # Registra o erro no log e propaga a exceção
-        logger.error(f"Erro ao processar documento {file_path}: {e}", exc_info=True)
+        written = add_chunks_to_collection(collection, records, client_name, file_path, batch_size=batch_size,
+                                           progress_callback=progress_callback, total=total,
+                                           id_prefix=id_prefix, cache_writer=cache_writer,
+                                           where=document_where(collection, client_name, file_path),
+                                           lexical_index=lexical_index)
+    except BaseException:
+        # Ingestão interrompida: os lotes já gravados no cache não formam uma entrada
+        if cache_writer is not None:
+            cache_writer.discard()
         raise
+    if cache_writer is not None and cache_writer.position:
+        cache_writer.commit()
+    return written
 
-def split_into_chunks(text: str, max_chunk_size: int = 1000) -> list:
+# Função auxiliar para processar e adicionar documento ao ChromaDB
+def process_and_add_to_chroma(file_path: str, client_name: str, collection,
+                              batch_size: int = EMBEDDING_BATCH_SIZE, progress_callback=None,
+                              cache=None, textos=None, sha256: str = None, lexical_index=None,
+                              cancel_check=None) -> int:
     """
-    Divide o texto em chunks menores.
+    Processa um documento e adiciona ao ChromaDB.
+    Com um cache de ingestão, arquivos já conhecidos (mesmo SHA-256) são gravados a
+    partir do cache, sem extração nem embeddings; se apenas os textos estiverem no
+    cache, a extração (Whisper, OCR...) é evitada.
     Args:
-        text (str): Texto a ser dividido.
-        max_chunk_size (int): Tamanho máximo de cada chunk.
+        file_path (str): Caminho do arquivo a ser processado.
+        client_name (str): Nome do cliente.
+        collection: Objeto de coleção do ChromaDB.
+        batch_size (int): Tamanho dos lotes enviados ao modelo de embedding.
+        progress_callback (callable, opcional): Função (etapa, feitos, total) que recebe o
+            progresso de cada etapa. Pode lançar uma exceção para interromper o processamento.
+        cache (IngestCache, opcional): Cache de ingestão por conteúdo.
+        textos (list, opcional): Textos já extraídos (ex.: pelo pool da ingestão em massa).
+        sha256 (str, opcional): Hash do arquivo, se já calculado.
+        lexical_index (BM25Index, opcional): Índice léxico BM25 do repositório, atualizado
+            junto com a coleção (ver vector_store.lexical_index_for).
+        cancel_check (callable, opcional): Verificação de cancelamento chamada durante
+            a extração (ver extractors.process_document); lança uma exceção para interromper.
     Returns:
-        list: Lista de chunks de texto.
+        int: Quantidade de chunks do documento presentes na coleção.
     """
-    # Divide o texto em sentenças
-    sentences = re.split(r'(?<=[.!?]) +', text)
-    chunks, current_chunk, current_length = [], [], 0
-
-    # Agrupa sentenças em chunks
-    for sentence in sentences:
-        sent_length = len(sentence)
-        if current_length + sent_length > max_chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            current_chunk, current_length = [], 0
-        current_chunk.append(sentence)
-        current_length += sent_length
-
-    # Adiciona o último chunk se houver
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    try:
+        if cache is not None:
+            sha256 = sha256 or file_sha256(file_path)
+            entry = cache.get_chunks(sha256, _pipeline_version(), _cache_model_key(collection))
+            if entry is not None:
+                if progress_callback:
+                    progress_callback("cache", None, None)
+                total = link_cached_chunks(entry, collection, client_name, file_path,
+                                           id_prefix=document_id_prefix(collection, client_name, file_path),
+                                           where=document_where(collection, client_name, file_path),
+                                           lexical_index=lexical_index)
+                logger.info(f"Documento {file_path} reaproveitado do cache de ingestão ({total} chunks).")
+                return total
+            if textos is None:
+                textos = cache.get_texts(sha256, EXTRACTOR_VERSION)
 
-    return chunks
+        # Processa o documento
+        if textos is None:
+            if progress_callback:
+                progress_callback("extração", None, None)
+            textos = process_document(file_path, cancel_check=cancel_check)
+            if cancel_check is not None:
+                textos = _checked(textos, cancel_check)
+            if cache is not None:
+                # Grava os textos no cache conforme passam pelo chunking, sem acumulá-los
+                textos = _stream_to_cache(textos, cache.text_writer(sha256, EXTRACTOR_VERSION))
 
+        total = add_texts_to_chroma(textos, file_path, client_name, collection,
+                                    batch_size=batch_size, progress_callback=progress_callback,
+                                    cache=cache, sha256=sha256, lexical_index=lexical_index)
 
+        logger.info(f"Documento {file_path} processado e adicionado com sucesso ({total} chunks).")
+        return total
+    except Exception as e:
+        logger.error(f"Erro ao processar e adicionar documento {file_path}: {e}", exc_info=True)
+        raise
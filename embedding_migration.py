@@ -0,0 +1,428 @@
+# embedding_migration.py - Reprocessamento dos embeddings em segundo plano ao trocar o modelo
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from config import (BASE_CHROMA_PERSIST_DIR, EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION,
+                    REEMBED_MAX_CHUNKS_PER_SECOND, REEMBED_SHADOW_PREFIX)
+from chroma_registry import get_registry
+from embedding_utils import (active_embedding_model, set_active_embedding_model, load_embedding_model, model_tag,
+                             collection_embedding_model, EMBEDDING_BATCH_SIZE)
+from vector_store import READ_PAGE_SIZE, notify_collection_changed
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Progresso do reprocessamento, gravado em BASE_CHROMA_PERSIST_DIR
+CHECKPOINT_FILENAME = "_reprocessamento.json"
+
+# Segundos sem atualização do progresso após os quais o trabalho de outro processo é
+# considerado interrompido (e pode ser retomado)
+JOB_HEARTBEAT_TIMEOUT = 120
+
+# Arquivo que identifica uma pasta de repositório do ChromaDB
+CHROMA_DB_FILENAME = "chroma.sqlite3"
+
+
+def target_embedding_model() -> tuple:
+    """
+    Returns:
+        tuple: (nome, versão) do modelo configurado em config.py.
+    """
+    return (EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION)
+
+
+def needs_reembedding() -> bool:
+    """
+    Returns:
+        bool: True se o modelo configurado é diferente do modelo em uso nas coleções.
+    """
+    return tuple(active_embedding_model()) != target_embedding_model()
+
+
+def shadow_name(collection_name: str) -> str:
+    """
+    Nome da coleção temporária que recebe os novos embeddings de uma coleção
+    (determinístico, para que o trabalho possa ser retomado).
+    """
+    return f"{REEMBED_SHADOW_PREFIX}{hashlib.sha1(collection_name.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _retired_name(collection_name: str) -> str:
+    # Nome da coleção antiga durante a troca (também oculto pelo prefixo)
+    return f"{REEMBED_SHADOW_PREFIX}old-{hashlib.sha1(collection_name.encode('utf-8')).hexdigest()[:16]}"
+
+
+def list_stores(base_dir: str = BASE_CHROMA_PERSIST_DIR) -> list:
+    """
+    Returns:
+        list: Repositórios do ChromaDB em base_dir (desaparecidos, global e índice de casos).
+    """
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(name for name in os.listdir(base_dir)
+                  if os.path.isfile(os.path.join(base_dir, name, CHROMA_DB_FILENAME)))
+
+
+def _paged_ids(collection) -> list:
+    ids, offset = [], 0
+    while True:
+        page = collection.get(include=[], limit=READ_PAGE_SIZE, offset=offset)
+        ids.extend(page['ids'])
+        if len(page['ids']) < READ_PAGE_SIZE:
+            return ids
+        offset += READ_PAGE_SIZE
+
+
+class ReembeddingJob:
+    """
+    Reprocessa os embeddings de todas as coleções com o modelo configurado.
+
+    Cada coleção é copiada, a partir dos documentos e metadados gravados, para uma
+    coleção temporária (REEMBED_SHADOW_PREFIX) com os embeddings do novo modelo,
+    em lotes e com limite de chunks por segundo. As consultas continuam usando a
+    coleção e o modelo antigos. Ao final (troca), as coleções temporárias recebem os
+    nomes das originais, o modelo em uso passa a ser o novo em todos os processos e
+    as coleções antigas são removidas.
+
+    O trabalho pode ser interrompido a qualquer momento: os chunks já gravados nas
+    coleções temporárias não são recalculados na retomada, e o progresso fica em
+    CHECKPOINT_FILENAME.
+    """
+
+    def __init__(self, model_name: str = None, version=None,
+                 max_chunks_per_second: float = REEMBED_MAX_CHUNKS_PER_SECOND,
+                 base_dir: str = BASE_CHROMA_PERSIST_DIR, registry=None):
+        target = target_embedding_model()
+        self.model_name = model_name or target[0]
+        self.version = version if version is not None else target[1]
+        self.max_chunks_per_second = max_chunks_per_second
+        self.base_dir = base_dir
+        self.registry = registry or get_registry()
+        self._model = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.checkpoint = self._load_checkpoint()
+
+    # ------------------------------------------------------------------ progresso
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.base_dir, CHECKPOINT_FILENAME)
+
+    @property
+    def target(self) -> tuple:
+        return (self.model_name, self.version)
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if (checkpoint.get("model"), checkpoint.get("version")) == self.target:
+                return checkpoint
+            logger.info(f"[ReembeddingJob] Progresso de {model_tag(checkpoint.get('model'), checkpoint.get('version'))} "
+                        f"descartado (novo destino {model_tag(*self.target)}).")
+        except (OSError, ValueError):
+            pass
+        return {"model": self.model_name, "version": self.version, "started": datetime.now().isoformat(),
+                "collections": {}}
+
+    def _save_checkpoint(self):
+        with self._lock:
+            self.checkpoint["pid"] = os.getpid()
+            self.checkpoint["heartbeat"] = time.time()
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.checkpoint, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.checkpoint_path)
+
+    def _update(self, key: str, **values):
+        with self._lock:
+            self.checkpoint["collections"].setdefault(key, {}).update(values)
+
+    def running_elsewhere(self) -> bool:
+        """
+        Returns:
+            bool: True se outro processo atualizou o progresso há menos de JOB_HEARTBEAT_TIMEOUT.
+        """
+        return (self.checkpoint.get("pid") not in (None, os.getpid())
+                and time.time() - self.checkpoint.get("heartbeat", 0) < JOB_HEARTBEAT_TIMEOUT)
+
+    def status(self) -> dict:
+        """
+        Returns:
+            dict: Modelo em uso, destino, chunks processados/total e coleções concluídas.
+        """
+        with self._lock:
+            collections = dict(self.checkpoint["collections"])
+        return {
+            "active": model_tag(*active_embedding_model()),
+            "target": model_tag(*self.target),
+            "chunks_done": sum(entry.get("done", 0) for entry in collections.values()),
+            "chunks_total": sum(entry.get("total", 0) for entry in collections.values()),
+            "collections_done": sum(1 for entry in collections.values() if entry.get("synced")),
+            "collections_total": len(collections),
+        }
+
+    def stop(self):
+        """
+        Interrompe o trabalho ao fim do lote atual (o progresso é mantido).
+        """
+        self._stop.set()
+
+    # ------------------------------------------------------------------ cópia
+    def _target_model(self):
+        # Carregado fora do registro: convive com o modelo em uso até a troca
+        if self._model is None:
+            self._model = load_embedding_model(self.model_name, use_server=False, version=self.version)
+        return self._model
+
+    def _throttle(self, chunks: int, started: float):
+        # Limita a taxa de chunks por segundo para não disputar CPU com as consultas
+        if self.max_chunks_per_second:
+            remaining = chunks / self.max_chunks_per_second - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def _open_shadow(self, store: str, collection):
+        name = shadow_name(collection.name)
+        if name in self.registry.list_collections(store, include_shadow=True):
+            shadow = self.registry.get_collection(store, name)
+            if collection_embedding_model(shadow) == self.target:
+                return shadow
+            # Sobra de um reprocessamento para outro modelo
+            self.registry.delete_collection(store, name)
+        metadata = dict(collection.metadata or {}, embedding_model=self.model_name,
+                        embedding_version=self.version, reembed_source=collection.name)
+        return self.registry.get_collection(store, name, create=True, metadata=metadata)
+
+    def _copy_missing(self, source, target, done_ids: set, key: str, interruptible: bool = True) -> int:
+        """
+        Grava em target, com o novo modelo, os chunks de source ausentes em done_ids.
+        Returns:
+            int: Quantidade de chunks codificados.
+        """
+        model = self._target_model()
+        encoded, offset = 0, 0
+        stop = self._stop if interruptible else threading.Event()
+        while not stop.is_set():
+            page = source.get(include=['documents', 'metadatas'], limit=READ_PAGE_SIZE, offset=offset)
+            missing = [i for i, chunk_id in enumerate(page['ids']) if chunk_id not in done_ids]
+            for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+                if stop.is_set():
+                    break
+                started = time.monotonic()
+                positions = missing[start:start + EMBEDDING_BATCH_SIZE]
+                documents = [page['documents'][i] or "" for i in positions]
+                embeddings = model.encode(documents, batch_size=EMBEDDING_BATCH_SIZE)
+                ids = [page['ids'][i] for i in positions]
+                target.upsert(ids=ids, documents=documents, metadatas=[page['metadatas'][i] for i in positions],
+                              embeddings=[list(map(float, embedding)) for embedding in embeddings])
+                done_ids.update(ids)
+                encoded += len(ids)
+                self._update(key, done=len(done_ids))
+                if interruptible:
+                    self._throttle(len(ids), started)
+            self._save_checkpoint()
+            if len(page['ids']) < READ_PAGE_SIZE:
+                break
+            offset += READ_PAGE_SIZE
+        return encoded
+
+    def sync_collection(self, store: str, name: str) -> bool:
+        """
+        Atualiza a coleção temporária de uma coleção: codifica os chunks que faltam e
+        remove os que não existem mais na original.
+        Returns:
+            bool: True se a coleção temporária ficou completa (False se interrompido).
+        """
+        with self.registry.pinned():
+            source = self.registry.get_collection(store, name)
+            key = f"{store}/{name}"
+            if collection_embedding_model(source) == self.target:
+                self._update(key, total=source.count(), done=source.count(), synced=True)
+                return True
+            shadow = self._open_shadow(store, source)
+            done_ids = set(_paged_ids(shadow))
+            self._update(key, total=source.count(), done=len(done_ids), synced=False)
+            encoded = self._copy_missing(source, shadow, done_ids, key)
+            if self._stop.is_set():
+                self._save_checkpoint()
+                return False
+            stale = done_ids - set(_paged_ids(source))
+            stale_ids = sorted(stale)
+            for start in range(0, len(stale_ids), READ_PAGE_SIZE):
+                shadow.delete(ids=stale_ids[start:start + READ_PAGE_SIZE])
+            self._update(key, total=source.count(), done=shadow.count(), synced=True)
+            self._save_checkpoint()
+            logger.info(f"[ReembeddingJob] {key}: {encoded} chunks codificados, {len(stale)} removidos "
+                        f"({model_tag(*self.target)}).")
+            return True
+
+    def _live_collections(self) -> list:
+        return [(store, name) for store in list_stores(self.base_dir)
+                for name in self.registry.list_collections(store)]
+
+    def _drop_orphan_shadows(self, store: str):
+        # Coleções temporárias cuja original foi removida durante o reprocessamento
+        expected = {shadow_name(name) for name in self.registry.list_collections(store)}
+        for name in self.registry.list_collections(store, include_shadow=True):
+            if name.startswith(REEMBED_SHADOW_PREFIX) and name not in expected:
+                self.registry.delete_collection(store, name)
+                logger.info(f"[ReembeddingJob] Coleção temporária órfã removida: {store}/{name}.")
+
+    # ------------------------------------------------------------------ troca
+    def _swap(self, store: str, name: str) -> bool:
+        # Só renomeia: a cópia dos chunks gravados entretanto fica para _finish_swap
+        live = self.registry.get_collection(store, name)
+        if collection_embedding_model(live) == self.target:
+            return False
+        shadow = self.registry.get_collection(store, shadow_name(name))
+        # A coleção antiga guarda o nome original, para que uma troca interrompida
+        # possa ser concluída ou desfeita (_recover_swaps)
+        metadata = {k: v for k, v in (live.metadata or {}).items() if not k.startswith("hnsw:")}
+        live.modify(name=_retired_name(name), metadata=dict(metadata, reembed_source=name))
+        shadow.modify(name=name)
+        self.registry.invalidate(store)
+        return True
+
+    def _finish_swap(self, store: str, name: str):
+        # Alterações feitas na coleção antiga entre a última sincronização e a troca: chunks
+        # gravados e removidos (ex.: os que saíram na reingestão de um documento). A trava de
+        # gravação garante que nenhuma ingestão grave na coleção antiga depois da cópia
+        with self.registry.pinned(), self.registry.writing(store):
+            retired = _retired_name(name)
+            old = self.registry.get_collection(store, retired)
+            new = self.registry.get_collection(store, name)
+            done_ids = set(_paged_ids(new))
+            key = f"{store}/{name}"
+            # Sem interrupção nem limite de taxa: a coleção antiga é removida em seguida
+            self._copy_missing(old, new, set(done_ids), key, interruptible=False)
+            stale_ids = sorted(done_ids - set(_paged_ids(old)))
+            for start in range(0, len(stale_ids), READ_PAGE_SIZE):
+                new.delete(ids=stale_ids[start:start + READ_PAGE_SIZE])
+            self.registry.delete_collection(store, retired)
+            # No repositório global, incrementa só o contador de alterações da coleção
+            notify_collection_changed(store, name)
+
+    def _recover_swaps(self, store: str):
+        # Trocas interrompidas (ex.: processo encerrado entre as renomeações)
+        names = self.registry.list_collections(store, include_shadow=True)
+        for retired_name in names:
+            if not retired_name.startswith(f"{REEMBED_SHADOW_PREFIX}old-"):
+                continue
+            retired = self.registry.get_collection(store, retired_name)
+            original = (retired.metadata or {}).get("reembed_source")
+            if original is None:
+                continue
+            if original in names:
+                # A coleção reprocessada já tem o nome original: conclui a troca
+                self._finish_swap(store, original)
+            else:
+                retired.modify(name=original)
+                self.registry.invalidate(store)
+            logger.info(f"[ReembeddingJob] Troca interrompida de {store}/{original} recuperada.")
+
+    def cut_over(self):
+        """
+        Troca as coleções originais pelas reprocessadas e passa a usar o novo modelo.
+        Todas as coleções devem estar sincronizadas (sync_collection).
+
+        As renomeações são feitas em sequência, sem codificação entre elas, e o modelo
+        em uso muda logo em seguida. Enquanto isso, consultas e gravações seguem o
+        modelo registrado em cada coleção (embedding_utils.get_embedding_model_for),
+        então nenhuma coleção recebe vetores de outro modelo. Os chunks gravados nas
+        coleções antigas antes da troca são copiados depois, e elas são removidas.
+        Ingestões nos repositórios ficam bloqueadas (ChromaRegistry.writing) da última
+        verificação até a remoção das coleções antigas.
+        """
+        with self.registry.writing(*list_stores(self.base_dir)):
+            collections = self._live_collections()
+            for store, name in collections:
+                if shadow_name(name) not in self.registry.list_collections(store, include_shadow=True):
+                    # Coleção criada depois da última sincronização
+                    self.sync_collection(store, name)
+            swapped = [(store, name) for store, name in collections if self._swap(store, name)]
+            set_active_embedding_model(self.model_name, self.version)
+            for store, name in swapped:
+                self._finish_swap(store, name)
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+        logger.info(f"[ReembeddingJob] Troca concluída: {len(collections)} coleções com {model_tag(*self.target)}.")
+
+    def run(self, cut_over: bool = True) -> dict:
+        """
+        Sincroniza todas as coleções e, se cut_over e nada tiver sido interrompido,
+        faz a troca. Uma última sincronização imediatamente antes da troca inclui os
+        chunks ingeridos durante o reprocessamento.
+        Returns:
+            dict: status() ao final, com completed (troca feita).
+        """
+        if tuple(active_embedding_model()) == self.target:
+            logger.info(f"[ReembeddingJob] As coleções já usam {model_tag(*self.target)}.")
+            return dict(self.status(), completed=True)
+        if self.running_elsewhere():
+            raise RuntimeError(f"Reprocessamento em andamento no processo {self.checkpoint.get('pid')}.")
+        self._save_checkpoint()
+        for store in list_stores(self.base_dir):
+            self._recover_swaps(store)
+        logger.info(f"[ReembeddingJob] Reprocessando de {model_tag(*active_embedding_model())} "
+                    f"para {model_tag(*self.target)}.")
+        completed = False
+        for _ in range(2 if cut_over else 1):
+            for store, name in self._live_collections():
+                if not self.sync_collection(store, name):
+                    return dict(self.status(), completed=False)
+        for store in list_stores(self.base_dir):
+            self._drop_orphan_shadows(store)
+        if cut_over:
+            self.cut_over()
+            completed = True
+        self._model = None
+        return dict(self.status(), completed=completed)
+
+
+# Trabalho em segundo plano do processo (um por vez)
+_background_job = None
+_background_lock = threading.Lock()
+
+
+def start_background_reembedding(max_chunks_per_second: float = REEMBED_MAX_CHUNKS_PER_SECOND, registry=None):
+    """
+    Inicia o reprocessamento em uma thread em segundo plano se o modelo configurado
+    for diferente do modelo em uso (e nenhum outro processo estiver reprocessando).
+    Returns:
+        ReembeddingJob | None: O trabalho iniciado ou em andamento.
+    """
+    global _background_job
+    with _background_lock:
+        if _background_job is not None or not needs_reembedding():
+            return _background_job
+        job = ReembeddingJob(max_chunks_per_second=max_chunks_per_second, registry=registry)
+        if job.running_elsewhere():
+            logger.info("[start_background_reembedding] Reprocessamento em andamento em outro processo.")
+            return None
+
+        def run():
+            global _background_job
+            try:
+                job.run()
+            except Exception as e:
+                logger.error(f"[start_background_reembedding] Falha no reprocessamento: {str(e)}", exc_info=True)
+            finally:
+                with _background_lock:
+                    _background_job = None
+
+        _background_job = job
+        threading.Thread(target=run, name="reembedding", daemon=True).start()
+        return job
@@ -0,0 +1,463 @@
+# embedding_server.py - Servidor local dos modelos de embedding e palavras-chave, com micro-lotes dinâmicos
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import hmac
+import json
+import socket
+import struct
+import hashlib
+import logging
+import queue
+import secrets
+import sys
+import ipaddress
+import threading
+import time
+from collections import Counter
+import numpy as np
+from config import BASE_CHROMA_PERSIST_DIR, EMBEDDING_SERVER_ADDRESS, EMBEDDING_SERVER_ALLOW_REMOTE
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Micro-lotes: textos máximos por passada do modelo e espera máxima (segundos) para
+# juntar pedidos concorrentes antes de codificar
+MAX_BATCH_TEXTS = 256
+MAX_BATCH_DELAY = 0.010
+
+# Intervalo (segundos) do registro periódico das estatísticas no log
+STATS_LOG_INTERVAL = 300
+
+# Chave de autenticação gerada por instalação (quando EMBEDDING_SERVER_KEY não está definida)
+SERVER_KEY_FILENAME = "_servidor_embedding.key"
+SERVER_KEY_ENV = "EMBEDDING_SERVER_KEY"
+
+# Protocolo: mensagens JSON prefixadas pelo tamanho (4 bytes), nunca pickle
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+HANDSHAKE_TIMEOUT = 5.0
+
+
+def server_key() -> bytes:
+    """
+    Chave compartilhada entre o servidor e os clientes: a variável de ambiente
+    EMBEDDING_SERVER_KEY ou, na falta dela, um segredo aleatório gerado na primeira
+    execução e gravado em BASE_CHROMA_PERSIST_DIR com permissão 0600.
+    """
+    env_key = os.environ.get(SERVER_KEY_ENV)
+    if env_key:
+        return env_key.encode('utf-8')
+    path = os.path.join(BASE_CHROMA_PERSIST_DIR, SERVER_KEY_FILENAME)
+    try:
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    os.makedirs(BASE_CHROMA_PERSIST_DIR, exist_ok=True)
+    key = secrets.token_hex(32).encode('ascii')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Criada por outro processo ao mesmo tempo
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    logger.info(f"[server_key] Chave do servidor de embedding gerada em {path}.")
+    return key
+
+
+def check_address(address, allow_remote: bool = EMBEDDING_SERVER_ALLOW_REMOTE):
+    """
+    Recusa endereços TCP fora do loopback, a menos que allow_remote seja True.
+    """
+    if isinstance(address, str):
+        return
+    host = address[0]
+    if host == "localhost":
+        return
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback and not allow_remote:
+        raise ValueError(f"Endereço {host} fora do loopback; defina EMBEDDING_SERVER_ALLOW_REMOTE para permitir.")
+
+
+def _family(address):
+    if isinstance(address, str):
+        return socket.AF_UNIX
+    return socket.AF_INET6 if ":" in address[0] else socket.AF_INET
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("Conexão encerrada")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    (size,) = struct.unpack(">I", _recv_exact(sock, 4))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Mensagem de {size} bytes acima do limite")
+    return json.loads(_recv_exact(sock, size).decode('utf-8'))
+
+
+def _proof(key: bytes, nonce: str) -> str:
+    return hmac.new(key, bytes.fromhex(nonce), hashlib.sha256).hexdigest()
+
+
+class _EncodeRequest:
+    """
+    Pedido de codificação aguardando na fila do servidor.
+    """
+
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingServer:
+    """
+    Processo dono dos modelos de embedding e de palavras-chave. Cada conexão é
+    atendida por uma thread; os pedidos de codificação de todas as conexões entram
+    em uma única fila e uma thread de lotes os junta em micro-lotes de até
+    MAX_BATCH_TEXTS textos, esperando no máximo MAX_BATCH_DELAY pelo próximo pedido.
+    """
+
+    def __init__(self, address=EMBEDDING_SERVER_ADDRESS, key: bytes = None,
+                 max_batch_texts: int = MAX_BATCH_TEXTS, max_batch_delay: float = MAX_BATCH_DELAY,
+                 allow_remote: bool = EMBEDDING_SERVER_ALLOW_REMOTE):
+        check_address(address, allow_remote)
+        self.address = address
+        self.key = key or server_key()
+        self.max_batch_texts = max_batch_texts
+        self.max_batch_delay = max_batch_delay
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._texts = 0
+        self._batches = 0
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._wait_seconds = 0.0
+        self._encode_seconds = 0.0
+        self._connections = 0
+        # Os modelos deste processo são sempre locais, mesmo com EMBEDDING_SERVER_ADDRESS definido
+        from embedding_utils import serve_locally
+        serve_locally()
+
+    # ------------------------------------------------------------------ modelos
+    def _model(self):
+        # Importado aqui: o servidor usa o backend local configurado em embedding_utils
+        from embedding_utils import get_embedding_model
+        return get_embedding_model()
+
+    def _batch_loop(self):
+        from embedding_utils import EMBEDDING_BATCH_SIZE
+
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch, n_texts = [first], len(first.texts)
+            deadline = first.enqueued + self.max_batch_delay
+            while n_texts < self.max_batch_texts:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_texts += len(request.texts)
+
+            started = time.monotonic()
+            try:
+                texts = [text for request in batch for text in request.texts]
+                embeddings = np.asarray(self._model().encode(texts, batch_size=EMBEDDING_BATCH_SIZE),
+                                        dtype=np.float32)
+                offset = 0
+                for request in batch:
+                    request.result = embeddings[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"[EmbeddingServer] Erro ao codificar lote de {n_texts} textos: {str(e)}", exc_info=True)
+                for request in batch:
+                    request.error = str(e)
+            finished = time.monotonic()
+            with self._stats_lock:
+                self._batches += 1
+                self._batch_sizes[n_texts] += 1
+                self._encode_seconds += finished - started
+                self._wait_seconds += sum(started - request.enqueued for request in batch)
+            for request in batch:
+                request.done.set()
+
+    def encode(self, texts: list):
+        """
+        Enfileira os textos e aguarda o micro-lote em que forem codificados.
+        """
+        request = _EncodeRequest(list(texts))
+        self._queue.put(request)
+        with self._stats_lock:
+            self._requests += 1
+            self._texts += len(request.texts)
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.result
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Profundidade atual e máxima da fila, pedidos, textos, lotes, tamanho
+            médio dos lotes, histograma de tamanhos, espera média na fila (ms) e
+            tempo médio de codificação por lote (ms).
+        """
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "connections": self._connections,
+                "requests": self._requests,
+                "texts": self._texts,
+                "batches": self._batches,
+                "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "mean_wait_ms": 1000 * self._wait_seconds / self._requests if self._requests else 0.0,
+                "mean_encode_ms": 1000 * self._encode_seconds / self._batches if self._batches else 0.0,
+            }
+
+    # ------------------------------------------------------------------ conexões
+    def _handle(self, request: dict):
+        from embedding_utils import count_tokens, extract_keywords, active_embedding_model, model_tag
+
+        op = request.get("op")
+        if op == "encode":
+            return self.encode(request["texts"]).tolist()
+        if op == "keywords":
+            embeddings = request.get("embeddings")
+            embeddings = None if embeddings is None else np.asarray(embeddings, dtype=np.float32)
+            return extract_keywords(request["texts"], top_n=request["top_n"], embeddings=embeddings)
+        if op == "tokens":
+            return count_tokens(request["texts"])
+        if op == "info":
+            model = self._model()
+            model_name, version = active_embedding_model()
+            return {"model_name": model_name, "model_tag": model_tag(model_name, version),
+                    "embedding_model_key": model.embedding_model_key,
+                    "max_seq_length": getattr(model, "max_seq_length", None),
+                    "dimension": model.get_sentence_embedding_dimension(), "backend": type(model).__name__}
+        if op == "stats":
+            return self.stats()
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    def _authenticate(self, conn) -> bool:
+        # Desafio-resposta HMAC: a chave nunca trafega pela conexão
+        conn.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            nonce = secrets.token_hex(32)
+            send_message(conn, {"challenge": nonce})
+            response = recv_message(conn)
+            ok = isinstance(response, dict) and hmac.compare_digest(str(response.get("proof", "")),
+                                                                     _proof(self.key, nonce))
+            send_message(conn, {"ok": ok})
+        except (EOFError, OSError, ValueError) as e:
+            logger.warning(f"[EmbeddingServer] Falha na autenticação de uma conexão: {str(e)}")
+            return False
+        conn.settimeout(None)
+        if not ok:
+            logger.warning("[EmbeddingServer] Conexão recusada: chave inválida.")
+        return ok
+
+    def _serve_connection(self, conn):
+        if not self._authenticate(conn):
+            conn.close()
+            return
+        with self._stats_lock:
+            self._connections += 1
+        try:
+            while not self._stop.is_set():
+                try:
+                    request = recv_message(conn)
+                except (EOFError, OSError, ValueError):
+                    break
+                if not isinstance(request, dict):
+                    break
+                try:
+                    send_message(conn, {"ok": True, "result": self._handle(request)})
+                except Exception as e:
+                    logger.error(f"[EmbeddingServer] Erro no pedido {request.get('op')}: {str(e)}", exc_info=True)
+                    try:
+                        send_message(conn, {"ok": False, "error": str(e)})
+                    except OSError:
+                        break
+        finally:
+            conn.close()
+            with self._stats_lock:
+                self._connections -= 1
+
+    def _stats_loop(self):
+        while not self._stop.wait(STATS_LOG_INTERVAL):
+            logger.info(f"[EmbeddingServer] {self.stats()}")
+
+    def serve_forever(self, warm_up: bool = True):
+        """
+        Carrega os modelos (se warm_up) e atende conexões até stop().
+        """
+        if warm_up:
+            from embedding_utils import get_keyword_model
+            self._model()
+            get_keyword_model()
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        threading.Thread(target=self._stats_loop, name="embedding-stats", daemon=True).start()
+        with socket.socket(_family(self.address), socket.SOCK_STREAM) as listener:
+            if isinstance(self.address, str):
+                if os.path.exists(self.address):
+                    os.remove(self.address)
+                listener.bind(self.address)
+                os.chmod(self.address, 0o600)
+            else:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind(tuple(self.address))
+            listener.listen()
+            # Permite que stop() seja percebido sem uma nova conexão
+            listener.settimeout(1.0)
+            logger.info(f"[EmbeddingServer] Atendendo em {self.address}.")
+            while not self._stop.is_set():
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    if not self._stop.is_set():
+                        logger.error(f"[EmbeddingServer] Falha ao aceitar conexão: {str(e)}")
+                    continue
+                conn.settimeout(None)
+                threading.Thread(target=self._serve_connection, args=(conn,), name="embedding-conn",
+                                 daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class RemoteEncoder:
+    """
+    Cliente do EmbeddingServer com a interface do modelo usada no projeto (encode,
+    max_seq_length, get_sentence_embedding_dimension), além de count_tokens e
+    extract_keywords executados no servidor. Cada thread usa a sua própria conexão.
+    """
+
+    def __init__(self, address=EMBEDDING_SERVER_ADDRESS, key: bytes = None):
+        self.address = address
+        self.key = key or server_key()
+        self._local = threading.local()
+        info = self._call({"op": "info"})
+        self.model_name = info["model_name"]
+        # Modelo e versão (embedding_utils.model_tag) com que o servidor codifica
+        self.model_tag = info["model_tag"]
+        # Modelo, versão e backend do servidor (ver embedding_utils.load_embedding_model)
+        self.embedding_model_key = info["embedding_model_key"]
+        self.max_seq_length = info["max_seq_length"]
+        self._dimension = info["dimension"]
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(_family(self.address), socket.SOCK_STREAM)
+            try:
+                conn.connect(self.address if isinstance(self.address, str) else tuple(self.address))
+                challenge = recv_message(conn)
+                send_message(conn, {"proof": _proof(self.key, challenge["challenge"])})
+                if not recv_message(conn).get("ok"):
+                    raise PermissionError("Servidor de embedding recusou a chave de autenticação")
+            except Exception:
+                conn.close()
+                raise
+            self._local.conn = conn
+        return conn
+
+    def _call(self, request: dict):
+        try:
+            conn = self._connection()
+            send_message(conn, request)
+            response = recv_message(conn)
+        except PermissionError:
+            raise
+        except (EOFError, OSError):
+            # Conexão perdida (ex.: servidor reiniciado): tenta uma vez com uma nova
+            self._local.conn = None
+            conn = self._connection()
+            send_message(conn, request)
+            response = recv_message(conn)
+        if not response["ok"]:
+            raise RuntimeError(f"Servidor de embedding: {response['error']}")
+        return response["result"]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def encode(self, sentences, batch_size: int = None, **kwargs):
+        """
+        Codifica um texto ou uma lista de textos no servidor (batch_size é definido pelo servidor).
+        Returns:
+            numpy.ndarray: Vetor (texto único) ou matriz (lista de textos).
+        """
+        single = isinstance(sentences, str)
+        embeddings = np.asarray(self._call({"op": "encode", "texts": [sentences] if single else list(sentences)}),
+                                dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def count_tokens(self, texts: list) -> list:
+        return self._call({"op": "tokens", "texts": list(texts)})
+
+    def extract_keywords(self, texts: list, top_n: int, embeddings=None) -> list:
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        keywords = self._call({"op": "keywords", "texts": list(texts), "top_n": top_n, "embeddings": embeddings})
+        return [[tuple(keyword) for keyword in per_text] for per_text in keywords]
+
+    def stats(self) -> dict:
+        stats = self._call({"op": "stats"})
+        stats["batch_sizes"] = {int(size): count for size, count in stats["batch_sizes"].items()}
+        return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename='log.txt',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - %(message)s',
+        filemode='a'
+    )
+    if not EMBEDDING_SERVER_ADDRESS:
+        print("Defina EMBEDDING_SERVER_ADDRESS em config.py.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        EmbeddingServer().serve_forever()
+    except KeyboardInterrupt:
+        pass
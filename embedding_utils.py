@@ -5,18 +5,334 @@
 # ============================================================================
 # 1. IMPORTAÇÕES NECESSÁRIAS
 # ============================================================================
-# Importação da biblioteca SentenceTransformer para geração de embeddings
-from sentence_transformers import SentenceTransformer
-
 # Importação do módulo de logging para registro detalhado de eventos
+import json
 import logging
+import os
+import threading
+
+# Registro dos modelos: o SentenceTransformer só é carregado no primeiro uso
+from model_registry import models
+from config import (BASE_CHROMA_PERSIST_DIR, EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION, EMBEDDING_BACKEND,
+                    EMBEDDING_BACKENDS, EMBEDDING_SERVER_ADDRESS)
+from query_cache import portuguese_stopwords, query_embedding_cache
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
 
-# Definição do modelo de embedding a ser utilizado
-# 'all-MiniLM-L6-v2' é um modelo pré-treinado que oferece um bom equilíbrio entre performance e qualidade
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+# O modelo de embedding é definido em config.py (EMBEDDING_MODEL_NAME); o padrão
+# 'all-MiniLM-L6-v2' oferece um bom equilíbrio entre performance e qualidade.
+# O modelo em uso (o das coleções gravadas) fica em MODEL_STATE_FILENAME e só muda
+# na troca feita pelo reprocessamento (ver embedding_migration.py)
+MODEL_STATE_FILENAME = "_modelo_embedding.json"
+
+# Candidatos da extração de palavras-chave (unigramas e bigramas)
+KEYWORD_NGRAM_RANGE = (1, 2)
+
+# Usa o servidor de modelos quando EMBEDDING_SERVER_ADDRESS está definido (o próprio
+# servidor desliga esta opção com serve_locally)
+_use_embedding_server = EMBEDDING_SERVER_ADDRESS is not None
+
+
+def serve_locally():
+    """
+    Faz este processo carregar os modelos localmente, mesmo com EMBEDDING_SERVER_ADDRESS
+    definido (usado pelo próprio servidor de modelos).
+    """
+    global _use_embedding_server
+    _use_embedding_server = False
+
+
+def _is_remote(model) -> bool:
+    return type(model).__name__ == "RemoteEncoder"
+
+
+def model_tag(model_name: str, version) -> str:
+    """
+    Returns:
+        str: Identificação de um modelo e versão (ex.: "all-MiniLM-L6-v2@1").
+    """
+    return f"{model_name}@{version}"
+
+
+def _model_state_path() -> str:
+    return os.path.join(BASE_CHROMA_PERSIST_DIR, MODEL_STATE_FILENAME)
+
+
+_active_state = {"mtime": None, "model": None}
+_active_lock = threading.Lock()
+
+
+def active_embedding_model() -> tuple:
+    """
+    Modelo em uso nas consultas e na ingestão: o registrado em MODEL_STATE_FILENAME
+    pela última troca ou, se o arquivo ainda não existir, o de config.py. O arquivo é
+    relido quando muda, para que todos os processos sigam a troca.
+    Returns:
+        tuple: (nome do modelo, versão).
+    """
+    path = _model_state_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        # Primeira execução: fixa o modelo de config.py como o das coleções existentes,
+        # para que uma mudança posterior em config.py dispare o reprocessamento
+        if os.path.isdir(BASE_CHROMA_PERSIST_DIR):
+            try:
+                set_active_embedding_model(EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION)
+            except OSError as e:
+                logger.error(f"[active_embedding_model] Não foi possível gravar {path}: {str(e)}")
+        return (EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION)
+    with _active_lock:
+        if _active_state["mtime"] != mtime:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    state = json.load(f)
+                _active_state["model"] = (state["model"], state["version"])
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"[active_embedding_model] Arquivo {path} inválido, usando config.py: {str(e)}")
+                _active_state["model"] = (EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_VERSION)
+            _active_state["mtime"] = mtime
+        return _active_state["model"]
+
+
+def set_active_embedding_model(model_name: str, version):
+    """
+    Registra o modelo em uso (chamado na troca do reprocessamento). A gravação é
+    atômica (arquivo temporário + os.replace).
+    """
+    path = _model_state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"model": model_name, "version": version}, f)
+    os.replace(tmp_path, path)
+    logger.info(f"[set_active_embedding_model] Modelo em uso: {model_tag(model_name, version)}.")
+
+
+def collection_model_metadata() -> dict:
+    """
+    Returns:
+        dict: Metadados de coleção que registram o modelo de embedding em uso.
+    """
+    model_name, version = active_embedding_model()
+    return {"embedding_model": model_name, "embedding_version": version}
+
+
+def load_embedding_model(model_name: str, use_server: bool = True, version=None):
+    """
+    Cria uma instância do modelo de embedding com o backend configurado (servidor de
+    modelos, ONNX Runtime ou PyTorch, com recuo para PyTorch em caso de falha).
+    A instância recebe embedding_model_key (modelo, versão e backend), usada como
+    chave no cache de embeddings de consulta.
+    Args:
+        model_name (str): Nome do modelo SentenceTransformer.
+        use_server (bool): Se False, ignora EMBEDDING_SERVER_ADDRESS.
+        version (opcional): Versão do modelo (EMBEDDING_MODEL_VERSION).
+    """
+    model = _create_embedding_model(model_name, use_server, version)
+    if _is_remote(model):
+        # Chave do modelo carregado no servidor, que inclui o backend dele
+        return model
+    backend = EMBEDDING_BACKEND if type(model).__name__ == "OnnxEncoder" else "pytorch"
+    model.embedding_model_key = f"{model_tag(model_name, version)}/{backend}"
+    return model
+
+
+def _create_embedding_model(model_name: str, use_server: bool, version=None):
+    if use_server and _use_embedding_server:
+        from embedding_server import RemoteEncoder
+        try:
+            remote = RemoteEncoder(EMBEDDING_SERVER_ADDRESS)
+            # Compara modelo e versão: só a versão muda quando o modelo é retreinado
+            if remote.model_tag == model_tag(model_name, version):
+                return remote
+            logger.error(f"[embedding_utils] O servidor de modelos usa {remote.model_tag}, não "
+                         f"{model_tag(model_name, version)}; carregando localmente.")
+        except Exception as e:
+            logger.error(f"[embedding_utils] Servidor de modelos indisponível em {EMBEDDING_SERVER_ADDRESS}, "
+                         f"carregando localmente: {str(e)}")
+    # A importação do sentence_transformers (e do torch) também fica para o primeiro uso
+    if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend de embedding desconhecido: {EMBEDDING_BACKEND} (use {EMBEDDING_BACKENDS})")
+    if EMBEDDING_BACKEND != "pytorch":
+        from onnx_backend import load_onnx_encoder
+        try:
+            return load_onnx_encoder(model_name, quantized=(EMBEDDING_BACKEND == "onnx-int8"))
+        except Exception as e:
+            logger.error(f"[embedding_utils] Backend {EMBEDDING_BACKEND} indisponível, usando PyTorch: {str(e)}",
+                         exc_info=True)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+# Modelo com que a instância registrada em "embedding" foi carregada
+_loaded_model = None
+
+
+def _load_embedding_model():
+    global _loaded_model
+    _loaded_model = active_embedding_model()
+    return load_embedding_model(_loaded_model[0], version=_loaded_model[1])
+
+
+models.register("embedding", _load_embedding_model)
+
+
+def get_embedding_model():
+    """
+    Returns:
+        SentenceTransformer: Modelo de embedding em uso, carregado no primeiro uso e
+        recarregado (junto com o KeyBERT) quando o reprocessamento troca o modelo.
+    """
+    if _loaded_model is not None and _loaded_model != active_embedding_model():
+        logger.info(f"[get_embedding_model] Modelo trocado para {model_tag(*active_embedding_model())}; recarregando.")
+        models.unload("keybert")
+        models.unload("embedding")
+        # Embeddings de consulta do modelo anterior não valem mais
+        query_embedding_cache.clear()
+    return models.get("embedding")
+
+
+# Segundos sem uso após os quais um modelo diferente do modelo em uso (ex.: o das
+# coleções ainda não trocadas pelo reprocessamento) é descartado
+PREVIOUS_MODEL_IDLE_TIMEOUT = 15 * 60
+
+
+def collection_embedding_model(collection) -> tuple:
+    """
+    Returns:
+        tuple: (nome, versão) do modelo registrado nos metadados da coleção. Coleções
+        gravadas antes do registro são consideradas do modelo em uso.
+    """
+    metadata = collection.metadata or {}
+    if "embedding_model" not in metadata:
+        return tuple(active_embedding_model())
+    return (metadata["embedding_model"], metadata.get("embedding_version"))
+
+
+def get_embedding_model_for(collection):
+    """
+    Modelo com que a coleção foi gravada: o modelo em uso ou, durante a troca do
+    reprocessamento, o modelo anterior/novo (carregado à parte e descartado após
+    PREVIOUS_MODEL_IDLE_TIMEOUT sem uso). Consultas e gravações em uma coleção devem
+    usar este modelo, para nunca misturar vetores de modelos diferentes.
+    """
+    model = collection_embedding_model(collection)
+    if model == tuple(active_embedding_model()):
+        return get_embedding_model()
+    name = f"embedding:{model_tag(*model)}"
+    models.register(name, lambda: load_embedding_model(model[0], version=model[1]),
+                    idle_timeout=PREVIOUS_MODEL_IDLE_TIMEOUT)
+    return models.get(name)
+
+
+def uses_active_model(collection) -> bool:
+    """
+    Returns:
+        bool: True se a coleção foi gravada com o modelo em uso.
+    """
+    return collection_embedding_model(collection) == tuple(active_embedding_model())
+
+
+def embeddings_for_collection(collection, embeddings, texts: list = None, memo: dict = None):
+    """
+    Embeddings de consulta adequados à coleção: os informados (calculados com o modelo
+    em uso) ou, se a coleção usa outro modelo, os textos codificados com esse modelo.
+    Args:
+        collection: Coleção do ChromaDB.
+        embeddings (list): Embeddings dos textos com o modelo em uso.
+        texts (list, opcional): Textos das consultas, para recodificar.
+        memo (dict, opcional): Embeddings já recodificados nesta pesquisa, por modelo.
+    Returns:
+        list | None: Embeddings para a coleção, ou None se ela usa outro modelo e os
+        textos não foram informados.
+    """
+    if uses_active_model(collection):
+        return embeddings
+    if not texts:
+        logger.warning(f"[embeddings_for_collection] {collection.name} usa {model_tag(*collection_embedding_model(collection))} "
+                       f"e a consulta não tem texto para recodificar; coleção ignorada.")
+        return None
+    key = collection_embedding_model(collection)
+    if memo is not None and key in memo:
+        return memo[key]
+    encoded = get_embedding_model_for(collection).encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE).tolist()
+    if memo is not None:
+        memo[key] = encoded
+    return encoded
+
+
+def _load_keyword_model():
+    # KeyBERT sobre a mesma instância do modelo de embedding: um único encoder em
+    # memória, e palavras-chave de documentos e consultas comparáveis entre si
+    from keybert import KeyBERT
+    from keybert.backend import BaseEmbedder
+    model = get_embedding_model()
+    if type(model).__name__ in ("OnnxEncoder", "RemoteEncoder"):
+        # O KeyBERT só reconhece o SentenceTransformer; ONNX e servidor entram como embedder próprio
+        class _SharedEmbedder(BaseEmbedder):
+            def embed(self, documents, verbose=False):
+                return model.encode(documents)
+
+        return KeyBERT(model=_SharedEmbedder())
+    return KeyBERT(model=model)
+
+
+models.register("keybert", _load_keyword_model)
+
+
+def get_keyword_model():
+    """
+    Returns:
+        KeyBERT: Extrator de palavras-chave sobre o modelo de embedding compartilhado.
+    """
+    return models.get("keybert")
+
+
+def new_keyword_vectorizer():
+    """
+    Cria o vetorizador de candidatos do KeyBERT (n-gramas sem stopwords em português).
+    Uma instância nova por chamada evita compartilhar estado entre threads.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+    return CountVectorizer(ngram_range=KEYWORD_NGRAM_RANGE, stop_words=sorted(portuguese_stopwords()))
+
+
+def extract_keywords(texts: list, top_n: int, embeddings=None) -> list:
+    """
+    Extrai palavras-chave de vários textos em uma única passada do KeyBERT compartilhado.
+    Usado tanto na ingestão quanto nas consultas, para que as pontuações sejam comparáveis.
+
+    Args:
+        texts (list): Textos.
+        top_n (int): Quantidade de palavras-chave por texto.
+        embeddings (numpy.ndarray, opcional): Embeddings já calculados para os textos.
+
+    Returns:
+        list: Para cada texto, a lista de tuplas (palavra-chave, pontuação).
+    """
+    if not texts:
+        return []
+    model = get_embedding_model()
+    if _is_remote(model):
+        return model.extract_keywords(texts, top_n=top_n, embeddings=embeddings)
+    keywords = get_keyword_model().extract_keywords(
+        texts, vectorizer=new_keyword_vectorizer(), top_n=top_n, doc_embeddings=embeddings)
+    # O KeyBERT "desembrulha" o resultado quando o lote tem um único texto
+    if len(texts) == 1:
+        keywords = [keywords]
+    return keywords
+
+
+def __getattr__(name):
+    # Compatibilidade com "from embedding_utils import embedding_model" (carrega o modelo)
+    if name == "embedding_model":
+        return get_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Quantidade de textos enviados ao modelo em cada passada (forward) durante a codificação em lote
+EMBEDDING_BATCH_SIZE = 64
 
 
 def encode_text(text: str) -> list:
@@ -32,7 +348,7 @@ def encode_text(text: str) -> list:
     try:
         # Utiliza o modelo para codificar o texto em um vetor de embedding
         # O método encode() retorna um numpy array, que é convertido para uma lista Python
-        embedding = embedding_model.encode(text).tolist()
+        embedding = get_embedding_model().encode(text).tolist()
         logger.debug(
             f"[encode_text] Embedding gerado com sucesso para o texto: '{text[:50]}...'")
         return embedding
@@ -43,12 +359,13 @@ def encode_text(text: str) -> list:
         return []
 
 
-def batch_encode_texts(texts: list) -> list:
+def batch_encode_texts(texts: list, batch_size: int = EMBEDDING_BATCH_SIZE) -> list:
     """
     Função para codificar uma lista de textos em vetores de embedding.
 
     Args:
         texts (list): Uma lista de textos a serem codificados.
+        batch_size (int): Quantidade de textos processados em cada passada do modelo.
 
     Returns:
         list: Uma lista de vetores de embedding representando os textos.
@@ -56,7 +373,7 @@ def batch_encode_texts(texts: list) -> list:
     try:
         # Utiliza o modelo para codificar múltiplos textos de uma vez
         # Isso é mais eficiente do que codificar cada texto individualmente
-        embeddings = embedding_model.encode(texts).tolist()
+        embeddings = get_embedding_model().encode(texts, batch_size=batch_size).tolist()
         logger.debug(
             f"[batch_encode_texts] Embeddings gerados com sucesso para lote de {len(texts)} textos.")
         return embeddings
@@ -67,15 +384,39 @@ def batch_encode_texts(texts: list) -> list:
         return []
 
 
+def count_tokens(texts: list) -> list:
+    """
+    Conta os tokens de cada texto com o tokenizador do modelo de embedding,
+    sem tokens especiais. Usado pelo chunking para respeitar o limite do modelo.
+
+    Args:
+        texts (list): Lista de textos.
+
+    Returns:
+        list: Quantidade de tokens de cada texto.
+    """
+    model = get_embedding_model()
+    if _is_remote(model):
+        return model.count_tokens(texts)
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        # Aproximação por palavras caso o modelo não exponha o tokenizador
+        return [len(text.split()) for text in texts]
+    encoded = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+    return [len(ids) for ids in encoded]
+
+
 def reload_embedding_model():
     """
     Função para recarregar o modelo de embedding.
-    Útil em casos onde o modelo precisa ser atualizado durante a execução.
+    Útil em casos onde o modelo precisa ser atualizado durante a execução. Todos os
+    módulos obtêm o modelo por get_embedding_model(), então a nova instância vale
+    para todos a partir da próxima chamada.
     """
-    global embedding_model
     try:
-        # Recarrega o modelo com as mesmas configurações originais
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Descarta a instância atual; a próxima chamada carrega o modelo novamente
+        models.unload("embedding")
+        get_embedding_model()
         logger.info(
             "[reload_embedding_model] Modelo de embedding recarregado com sucesso.")
     except Exception as e:
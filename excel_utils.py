@@ -8,10 +8,65 @@
 from openpyxl import load_workbook
 import logging
 import os
+from typing import Iterator
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
 
+# Tamanho máximo (em caracteres) de cada bloco de linhas; próximo do tamanho de um chunk
+EXCEL_BLOCK_CHARS = 1000
+
+def _format_block(sheet_title: str, header: str, rows: list) -> str:
+    # Cada bloco leva o nome da planilha e o cabeçalho, para não perder o significado das colunas
+    return f"Planilha: {sheet_title}\n{header}\n" + "\n".join(rows)
+
+def iter_excel_blocks(file_path: str, max_block_chars: int = EXCEL_BLOCK_CHARS) -> Iterator[str]:
+    """
+    Lê um arquivo Excel em modo streaming e agrupa as linhas em blocos de tamanho limitado.
+    A primeira linha não vazia de cada planilha é tratada como cabeçalho e repetida
+    no início de todos os blocos daquela planilha. Apenas um bloco fica em memória
+    por vez, independentemente do tamanho da planilha.
+
+    Args:
+        file_path (str): Caminho completo para o arquivo Excel.
+        max_block_chars (int): Tamanho máximo aproximado de cada bloco, em caracteres.
+
+    Returns:
+        Iterator[str]: Blocos de texto (planilha + cabeçalho + linhas).
+    """
+    # Verifica se o arquivo existe
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"O arquivo Excel não foi encontrado: {file_path}")
+
+    # Carrega o workbook do Excel em modo somente leitura (streaming)
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in wb:
+            header = None
+            rows, size = [], 0
+            for row in sheet.iter_rows(values_only=True):
+                # Junta o texto das células da linha, ignorando células vazias
+                cells_texts = [str(value) for value in row if value is not None]
+                if not cells_texts:
+                    continue
+                line = ' | '.join(cells_texts)
+                if header is None:
+                    header = line
+                    continue
+                # Fecha o bloco atual quando a próxima linha ultrapassaria o limite
+                if rows and size + len(line) > max_block_chars:
+                    yield _format_block(sheet.title, header, rows)
+                    rows, size = [], 0
+                rows.append(line)
+                size += len(line) + 1
+            if rows:
+                yield _format_block(sheet.title, header, rows)
+            elif header is not None:
+                # Planilha com uma única linha preenchida
+                yield f"Planilha: {sheet.title}\n{header}"
+    finally:
+        wb.close()
+
 def process_excel(file_path: str) -> list:
     """
     Processa um arquivo Excel e extrai o texto de todas as células.
@@ -20,31 +75,10 @@ def process_excel(file_path: str) -> list:
         file_path (str): Caminho completo para o arquivo Excel.
     
     Returns:
-        list: Uma lista onde cada elemento é o texto extraído de uma linha do Excel.
+        list: Uma lista onde cada elemento é um bloco de linhas do Excel, com o cabeçalho da planilha.
     """
     try:
-        # Verifica se o arquivo existe
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"O arquivo Excel não foi encontrado: {file_path}")
-        
-        # Carrega o workbook do Excel
-        wb = load_workbook(file_path, read_only=True, data_only=True)
-        
-        # Lista para armazenar o texto de cada linha
-        text = []
-        
-        # Itera sobre todas as planilhas do workbook
-        for sheet in wb:
-            # Itera sobre todas as linhas da planilha
-            for row in sheet.iter_rows():
-                # Extrai o texto de cada célula na linha, ignorando células vazias
-                cells_texts = [str(cell.value) for cell in row if cell.value is not None]
-                # Junta o texto das células em uma única string e adiciona à lista
-                text.append(' '.join(cells_texts))
-        
-        # Retorna a lista com o texto de todas as linhas
-        return text
-    
+        return list(iter_excel_blocks(file_path))
     except Exception as e:
         # Captura e registra qualquer erro que possa ocorrer durante o processamento
         logger.error(f"Erro ao processar o arquivo Excel {file_path}: {str(e)}", exc_info=True)
@@ -0,0 +1,105 @@
+# extractors.py - Extração de texto dos documentos, sem dependência dos modelos de embedding
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import logging
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Versão da extração de texto; deve ser incrementada sempre que a saída dos
+# extratores mudar, para invalidar os textos guardados no cache de ingestão
+EXTRACTOR_VERSION = "1"
+
+# Extensões aceitas na ingestão (arquivos sem extensão conhecida são tratados como texto)
+PDF_EXTENSIONS = ('.pdf',)
+EXCEL_EXTENSIONS = ('.xls', '.xlsx')
+DOCX_EXTENSIONS = ('.docx',)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg')
+TEXT_EXTENSIONS = ('.txt',)
+SUPPORTED_EXTENSIONS = (PDF_EXTENSIONS + EXCEL_EXTENSIONS + DOCX_EXTENSIONS +
+                        IMAGE_EXTENSIONS + AUDIO_EXTENSIONS + TEXT_EXTENSIONS)
+
+# Tipo de documento gravado nos metadados de cada chunk, por grupo de extensões
+DOCUMENT_TYPES = (
+    (PDF_EXTENSIONS, "pdf"),
+    (EXCEL_EXTENSIONS, "excel"),
+    (DOCX_EXTENSIONS, "docx"),
+    (IMAGE_EXTENSIONS, "image"),
+    (AUDIO_EXTENSIONS, "audio"),
+)
+
+
+class IngestCancelled(Exception):
+    """
+    Exceção lançada quando o usuário solicita o cancelamento da ingestão. Definida
+    aqui para que os extratores (que verificam o cancelamento durante extrações
+    longas) não dependam da fila de ingestão; reexportada por ingest_worker.
+    """
+
+
+def get_document_type(file_path: str) -> str:
+    """
+    Identifica o tipo do documento pela extensão do arquivo.
+    Args:
+        file_path (str): Caminho ou nome do arquivo.
+    Returns:
+        str: "pdf", "excel", "docx", "image", "audio" ou "text".
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    for extensions, document_type in DOCUMENT_TYPES:
+        if ext in extensions:
+            return document_type
+    return "text"
+
+
+def process_document(file_path: str, cancel_check=None) -> list:
+    """
+    Identifica a extensão do arquivo e delega para o módulo adequado.
+    Os módulos específicos são importados apenas quando necessários, para que
+    processos de extração não carreguem modelos de imagem/áudio sem precisar.
+    Args:
+        file_path (str): Caminho completo do arquivo a ser processado.
+        cancel_check (callable, opcional): Chamado durante extrações longas (faixas de
+            páginas de PDFs, trechos de áudio no Whisper); lança uma exceção para interromper.
+    Returns:
+        list | iterator: Textos extraídos do documento. PDFs são devolvidos como um
+        gerador de páginas e planilhas Excel como um gerador de blocos de linhas, para
+        que o chunking comece antes do fim da extração e a memória fique limitada.
+        Falhas durante a geração são propagadas: uma extração truncada não pode ser
+        tomada como a nova versão do documento na reingestão.
+    """
+    # Obtém a extensão do arquivo
+    ext = os.path.splitext(file_path)[1].lower()
+
+    try:
+        # Delega o processamento para o módulo específico baseado na extensão
+        if ext in PDF_EXTENSIONS:
+            from pdf_utils import iter_pdf_pages
+            return iter_pdf_pages(file_path, cancel_check=cancel_check)
+        elif ext in EXCEL_EXTENSIONS:
+            from excel_utils import iter_excel_blocks
+            return iter_excel_blocks(file_path)
+        elif ext in DOCX_EXTENSIONS:
+            from docx_utils import process_docx
+            return process_docx(file_path)
+        elif ext in IMAGE_EXTENSIONS:
+            from image_utils import process_image
+            return process_image(file_path)
+        elif ext in AUDIO_EXTENSIONS:
+            from audio_utils import process_audio
+            return process_audio(file_path, cancel_check=cancel_check)
+        else:
+            # Para outros tipos de arquivo, assume-se que é texto
+            from text_utils import process_txt
+            return process_txt(file_path)
+    except Exception as e:
+        # Registra o erro no log e propaga a exceção
+        logger.error(f"Erro ao processar documento {file_path}: {e}", exc_info=True)
+        raise
+
@@ -8,7 +8,7 @@
 
 from PIL import Image
 import pytesseract
-from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
+from model_registry import models
 import logging
 import os
 import requests
@@ -28,10 +28,21 @@ logger = logging.getLogger(__name__)
 # Configuração do caminho para o executável do Tesseract OCR
 pytesseract.pytesseract.tesseract_cmd = r'C:\Tesseract-OCR\tesseract.exe'
 
-# Carregamento dos modelos de processamento de imagem
-image_captioning_model = VisionEncoderDecoderModel.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
-image_processor = ViTImageProcessor.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
-tokenizer = AutoTokenizer.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
+# Modelo de legendas de imagem: carregado na primeira imagem e descartado após
+# CAPTIONING_IDLE_TIMEOUT segundos sem uso
+CAPTIONING_MODEL_NAME = "nlpconnect/vit-gpt2-image-captioning"
+CAPTIONING_IDLE_TIMEOUT = 15 * 60
+
+
+def _load_captioning_model():
+    # Retorna (modelo, processador de imagem, tokenizador)
+    from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
+    return (VisionEncoderDecoderModel.from_pretrained(CAPTIONING_MODEL_NAME),
+            ViTImageProcessor.from_pretrained(CAPTIONING_MODEL_NAME),
+            AutoTokenizer.from_pretrained(CAPTIONING_MODEL_NAME))
+
+
+models.register("legendas", _load_captioning_model, idle_timeout=CAPTIONING_IDLE_TIMEOUT)
 
 # Configurações da API Azure AI Vision
 VISION_ENDPOINT = "coloque seu endpoint aqui"
@@ -63,6 +74,7 @@ def process_image(file_path: str) -> list:
         ocr_text = pytesseract.image_to_string(image, lang="por")
 
         # Prepara a imagem para o modelo de captioning
+        image_captioning_model, image_processor, tokenizer = models.get("legendas")
         pixel_values = image_processor(images=image, return_tensors="pt").pixel_values
 
         # Gera a descrição da imagem
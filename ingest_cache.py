@@ -0,0 +1,279 @@
+# ingest_cache.py - Cache persistente dos resultados de ingestão por conteúdo do arquivo
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Nome do arquivo do cache dentro do diretório base das coleções
+INGEST_CACHE_FILENAME = "_ingest_cache.sqlite3"
+
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo, lendo em blocos.
+    Args:
+        file_path (str): Caminho do arquivo.
+        block_size (int): Tamanho dos blocos de leitura.
+    Returns:
+        str: Hash hexadecimal do arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestCache:
+    """
+    Cache em SQLite dos resultados de ingestão, indexado pelo SHA-256 do arquivo.
+
+    São guardados dois níveis:
+      - textos extraídos, por (sha256, versão do extrator): evita repetir Whisper/OCR;
+      - chunks, palavras-chave e embeddings, por (sha256, versão do extrator+chunking,
+        modelo de embedding, na forma de embedding_model_key: modelo, versão e backend):
+        permite gravar o arquivo em outra coleção sem passar pelo modelo.
+    O caminho e o desaparecido não fazem parte da chave, então o mesmo arquivo é
+    reconhecido em qualquer pasta de desaparecido.
+
+    Os dois níveis podem ser gravados aos poucos (text_writer, chunk_writer), durante
+    a ingestão, sem manter o documento inteiro em memória; a entrada só passa a valer
+    quando o gravador é concluído (commit).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS text_entries (
+                    sha256 TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    n_blocks INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, extractor_version)
+                );
+                CREATE TABLE IF NOT EXISTS text_blocks (
+                    sha256 TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (sha256, extractor_version, position)
+                );
+                CREATE TABLE IF NOT EXISTS documents (
+                    sha256 TEXT NOT NULL,
+                    pipeline_version TEXT NOT NULL,
+                    model_name TEXT NOT NULL,
+                    n_chunks INTEGER NOT NULL,
+                    dim INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, pipeline_version, model_name)
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    sha256 TEXT NOT NULL,
+                    pipeline_version TEXT NOT NULL,
+                    model_name TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    chunk_key TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (sha256, pipeline_version, model_name, position)
+                );
+            """)
+
+    def get_texts(self, sha256: str, extractor_version: str):
+        """
+        Returns:
+            list | None: Textos extraídos do arquivo, ou None se não estiverem no cache.
+        """
+        key = (sha256, extractor_version)
+        with self._lock:
+            entry = self._conn.execute(
+                "SELECT n_blocks FROM text_entries WHERE sha256 = ? AND extractor_version = ?", key).fetchone()
+            if entry is None:
+                return None
+            texts = [row[0] for row in self._conn.execute(
+                "SELECT text FROM text_blocks WHERE sha256 = ? AND extractor_version = ? ORDER BY position", key)]
+        if len(texts) == entry[0]:
+            return texts
+        logger.warning(f"[IngestCache.get_texts] Entrada incompleta para {sha256}; ignorando.")
+        return None
+
+    def has_texts(self, sha256: str, extractor_version: str) -> bool:
+        """
+        Returns:
+            bool: True se os textos extraídos do arquivo estão no cache.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM text_entries WHERE sha256 = ? AND extractor_version = ?",
+                (sha256, extractor_version)).fetchone()
+        return row is not None
+
+    def text_writer(self, sha256: str, extractor_version: str) -> "_TextWriter":
+        """
+        Returns:
+            _TextWriter: Gravador dos textos extraídos de um arquivo, bloco a bloco
+            (substitui a entrada anterior, se houver).
+        """
+        return _TextWriter(self, sha256, extractor_version)
+
+    def put_texts(self, sha256: str, extractor_version: str, texts: list):
+        """
+        Guarda os textos extraídos de um arquivo.
+        """
+        writer = self.text_writer(sha256, extractor_version)
+        writer.add(list(texts))
+        writer.commit()
+
+    def has_chunks(self, sha256: str, pipeline_version: str, model_name: str) -> bool:
+        """
+        Returns:
+            bool: True se chunks e embeddings do arquivo estão no cache.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE sha256 = ? AND pipeline_version = ? AND model_name = ?",
+                (sha256, pipeline_version, model_name)).fetchone()
+        return row is not None
+
+    def get_chunks(self, sha256: str, pipeline_version: str, model_name: str):
+        """
+        Returns:
+            dict | None: {"keys", "documents", "metadatas", "embeddings"} na ordem do documento,
+            ou None se o arquivo não estiver no cache.
+        """
+        with self._lock:
+            doc = self._conn.execute(
+                "SELECT n_chunks, dim FROM documents WHERE sha256 = ? AND pipeline_version = ? AND model_name = ?",
+                (sha256, pipeline_version, model_name)).fetchone()
+            if doc is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT chunk_key, text, metadata, embedding FROM chunks "
+                "WHERE sha256 = ? AND pipeline_version = ? AND model_name = ? ORDER BY position",
+                (sha256, pipeline_version, model_name)).fetchall()
+        n_chunks, dim = doc
+        if len(rows) != n_chunks:
+            logger.warning(f"[IngestCache.get_chunks] Entrada incompleta para {sha256}; ignorando.")
+            return None
+        embeddings = np.frombuffer(b''.join(row[3] for row in rows), dtype=np.float32).reshape(-1, dim) \
+            if rows else np.zeros((0, dim), dtype=np.float32)
+        return {
+            "keys": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows],
+            "embeddings": embeddings,
+        }
+
+    def chunk_writer(self, sha256: str, pipeline_version: str, model_name: str) -> "_ChunkWriter":
+        """
+        Returns:
+            _ChunkWriter: Gravador dos chunks de um arquivo, lote a lote (substitui a
+            entrada anterior, se houver).
+        """
+        return _ChunkWriter(self, sha256, pipeline_version, model_name)
+
+    def put_chunks(self, sha256: str, pipeline_version: str, model_name: str,
+                   keys: list, documents: list, metadatas: list, embeddings):
+        """
+        Guarda os chunks de um arquivo (substituindo uma entrada anterior, se houver).
+        Args:
+            keys (list): Chaves dos chunks dentro do documento (sem o prefixo da coleção).
+            documents (list): Textos dos chunks.
+            metadatas (list): Metadados independentes do upload (ex.: palavras-chave).
+            embeddings (array-like): Matriz (n_chunks, dim) de embeddings.
+        """
+        writer = self.chunk_writer(sha256, pipeline_version, model_name)
+        writer.add(keys, documents, metadatas, embeddings)
+        writer.commit()
+
+
+class _TextWriter:
+    """
+    Grava os textos extraídos de um arquivo em blocos (tabela text_blocks). A entrada
+    (text_entries) só é criada no commit; sem ele (ex.: extração interrompida), discard
+    remove os blocos.
+    """
+
+    def __init__(self, cache: IngestCache, sha256: str, extractor_version: str):
+        self.cache = cache
+        self.key = (sha256, extractor_version)
+        self.position = 0
+        with cache._lock, cache._conn:
+            cache._conn.execute("DELETE FROM text_entries WHERE sha256 = ? AND extractor_version = ?", self.key)
+            cache._conn.execute("DELETE FROM text_blocks WHERE sha256 = ? AND extractor_version = ?", self.key)
+
+    def add(self, texts: list):
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.executemany(
+                "INSERT OR REPLACE INTO text_blocks VALUES (?, ?, ?, ?)",
+                [self.key + (self.position + offset, text) for offset, text in enumerate(texts)])
+        self.position += len(texts)
+
+    def commit(self):
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.execute("INSERT OR REPLACE INTO text_entries VALUES (?, ?, ?, ?)",
+                                     self.key + (self.position, time.time()))
+
+    def discard(self):
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.execute("DELETE FROM text_blocks WHERE sha256 = ? AND extractor_version = ?", self.key)
+
+
+class _ChunkWriter:
+    """
+    Grava os chunks de um arquivo em lotes (tabela chunks). A entrada (documents) só
+    é criada no commit; sem ele (ex.: ingestão interrompida), discard remove os lotes.
+    """
+
+    def __init__(self, cache: IngestCache, sha256: str, pipeline_version: str, model_name: str):
+        self.cache = cache
+        self.key = (sha256, pipeline_version, model_name)
+        self.position = 0
+        self.dim = 0
+        with cache._lock, cache._conn:
+            cache._conn.execute(
+                "DELETE FROM documents WHERE sha256 = ? AND pipeline_version = ? AND model_name = ?", self.key)
+            cache._conn.execute(
+                "DELETE FROM chunks WHERE sha256 = ? AND pipeline_version = ? AND model_name = ?", self.key)
+
+    def add(self, keys: list, documents: list, metadatas: list, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 2 and len(embeddings):
+            self.dim = embeddings.shape[1]
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self.key + (self.position + offset, chunk_key, text, json.dumps(meta, ensure_ascii=False),
+                             emb.tobytes())
+                 for offset, (chunk_key, text, meta, emb)
+                 in enumerate(zip(keys, documents, metadatas, embeddings))])
+        self.position += len(keys)
+
+    def commit(self):
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                                     self.key + (self.position, self.dim, time.time()))
+        logger.debug(f"[IngestCache] {self.position} chunks guardados para {self.key[0][:12]}.")
+
+    def discard(self):
+        with self.cache._lock, self.cache._conn:
+            self.cache._conn.execute(
+                "DELETE FROM chunks WHERE sha256 = ? AND pipeline_version = ? AND model_name = ?", self.key)
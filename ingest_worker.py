@@ -0,0 +1,197 @@
+# ingest_worker.py - Fila de ingestão de documentos executada em segundo plano
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import itertools
+import logging
+import queue
+import threading
+import time
+# Reexportada: a fila de ingestão é o ponto de uso habitual da exceção
+from extractors import IngestCancelled
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de um job de ingestão
+STATUS_QUEUED = "na fila"
+STATUS_RUNNING = "em andamento"
+STATUS_DONE = "concluído"
+STATUS_FAILED = "erro"
+STATUS_CANCELLED = "cancelado"
+
+# Eventos que encerram um job (o último publicado para ele)
+FINAL_EVENTS = ("done", "cancelled", "error")
+
+
+class IngestJob:
+    """
+    Representa um upload a ser processado pela fila de ingestão.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, file_path: str, client_name: str, label: str = None):
+        self.id = next(self._ids)
+        self.file_path = file_path
+        self.client_name = client_name
+        self.label = label or file_path
+        self.status = STATUS_QUEUED
+        self.stage = ""
+        self.created_at = time.time()
+        self.started_at = None
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """
+        Solicita o cancelamento do job. Jobs na fila são descartados e jobs em
+        andamento são interrompidos no próximo ponto de verificação.
+        """
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        """
+        Ponto de verificação de cancelamento para etapas longas sem progresso próprio
+        (ex.: extração de PDFs e transcrição do Whisper).
+        """
+        if self.cancelled:
+            raise IngestCancelled(f"Job {self.id} cancelado pelo usuário.")
+
+
+class IngestWorker:
+    """
+    Executa jobs de ingestão em threads de trabalho, fora da thread do Tk.
+
+    O handler recebe (job, report) e executa o processamento. A função report(stage,
+    done=None, total=None) publica o progresso e lança IngestCancelled quando o job foi
+    cancelado. Os eventos são acumulados em uma fila thread-safe e consumidos pela
+    interface com poll_events(), tipicamente a partir de um laço com after().
+    """
+
+    def __init__(self, handler, num_workers: int = 1):
+        self.handler = handler
+        self.jobs = {}
+        self._pending = queue.Queue()
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        for index in range(num_workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job: IngestJob) -> IngestJob:
+        """
+        Enfileira um job para processamento.
+        Args:
+            job (IngestJob): Job a ser processado.
+        Returns:
+            IngestJob: O próprio job, para acompanhamento.
+        """
+        with self._lock:
+            self.jobs[job.id] = job
+        self._publish(job, "queued")
+        self._pending.put(job)
+        return job
+
+    def cancel(self, job_id: int = None) -> bool:
+        """
+        Cancela um job específico ou, se job_id for None, o job em andamento mais antigo.
+        Args:
+            job_id (int, opcional): Identificador do job.
+        Returns:
+            bool: True se algum job foi marcado para cancelamento.
+        """
+        with self._lock:
+            if job_id is None:
+                running = [job for job in self.jobs.values() if job.status == STATUS_RUNNING]
+                job = min(running, key=lambda j: j.started_at) if running else None
+            else:
+                job = self.jobs.get(job_id)
+        if job is None or job.status not in (STATUS_QUEUED, STATUS_RUNNING):
+            return False
+        job.cancel()
+        logger.info(f"[IngestWorker.cancel] Cancelamento solicitado para o job {job.id} ({job.label}).")
+        return True
+
+    def pending_count(self) -> int:
+        """
+        Returns:
+            int: Quantidade de jobs ainda na fila ou em andamento.
+        """
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job.status in (STATUS_QUEUED, STATUS_RUNNING))
+
+    def poll_events(self) -> list:
+        """
+        Retorna (sem bloquear) todos os eventos publicados desde a última chamada.
+        Jobs encerrados deixam de ser acompanhados (saem de jobs) quando o seu evento
+        final é entregue, para que uma sessão longa não acumule jobs concluídos.
+        Returns:
+            list: Lista de dicionários de evento.
+        """
+        events = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return events
+            if event["type"] in FINAL_EVENTS:
+                with self._lock:
+                    self.jobs.pop(event["job_id"], None)
+            events.append(event)
+
+    def _publish(self, job: IngestJob, event_type: str, **fields):
+        event = {"type": event_type, "job_id": job.id, "label": job.label,
+                 "status": job.status, "stage": job.stage}
+        event.update(fields)
+        self._events.put(event)
+
+    def _run(self):
+        while True:
+            job = self._pending.get()
+            if job.cancelled:
+                job.status = STATUS_CANCELLED
+                self._publish(job, "cancelled")
+                continue
+            self._process(job)
+
+    def _process(self, job: IngestJob):
+        job.status = STATUS_RUNNING
+        job.started_at = time.time()
+        stage_started = {}
+
+        def report(stage: str, done: int = None, total: int = None):
+            # Ponto de verificação de cancelamento e publicação de progresso. O início
+            # da etapa é o primeiro relatório dela (as etapas com total relatam done=0
+            # antes de começar, para que a estimativa inclua o primeiro lote)
+            job.raise_if_cancelled()
+            now = time.time()
+            job.stage = stage
+            stage_started.setdefault(stage, now)
+            eta = None
+            if done and total:
+                elapsed = now - stage_started[stage]
+                eta = elapsed / done * (total - done)
+            self._publish(job, "progress", done=done, total=total, eta=eta,
+                          elapsed=now - job.started_at)
+
+        try:
+            report("iniciando")
+            result = self.handler(job, report)
+            job.status = STATUS_DONE
+            self._publish(job, "done", result=result, elapsed=time.time() - job.started_at)
+        except IngestCancelled:
+            job.status = STATUS_CANCELLED
+            logger.info(f"[IngestWorker] Job {job.id} ({job.label}) cancelado.")
+            self._publish(job, "cancelled")
+        except Exception as e:
+            job.status = STATUS_FAILED
+            logger.error(f"[IngestWorker] Erro no job {job.id} ({job.label}): {str(e)}", exc_info=True)
+            self._publish(job, "error", error=str(e), error_type=type(e).__name__)
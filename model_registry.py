@@ -0,0 +1,216 @@
+# model_registry.py - Carregamento sob demanda dos modelos, pré-aquecimento e descarte por ociosidade
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import gc
+import logging
+import threading
+import time
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Início da contagem do tempo de inicialização (importação deste módulo)
+_PROCESS_STARTED = time.perf_counter()
+
+# Intervalo (segundos) da verificação de modelos ociosos
+IDLE_CHECK_INTERVAL = 60
+
+
+class _ModelEntry:
+    """
+    Modelo registrado: função de carga, instância (quando carregada) e estatísticas.
+    """
+
+    def __init__(self, name: str, loader, idle_timeout: float = None):
+        self.name = name
+        self.loader = loader
+        self.idle_timeout = idle_timeout
+        self.instance = None
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+        self.load_seconds = None
+        self.loads = 0
+        self.loaded_by = ""
+
+
+class ModelRegistry:
+    """
+    Registro dos modelos pesados (embedding, KeyBERT, Whisper, legendas de imagem).
+
+    Nenhum modelo é carregado na importação: cada módulo registra uma função de carga
+    e o modelo só é criado no primeiro get(). Modelos podem ser pré-aquecidos em uma
+    thread em segundo plano (warm_up) depois que a interface aparece e, se tiverem
+    idle_timeout, são descartados após esse tempo sem uso (carregados de novo no
+    próximo get). O relatório de inicialização reúne as etapas marcadas com mark()
+    e o tempo de carga de cada modelo.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._phases = []
+        self._last_mark = _PROCESS_STARTED
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, loader, idle_timeout: float = None):
+        """
+        Registra um modelo.
+        Args:
+            name (str): Nome do modelo no registro.
+            loader (callable): Função sem argumentos que cria o modelo.
+            idle_timeout (float, opcional): Segundos sem uso após os quais o modelo é
+                descartado (None: mantido até o fim do processo).
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._entries[name] = _ModelEntry(name, loader, idle_timeout)
+            else:
+                entry.loader = loader
+                entry.idle_timeout = idle_timeout
+
+    def _entry(self, name: str) -> _ModelEntry:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Modelo não registrado: {name}")
+        return entry
+
+    def get(self, name: str):
+        """
+        Returns:
+            A instância do modelo, carregada no primeiro uso (uma única vez, mesmo com
+            chamadas simultâneas de várias threads).
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.instance is None:
+                started = time.perf_counter()
+                entry.instance = entry.loader()
+                entry.load_seconds = time.perf_counter() - started
+                entry.loads += 1
+                entry.loaded_by = threading.current_thread().name
+                logger.info(f"[ModelRegistry] Modelo '{name}' carregado em {entry.load_seconds:.2f}s "
+                            f"({entry.loaded_by}).")
+            entry.last_used = time.monotonic()
+            return entry.instance
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entry(name).instance is not None
+
+    def unload(self, name: str) -> bool:
+        """
+        Descarta a instância do modelo (quem ainda a estiver usando continua funcionando).
+        Returns:
+            bool: True se o modelo estava carregado.
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.instance is None:
+                return False
+            entry.instance = None
+        gc.collect()
+        logger.info(f"[ModelRegistry] Modelo '{name}' descartado.")
+        return True
+
+    def unload_idle(self) -> list:
+        """
+        Descarta os modelos com idle_timeout que não são usados há mais tempo que ele.
+        Returns:
+            list: Nomes dos modelos descartados.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.values())
+        idle = [entry.name for entry in entries
+                if entry.idle_timeout is not None and entry.instance is not None
+                and now - entry.last_used > entry.idle_timeout]
+        return [name for name in idle if self.unload(name)]
+
+    def start_idle_reaper(self, interval: float = IDLE_CHECK_INTERVAL):
+        """
+        Inicia (uma única vez) a thread que descarta periodicamente os modelos ociosos.
+        """
+        with self._lock:
+            if self._reaper is not None:
+                return
+
+            def run():
+                while not self._stop.wait(interval):
+                    try:
+                        self.unload_idle()
+                    except Exception as e:
+                        logger.error(f"[ModelRegistry] Erro ao descartar modelos ociosos: {str(e)}")
+
+            self._reaper = threading.Thread(target=run, name="model-idle-reaper", daemon=True)
+            self._reaper.start()
+
+    def warm_up(self, names: list, background: bool = True):
+        """
+        Carrega os modelos informados, por padrão em uma thread em segundo plano, para
+        que o primeiro uso não espere pela carga. Falhas são registradas no log e o
+        modelo volta a ser tentado no primeiro get().
+        Returns:
+            threading.Thread | None: A thread de pré-aquecimento (None se background=False).
+        """
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logger.error(f"[ModelRegistry] Falha no pré-aquecimento de '{name}': {str(e)}", exc_info=True)
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def mark(self, phase: str):
+        """
+        Marca o fim de uma etapa da inicialização (ex.: "importações", "interface").
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self._phases.append((phase, now - self._last_mark))
+            self._last_mark = now
+
+    def startup_report(self) -> dict:
+        """
+        Returns:
+            dict: phases (etapa, segundos) na ordem marcada, models (nome, carregado,
+            segundos da última carga, quantidade de cargas, thread que carregou) e
+            total (segundos desde a importação do registro até a última etapa).
+        """
+        with self._lock:
+            phases = list(self._phases)
+            entries = list(self._entries.values())
+            total = self._last_mark - _PROCESS_STARTED
+        models = [{"name": entry.name, "loaded": entry.instance is not None, "seconds": entry.load_seconds,
+                   "loads": entry.loads, "loaded_by": entry.loaded_by} for entry in entries]
+        return {"phases": phases, "models": models, "total": total}
+
+    def log_startup_report(self):
+        """
+        Registra no log o relatório de inicialização.
+        """
+        report = self.startup_report()
+        for phase, seconds in report["phases"]:
+            logger.info(f"[startup] {phase}: {seconds:.2f}s")
+        logger.info(f"[startup] Total até a última etapa: {report['total']:.2f}s")
+        for model in report["models"]:
+            if model["seconds"] is None:
+                logger.info(f"[startup] Modelo '{model['name']}': ainda não carregado")
+            else:
+                logger.info(f"[startup] Modelo '{model['name']}': {model['seconds']:.2f}s "
+                            f"({model['loaded_by']}, {model['loads']} carga(s))")
+
+
+# Registro compartilhado pelo processo
+models = ModelRegistry()
@@ -0,0 +1,302 @@
+# onnx_backend.py - Backend ONNX Runtime (com quantização int8 dinâmica) para o modelo de embedding em CPU
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import json
+import logging
+import os
+import time
+import numpy as np
+from config import BASE_CHROMA_PERSIST_DIR, EMBEDDING_MODEL_NAME
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Pasta dos modelos exportados (uma subpasta por modelo)
+ONNX_MODEL_DIR = os.path.join(BASE_CHROMA_PERSIST_DIR, "_modelos_onnx")
+ONNX_FP32_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model.int8.onnx"
+ONNX_CONFIG_FILENAME = "encoder.json"
+ONNX_OPSET = 14
+
+# Concordância mínima (cosseno entre os embeddings do PyTorch e do ONNX) para usar o modelo exportado
+AGREEMENT_MIN_COSINE = 0.98
+
+# Frases usadas na verificação de concordância e no benchmark quando nenhuma é informada
+SAMPLE_TEXTS = [
+    "Boletim de ocorrência registrado na delegacia sobre o desaparecimento.",
+    "Foi vista pela última vez na rodoviária usando camiseta azul e mochila preta.",
+    "Telefone de contato da família: (41) 99999-1234.",
+    "A criança tem uma cicatriz no braço esquerdo e cabelos castanhos cacheados.",
+    "Relato de avistamento próximo ao terminal de ônibus no bairro Boqueirão.",
+    "Documento de identidade RG 12.345.678-9 emitido no Paraná.",
+    "O idoso sofre de Alzheimer e pode não saber informar o próprio nome.",
+    "Mensagem recebida pela central de denúncias na madrugada de sábado.",
+    "Fotografia anexada ao processo mostra a pessoa com óculos de grau.",
+    "Carro prata visto na estrada com placa parcialmente ilegível.",
+    "Ela trabalhava como atendente em uma padaria no centro da cidade.",
+    "Os vizinhos informaram que ouviram uma discussão antes do desaparecimento.",
+]
+
+
+def model_dir(model_name: str = EMBEDDING_MODEL_NAME) -> str:
+    """
+    Returns:
+        str: Pasta do modelo exportado.
+    """
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace('/', '__'))
+
+
+def _cosines(a, b):
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    norms[norms == 0] = 1.0
+    return (a * b).sum(axis=1) / norms
+
+
+def compare_embeddings(reference, candidate) -> dict:
+    """
+    Compara dois conjuntos de embeddings dos mesmos textos.
+    Returns:
+        dict: mean_cosine e min_cosine entre os pares, e top1_agreement (fração dos
+        textos cujo vizinho mais próximo entre os demais é o mesmo nos dois conjuntos).
+    """
+    reference, candidate = np.asarray(reference, dtype=np.float32), np.asarray(candidate, dtype=np.float32)
+    cosines = _cosines(reference, candidate)
+
+    def neighbours(embeddings):
+        normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        similarity = normalized @ normalized.T
+        np.fill_diagonal(similarity, -np.inf)
+        return similarity.argmax(axis=1)
+
+    agreement = float((neighbours(reference) == neighbours(candidate)).mean()) if len(reference) > 1 else 1.0
+    return {"mean_cosine": float(cosines.mean()), "min_cosine": float(cosines.min()), "top1_agreement": agreement}
+
+
+def export_onnx_model(model_name: str = EMBEDDING_MODEL_NAME, quantize: bool = True, texts: list = None) -> dict:
+    """
+    Exporta o transformer do SentenceTransformer para ONNX (pooling e normalização
+    são refeitos em numpy pelo OnnxEncoder), gera a versão com quantização int8
+    dinâmica dos pesos e verifica a concordância com o modelo PyTorch.
+    Args:
+        model_name (str): Modelo SentenceTransformer.
+        quantize (bool): Se True, gera também o modelo int8.
+        texts (list, opcional): Textos da verificação (padrão: SAMPLE_TEXTS).
+    Returns:
+        dict: Configuração gravada em encoder.json, com a concordância de cada variante.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    pooling = next((module for module in st_model if type(module).__name__ == "Pooling"), None)
+    pooling_mode = "cls" if pooling is not None and getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st_model.max_seq_length,
+        "pooling": pooling_mode,
+        "normalize": any(type(module).__name__ == "Normalize" for module in st_model),
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "agreement": {},
+    }
+
+    class _LastHiddenState(torch.nn.Module):
+        # Exporta só a saída usada no pooling
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(["exemplo de texto para exportação"], return_tensors="pt")
+    token_type_ids = sample.get("token_type_ids", torch.zeros_like(sample["input_ids"]))
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(out_dir, ONNX_FP32_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer), (sample["input_ids"], sample["attention_mask"], token_type_ids),
+            fp32_path, input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names},
+                          "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=ONNX_OPSET)
+    tokenizer.save_pretrained(out_dir)
+
+    variants = {"fp32": fp32_path}
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(out_dir, ONNX_INT8_FILENAME)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        variants["int8"] = int8_path
+
+    with open(os.path.join(out_dir, ONNX_CONFIG_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    # Concordância numérica com o modelo PyTorch original
+    texts = texts or SAMPLE_TEXTS
+    reference = st_model.encode(texts)
+    for variant in variants:
+        encoder = OnnxEncoder(out_dir, quantized=(variant == "int8"))
+        config["agreement"][variant] = compare_embeddings(reference, encoder.encode(texts))
+        logger.info(f"[export_onnx_model] {model_name} ({variant}): {config['agreement'][variant]}")
+    with open(os.path.join(out_dir, ONNX_CONFIG_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return config
+
+
+class OnnxEncoder:
+    """
+    Substituto do SentenceTransformer para inferência em CPU com ONNX Runtime.
+    Expõe a parte da interface usada no projeto: encode(), tokenizer, max_seq_length
+    e get_sentence_embedding_dimension().
+    """
+
+    def __init__(self, path: str, quantized: bool = True, threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, ONNX_CONFIG_FILENAME), encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.quantized = quantized
+        self.max_seq_length = self.config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = ONNX_INT8_FILENAME if quantized else ONNX_FP32_FILENAME
+        self.session = ort.InferenceSession(os.path.join(path, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = {inp.name for inp in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts: list):
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                 return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in ("input_ids", "attention_mask")}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = encoded.get("token_type_ids", np.zeros_like(encoded["input_ids"])).astype(np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        """
+        Codifica um texto ou uma lista de textos (mesma assinatura básica do SentenceTransformer).
+        Os textos são ordenados por tamanho antes de formar os lotes, para reduzir o padding.
+        Returns:
+            numpy.ndarray: Vetor (texto único) ou matriz (lista de textos).
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts])
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            embeddings[positions] = self._encode_batch([texts[i] for i in positions])
+        return embeddings[0] if single else embeddings
+
+
+def load_onnx_encoder(model_name: str = EMBEDDING_MODEL_NAME, quantized: bool = True) -> OnnxEncoder:
+    """
+    Carrega o modelo exportado, exportando-o antes se necessário. Recusa o modelo se
+    a concordância registrada na exportação ficou abaixo de AGREEMENT_MIN_COSINE.
+    """
+    path = model_dir(model_name)
+    if not os.path.exists(os.path.join(path, ONNX_CONFIG_FILENAME)):
+        logger.info(f"[load_onnx_encoder] Exportando {model_name} para ONNX em {path}.")
+        export_onnx_model(model_name, quantize=True)
+    encoder = OnnxEncoder(path, quantized=quantized)
+    agreement = encoder.config.get("agreement", {}).get("int8" if quantized else "fp32")
+    if agreement is None or agreement["min_cosine"] < AGREEMENT_MIN_COSINE:
+        raise RuntimeError(f"Modelo ONNX de {model_name} sem concordância suficiente com o PyTorch: {agreement}")
+    return encoder
+
+
+def current_rss_mb():
+    """
+    Returns:
+        float | None: Memória residente do processo em MB (psutil, ou /proc no Linux).
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return None
+
+
+def benchmark_backends(texts: list = None, batch_size: int = 64, repeat: int = 3, latency_queries: int = 50,
+                       model_name: str = EMBEDDING_MODEL_NAME) -> list:
+    """
+    Compara em CPU o PyTorch (fp32) e o ONNX Runtime (fp32 e int8): vazão em lote,
+    latência de consultas isoladas, memória residente acrescentada pela carga e
+    concordância com o PyTorch. Os backends são carregados em sequência no mesmo
+    processo, então a memória é o acréscimo de RSS de cada carga.
+    Returns:
+        list: Um dicionário por backend com backend, load_seconds, rss_mb,
+        texts_per_second, p50_ms, p95_ms e agreement.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or SAMPLE_TEXTS * 20
+    queries = (texts * (latency_queries // max(len(texts), 1) + 1))[:latency_queries]
+
+    def measure(name, load):
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        model = load()
+        load_seconds = time.perf_counter() - started
+        rss_after = current_rss_mb()
+        model.encode(texts[:batch_size], batch_size=batch_size)  # aquecimento
+        started = time.perf_counter()
+        for _ in range(repeat):
+            embeddings = model.encode(texts, batch_size=batch_size)
+        throughput = len(texts) * repeat / (time.perf_counter() - started)
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            model.encode(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return model, embeddings, {
+            "backend": name, "load_seconds": load_seconds,
+            "rss_mb": None if rss_before is None else rss_after - rss_before,
+            "texts_per_second": throughput,
+            "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95)),
+        }
+
+    _, reference, pytorch = measure("pytorch", lambda: SentenceTransformer(model_name, device="cpu"))
+    pytorch["agreement"] = None
+    report = [pytorch]
+    if not os.path.exists(os.path.join(model_dir(model_name), ONNX_CONFIG_FILENAME)):
+        export_onnx_model(model_name)
+    for name, quantized in (("onnx-fp32", False), ("onnx-int8", True)):
+        _, embeddings, entry = measure(name, lambda: OnnxEncoder(model_dir(model_name), quantized=quantized))
+        entry["agreement"] = compare_embeddings(reference, embeddings)
+        report.append(entry)
+    return report
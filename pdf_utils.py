@@ -8,54 +8,163 @@
 import PyPDF2
 import logging
 import os
-from typing import List
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterator, List
 import pikepdf
-import io
 
 # Configuração do logger para este módulo
 logger = logging.getLogger(__name__)
 
-def process_pdf(file_path: str) -> List[str]:
+# PDFs com pelo menos esta quantidade de páginas são extraídos em paralelo
+PARALLEL_PAGE_THRESHOLD = 200
+# Quantidade de páginas extraídas por cada tarefa do pool
+PAGES_PER_RANGE = 50
+# Intervalo (segundos) entre verificações de cancelamento enquanto uma faixa é extraída
+CANCEL_POLL_SECONDS = 0.5
+
+
+def _decrypted_copy(file_path: str) -> str:
     """
-    Processa um arquivo PDF e extrai o texto de todas as páginas.
-    Funciona com PDFs protegidos e não protegidos.
+    Usa o pikepdf para gravar uma cópia sem criptografia do PDF em um arquivo
+    temporário (em disco, não em memória). Também recupera alguns PDFs corrompidos.
+
+    Args:
+        file_path (str): Caminho do PDF original.
+
+    Returns:
+        str: Caminho da cópia temporária; deve ser removida por quem chamou.
+    """
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        with pikepdf.Pdf.open(file_path) as pdf:
+            pdf.save(temp_path)
+        return temp_path
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def _readable_path(file_path: str):
+    """
+    Retorna um caminho que o PyPDF2 consegue ler diretamente. O round-trip pelo
+    pikepdf só é feito para PDFs criptografados ou que o PyPDF2 não abre.
+
+    Returns:
+        tuple: (caminho legível, quantidade de páginas, caminho temporário ou None).
+    """
+    try:
+        with open(file_path, 'rb') as pdf_file:
+            reader = PyPDF2.PdfReader(pdf_file)
+            if not reader.is_encrypted:
+                return file_path, len(reader.pages), None
+    except PyPDF2.errors.PdfReadError as e:
+        logger.warning(f"PyPDF2 não abriu {file_path} ({e}); tentando recuperar com pikepdf.")
+    temp_path = _decrypted_copy(file_path)
+    with open(temp_path, 'rb') as pdf_file:
+        num_pages = len(PyPDF2.PdfReader(pdf_file).pages)
+    return temp_path, num_pages, temp_path
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Extrai o texto das páginas [start, end) de um PDF legível pelo PyPDF2.
+    Executada nos processos do pool na extração paralela.
+    """
+    pages_text = []
+    with open(file_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        for index in range(start, end):
+            text = pdf_reader.pages[index].extract_text()
+            if text and text.strip():
+                pages_text.append(text)
+    return pages_text
+
+
+def _default_page_workers() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def iter_pdf_pages(file_path: str, workers: int = None, cancel_check=None) -> Iterator[str]:
+    """
+    Gera o texto das páginas de um PDF à medida que são extraídas.
+
+    PDFs pequenos são lidos página a página no próprio processo. PDFs grandes são
+    divididos em faixas de páginas extraídas em paralelo por um pool de processos;
+    as faixas são devolvidas na ordem original assim que cada uma fica pronta, e só
+    algumas ficam em memória ao mesmo tempo. Dentro de um processo filho (ex.: pool
+    da ingestão em massa) a extração é sempre sequencial.
 
     Args:
         file_path (str): Caminho completo para o arquivo PDF.
+        workers (int, opcional): Processos da extração paralela (padrão: núcleos - 1).
+        cancel_check (callable, opcional): Chamado a cada página e, na extração
+            paralela, enquanto se espera cada faixa; lança uma exceção para interromper.
 
     Returns:
-        List[str]: Uma lista onde cada elemento é o texto extraído de uma página do PDF.
+        Iterator[str]: Texto de cada página não vazia, na ordem do documento.
     """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"O arquivo PDF não foi encontrado: {file_path}")
+
+    readable_path, num_pages, temp_path = _readable_path(file_path)
     try:
-        # Verifica se o arquivo existe
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"O arquivo PDF não foi encontrado: {file_path}")
-
-        # Lista para armazenar o texto de cada página
-        pages_text = []
-
-        # Tenta abrir o PDF com pikepdf primeiro (para PDFs protegidos)
-        try:
-            with pikepdf.Pdf.open(file_path) as pdf:
-                # Converte o pikepdf.Pdf para um objeto que PyPDF2 pode ler
-                pdf_bytes = io.BytesIO(pdf.save())
-                pdf_reader = PyPDF2.PdfReader(pdf_bytes)
-                for page in pdf_reader.pages:
-                    text = page.extract_text()
-                    if text.strip():
-                        pages_text.append(text)
-        except Exception as e:
-            # Se falhar com pikepdf, tenta abrir normalmente com PyPDF2
-            with open(file_path, 'rb') as pdf_file:
+        workers = workers or _default_page_workers()
+        in_child_process = multiprocessing.parent_process() is not None
+        if num_pages < PARALLEL_PAGE_THRESHOLD or workers == 1 or in_child_process:
+            with open(readable_path, 'rb') as pdf_file:
                 pdf_reader = PyPDF2.PdfReader(pdf_file)
                 for page in pdf_reader.pages:
+                    if cancel_check:
+                        cancel_check()
                     text = page.extract_text()
-                    if text.strip():
-                        pages_text.append(text)
+                    if text and text.strip():
+                        yield text
+            return
+
+        ranges = [(start, min(start + PAGES_PER_RANGE, num_pages))
+                  for start in range(0, num_pages, PAGES_PER_RANGE)]
+        window = workers * 2
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+            futures = {}
+            try:
+                for index in range(len(ranges)):
+                    # Mantém o pool abastecido algumas faixas à frente do consumidor
+                    for ahead in range(index, min(index + window, len(ranges))):
+                        if ahead not in futures:
+                            futures[ahead] = executor.submit(_extract_page_range, readable_path, *ranges[ahead])
+                    future = futures.pop(index)
+                    while cancel_check:
+                        try:
+                            future.result(timeout=CANCEL_POLL_SECONDS)
+                            break
+                        except FutureTimeoutError:
+                            cancel_check()
+                    for text in future.result():
+                        yield text
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if temp_path:
+            os.remove(temp_path)
 
-        # Retorna a lista com o texto de todas as páginas
-        return pages_text
 
+def process_pdf(file_path: str) -> List[str]:
+    """
+    Processa um arquivo PDF e extrai o texto de todas as páginas.
+    Funciona com PDFs protegidos e não protegidos.
+
+    Args:
+        file_path (str): Caminho completo para o arquivo PDF.
+
+    Returns:
+        List[str]: Uma lista onde cada elemento é o texto extraído de uma página do PDF.
+    """
+    try:
+        return list(iter_pdf_pages(file_path))
     except Exception as e:
         # Captura quaisquer erros que possam ocorrer
         logger.error(f"Erro ao processar o PDF {file_path}: {str(e)}", exc_info=True)
@@ -0,0 +1,520 @@
+# quantized_store.py - Busca vetorial compacta com embeddings quantizados (float16 ou int8)
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import logging
+import threading
+import numpy as np
+from chroma_registry import get_registry
+from answer_cache import get_answer_cache
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Tipos de quantização suportados
+QUANTIZATION_FLOAT16 = "float16"
+QUANTIZATION_INT8 = "int8"
+QUANTIZATIONS = (QUANTIZATION_FLOAT16, QUANTIZATION_INT8)
+
+# Pasta, dentro do repositório ChromaDB, onde os índices quantizados são gravados
+QUANTIZED_DIRNAME = "_quantizado"
+
+# Candidatos reavaliados com os embeddings float32 originais, por resultado pedido
+RESCORE_FACTOR = 4
+
+# Linhas convertidas para float32 por vez durante a busca (limita a memória temporária)
+SCORE_BLOCK_ROWS = 65536
+
+# Tamanho das páginas lidas do ChromaDB na construção do índice
+READ_PAGE_SIZE = 1000
+
+
+def quantize(embeddings, kind: str):
+    """
+    Quantiza uma matriz de embeddings float32.
+    float16: conversão direta (metade da memória).
+    int8: quantização escalar simétrica por vetor (um quarto da memória, mais uma
+    escala float32 por vetor): v ~ escala * códigos, com códigos em [-127, 127].
+    Args:
+        embeddings (numpy.ndarray): Matriz (n, d) float32.
+        kind (str): QUANTIZATION_FLOAT16 ou QUANTIZATION_INT8.
+    Returns:
+        tuple: (códigos, escalas) — escalas é None em float16.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if kind == QUANTIZATION_FLOAT16:
+        return embeddings.astype(np.float16), None
+    if kind == QUANTIZATION_INT8:
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Quantização desconhecida: {kind} (use {QUANTIZATIONS})")
+
+
+def dequantize(codes, scales=None):
+    """
+    Returns:
+        numpy.ndarray: Embeddings float32 aproximados a partir dos códigos.
+    """
+    values = codes.astype(np.float32)
+    return values * scales[:, None] if scales is not None else values
+
+
+def exact_distances(query, embeddings, space: str = "l2"):
+    """
+    Distâncias na métrica do ChromaDB: l2 ao quadrado (padrão) ou cosseno.
+    """
+    if space == "cosine":
+        norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        return 1.0 - embeddings @ query / norms
+    return (embeddings * embeddings).sum(axis=1) - 2.0 * (embeddings @ query) + float(query @ query)
+
+
+class QuantizedIndex:
+    """
+    Cópia compacta dos embeddings de uma coleção do ChromaDB, mantida em memória e
+    gravada em disco (.npz), para busca por força bruta com operações de matriz.
+    Guarda só ids, códigos quantizados, escalas e o desaparecido de cada chunk; os
+    textos, metadados e embeddings float32 continuam no ChromaDB e só são lidos para
+    os candidatos finais (e para a reavaliação exata, se pedida).
+    """
+
+    def __init__(self, ids, codes, scales, persons, kind: str, space: str = "l2", stamp: str = ""):
+        self.ids = np.asarray(ids)
+        self.codes = codes
+        self.scales = scales
+        self.persons = np.asarray(persons)
+        self.kind = kind
+        self.space = space
+        self.stamp = stamp
+        # Termos constantes da distância l2/cosseno de cada vetor quantizado
+        self._norms_sq = np.zeros(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+            block = dequantize(self.codes[start:start + SCORE_BLOCK_ROWS],
+                               None if scales is None else scales[start:start + SCORE_BLOCK_ROWS])
+            self._norms_sq[start:start + SCORE_BLOCK_ROWS] = (block * block).sum(axis=1)
+
+    @classmethod
+    def build(cls, collection, kind: str, stamp: str = ""):
+        """
+        Constrói o índice lendo, em páginas, os embeddings gravados na coleção.
+        """
+        ids, persons, blocks = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=['embeddings', 'metadatas'], limit=READ_PAGE_SIZE, offset=offset)
+            if not page['ids']:
+                break
+            ids.extend(page['ids'])
+            persons.extend((meta or {}).get('autor', '') for meta in page['metadatas'])
+            blocks.append(np.asarray(page['embeddings'], dtype=np.float32))
+            if len(page['ids']) < READ_PAGE_SIZE:
+                break
+            offset += READ_PAGE_SIZE
+        embeddings = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        codes, scales = quantize(embeddings, kind)
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        return cls(ids, codes, scales, persons, kind, space=space, stamp=stamp)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path, allow_pickle=False)
+        scales = data['scales'] if data['scales'].size else None
+        return cls(data['ids'], data['codes'], scales, data['persons'], str(data['kind']),
+                   space=str(data['space']), stamp=str(data['stamp']))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Grava em um arquivo temporário e renomeia, para não deixar um índice truncado
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, ids=self.ids, codes=self.codes,
+                 scales=self.scales if self.scales is not None else np.zeros(0, dtype=np.float32),
+                 persons=self.persons, kind=self.kind, space=self.space, stamp=self.stamp)
+        os.replace(tmp_path, path)
+
+    def nbytes(self) -> int:
+        """
+        Returns:
+            int: Memória ocupada pelos vetores quantizados e escalas.
+        """
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def search(self, query, n_results: int, person: str = None) -> tuple:
+        """
+        Busca os vetores mais próximos da consulta nos códigos quantizados.
+        Args:
+            query (list): Embedding da consulta.
+            n_results (int): Quantidade de candidatos.
+            person (str, opcional): Restringe aos chunks do desaparecido (coleção global).
+        Returns:
+            tuple: (ids, distâncias aproximadas), do mais próximo para o mais distante.
+        """
+        if len(self.ids) == 0:
+            return [], []
+        query = np.asarray(query, dtype=np.float32)
+        distances = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            dots = self.codes[start:end].astype(np.float32) @ query
+            if self.scales is not None:
+                dots *= self.scales[start:end]
+            if self.space == "cosine":
+                norms = np.sqrt(self._norms_sq[start:end]) * (np.linalg.norm(query) or 1.0)
+                norms[norms == 0] = 1.0
+                distances[start:end] = 1.0 - dots / norms
+            else:
+                distances[start:end] = self._norms_sq[start:end] - 2.0 * dots + float(query @ query)
+        if person:
+            distances[self.persons != person] = np.inf
+        n_results = min(n_results, len(self.ids))
+        top = np.argpartition(distances, n_results - 1)[:n_results]
+        top = top[np.argsort(distances[top])]
+        top = top[np.isfinite(distances[top])]
+        return self.ids[top].tolist(), distances[top].tolist()
+
+    def search_batch(self, queries, n_results: int, person: str = None) -> list:
+        """
+        Busca várias consultas de uma vez: as distâncias de todas as consultas a um
+        bloco de vetores saem de uma única multiplicação de matrizes. Só os n_results
+        melhores de cada consulta são mantidos entre os blocos (a memória temporária é
+        de consultas x SCORE_BLOCK_ROWS, e não consultas x vetores).
+        Args:
+            queries (list): Embeddings das consultas.
+            n_results (int): Quantidade de candidatos por consulta.
+            person (str, opcional): Restringe aos chunks do desaparecido (coleção global).
+        Returns:
+            list: Uma tupla (ids, distâncias aproximadas) por consulta.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self.ids) == 0 or len(queries) == 0:
+            return [([], []) for _ in range(len(queries))]
+        query_norms_sq = (queries * queries).sum(axis=1)
+        n_results = min(n_results, len(self.ids))
+        rows = np.arange(len(queries))[:, None]
+        # Melhores até o momento de cada consulta: distâncias e posições no índice
+        best_distances = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_positions = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, len(self.ids))
+            dots = queries @ self.codes[start:end].astype(np.float32).T
+            if self.scales is not None:
+                dots *= self.scales[start:end][None, :]
+            if self.space == "cosine":
+                norms = np.sqrt(query_norms_sq)[:, None] * np.sqrt(self._norms_sq[start:end])[None, :]
+                norms[norms == 0] = 1.0
+                distances = 1.0 - dots / norms
+            else:
+                distances = self._norms_sq[start:end][None, :] - 2.0 * dots + query_norms_sq[:, None]
+            if person:
+                distances[:, self.persons[start:end] != person] = np.inf
+            # Top-k do bloco, combinado com o top-k acumulado
+            keep = min(n_results, end - start)
+            block_top = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+            merged_distances = np.concatenate([best_distances, distances[rows, block_top]], axis=1)
+            merged_positions = np.concatenate([best_positions, block_top + start], axis=1)
+            keep = min(n_results, merged_distances.shape[1])
+            top = np.argpartition(merged_distances, keep - 1, axis=1)[:, :keep]
+            best_distances = merged_distances[rows, top]
+            best_positions = merged_positions[rows, top]
+        results = []
+        for row_distances, row_positions in zip(best_distances, best_positions):
+            order = np.argsort(row_distances)
+            order = order[np.isfinite(row_distances[order])]
+            results.append((self.ids[row_positions[order]].tolist(), row_distances[order].tolist()))
+        return results
+
+
+# Índices carregados no processo, por coleção e tipo de quantização (arquivo do índice)
+_indexes = {}
+_indexes_lock = threading.Lock()
+# Travas de construção por arquivo do índice: uma construção não bloqueia as consultas
+# às outras coleções
+_path_locks = {}
+# Índices sendo reconstruídos em segundo plano
+_rebuilding = set()
+
+
+def index_path(store_name: str, collection_name: str, kind: str, registry=None) -> str:
+    """
+    Returns:
+        str: Arquivo do índice quantizado de uma coleção.
+    """
+    registry = registry or get_registry()
+    return os.path.join(registry.client_path(store_name), QUANTIZED_DIRNAME, f"{collection_name}.{kind}.npz")
+
+
+def _stamp(collection, store_name: str) -> str:
+    # Muda quando a coleção é alterada, independentemente de quem consulta: quantidade de
+    # chunks, contador de alterações da coleção no repositório (incrementado a cada
+    # ingestão, ver vector_store.notify_collection_changed) e modelo de embedding
+    version = get_answer_cache().versions(store_name, [collection.name])[collection.name]
+    metadata = collection.metadata or {}
+    return f"{collection.count()}:{version}:{metadata.get('embedding_model')}@{metadata.get('embedding_version')}"
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _indexes_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def _build(collection, store_name: str, kind: str, path: str, stamp: str) -> QuantizedIndex:
+    # Chamado com a trava do arquivo (_path_lock)
+    index = QuantizedIndex.build(collection, kind, stamp=stamp)
+    index.save(path)
+    with _indexes_lock:
+        _indexes[path] = index
+    logger.info(f"[get_quantized_index] Índice {kind} de {store_name}/{collection.name} construído "
+                f"({len(index.ids)} vetores, {index.nbytes() / 1e6:.1f} MB).")
+    return index
+
+
+def _rebuild_in_background(collection, store_name: str, kind: str, path: str):
+    """
+    Reconstrói o índice em uma thread, até que ele corresponda ao estado atual da
+    coleção (ingestões feitas durante a construção geram uma nova passada). Uma única
+    reconstrução por índice fica em andamento.
+    """
+    with _indexes_lock:
+        if path in _rebuilding:
+            return
+        _rebuilding.add(path)
+
+    def run():
+        try:
+            while True:
+                stamp = _stamp(collection, store_name)
+                with _indexes_lock:
+                    current = _indexes.get(path)
+                if current is not None and current.stamp == stamp:
+                    return
+                with _path_lock(path):
+                    _build(collection, store_name, kind, path, stamp)
+        except Exception as e:
+            logger.error(f"[get_quantized_index] Falha ao reconstruir o índice {path}: {str(e)}", exc_info=True)
+        finally:
+            with _indexes_lock:
+                _rebuilding.discard(path)
+
+    threading.Thread(target=run, name="quantized-rebuild", daemon=True).start()
+
+
+def get_quantized_index(collection, store_name: str, kind: str, registry=None) -> QuantizedIndex:
+    """
+    Retorna o índice quantizado da coleção, carregando-o do disco ou, na primeira
+    vez, construindo-o. Quando a coleção foi alterada desde a última construção (ex.:
+    uma ingestão), o índice anterior continua sendo usado enquanto o novo é construído
+    em segundo plano: a consulta não espera a leitura de todos os embeddings (na
+    coleção global, de todos os desaparecidos). Nesse intervalo, chunks removidos são
+    descartados na leitura dos candidatos e os recém-gravados ainda não aparecem.
+    Args:
+        collection: Coleção do ChromaDB.
+        store_name (str): Repositório onde a coleção está gravada.
+        kind (str): QUANTIZATION_FLOAT16 ou QUANTIZATION_INT8.
+    """
+    path = index_path(store_name, collection.name, kind, registry)
+    stamp = _stamp(collection, store_name)
+    with _indexes_lock:
+        index = _indexes.get(path)
+    if index is None:
+        with _path_lock(path):
+            with _indexes_lock:
+                index = _indexes.get(path)
+            if index is None and os.path.exists(path):
+                try:
+                    index = QuantizedIndex.load(path)
+                    with _indexes_lock:
+                        _indexes[path] = index
+                except Exception as e:
+                    logger.warning(f"[get_quantized_index] Índice {path} ilegível, reconstruindo: {str(e)}")
+            if index is None:
+                return _build(collection, store_name, kind, path, stamp)
+    if index.stamp != stamp:
+        _rebuild_in_background(collection, store_name, kind, path)
+    return index
+
+
+def quantized_query(collection, store_name: str, query_embedding, n_results: int, kind: str,
+                    rescore: bool = True, person: str = None, registry=None) -> list:
+    """
+    Busca na coleção usando o índice quantizado. Com rescore, os RESCORE_FACTOR *
+    n_results melhores candidatos são reavaliados com os embeddings float32 gravados
+    no ChromaDB, recuperando a ordem exata entre eles.
+    Returns:
+        list: Dicionários com id, document, metadata e distance (formato de search_all, sem collection).
+    """
+    index = get_quantized_index(collection, store_name, kind, registry)
+    n_candidates = n_results * RESCORE_FACTOR if rescore else n_results
+    ids, distances = index.search(query_embedding, n_candidates, person=person)
+    if not ids:
+        return []
+    include = ['documents', 'metadatas'] + (['embeddings'] if rescore else [])
+    found = collection.get(ids=ids, include=include)
+    if rescore:
+        exact = exact_distances(np.asarray(query_embedding, dtype=np.float32),
+                                np.asarray(found['embeddings'], dtype=np.float32), index.space)
+        distance_by_id = dict(zip(found['ids'], exact.tolist()))
+    else:
+        distance_by_id = dict(zip(ids, distances))
+    hits = [{"id": chunk_id, "document": doc, "metadata": meta or {}, "distance": distance_by_id[chunk_id]}
+            for chunk_id, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])]
+    hits.sort(key=lambda hit: hit['distance'])
+    return hits[:n_results]
+
+
+def quantized_query_batch(collection, store_name: str, query_embeddings, n_results: int, kind: str,
+                           rescore: bool = True, person: str = None, registry=None) -> list:
+    """
+    Versão de quantized_query para várias consultas: uma busca em matriz no índice
+    quantizado e uma única leitura no ChromaDB dos candidatos de todas as consultas.
+    Returns:
+        list: Para cada consulta, a lista de resultados (ver quantized_query).
+    """
+    index = get_quantized_index(collection, store_name, kind, registry)
+    n_candidates = n_results * RESCORE_FACTOR if rescore else n_results
+    candidates = index.search_batch(query_embeddings, n_candidates, person=person)
+    unique_ids = list(dict.fromkeys(chunk_id for ids, _ in candidates for chunk_id in ids))
+    if not unique_ids:
+        return [[] for _ in candidates]
+    include = ['documents', 'metadatas'] + (['embeddings'] if rescore else [])
+    found = collection.get(ids=unique_ids, include=include)
+    rows = {chunk_id: position for position, chunk_id in enumerate(found['ids'])}
+    stored = np.asarray(found['embeddings'], dtype=np.float32) if rescore else None
+
+    results = []
+    for query, (ids, distances) in zip(np.asarray(query_embeddings, dtype=np.float32), candidates):
+        ids = [chunk_id for chunk_id in ids if chunk_id in rows]
+        if rescore and ids:
+            distances = exact_distances(query, stored[[rows[chunk_id] for chunk_id in ids]], index.space).tolist()
+        hits = [{"id": chunk_id, "document": found['documents'][rows[chunk_id]],
+                 "metadata": found['metadatas'][rows[chunk_id]] or {}, "distance": distance}
+                for chunk_id, distance in zip(ids, distances)]
+        hits.sort(key=lambda hit: hit['distance'])
+        results.append(hits[:n_results])
+    return results
+
+
+def quantization_report(collection, kinds=QUANTIZATIONS, sample: int = 200, k: int = 10, seed: int = 0) -> list:
+    """
+    Mede a memória economizada e a revocação perdida pela quantização de uma coleção.
+    Consultas: embeddings de uma amostra dos próprios chunks (o chunk consultado é
+    excluído do resultado); referência: busca exata em float32 sobre os mesmos vetores.
+    Args:
+        collection: Coleção do ChromaDB.
+        kinds (tuple): Tipos de quantização avaliados.
+        sample (int): Quantidade de consultas.
+        k (int): Tamanho do top-k comparado.
+    Returns:
+        list: Um dicionário por tipo com kind, vectors, float32_mb (matriz float32 dos
+        embeddings), quantized_mb (mesma matriz quantizada), recall (sem reavaliação) e
+        recall_rescored (com reavaliação exata de RESCORE_FACTOR * k candidatos). O
+        efeito real no repositório (a cópia float32 continua no ChromaDB) é medido por
+        store_footprint.
+    """
+    blocks, offset = [], 0
+    while True:
+        page = collection.get(include=['embeddings'], limit=READ_PAGE_SIZE, offset=offset)
+        if not page['ids']:
+            break
+        blocks.append(np.asarray(page['embeddings'], dtype=np.float32))
+        if len(page['ids']) < READ_PAGE_SIZE:
+            break
+        offset += READ_PAGE_SIZE
+    embeddings = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    n = len(embeddings)
+    if n < 2:
+        return []
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(n, size=min(sample, n), replace=False)
+    k = min(k, n - 1)
+
+    def top(distances, size, exclude):
+        distances = distances.copy()
+        distances[exclude] = np.inf
+        idx = np.argpartition(distances, size - 1)[:size]
+        return idx[np.argsort(distances[idx])]
+
+    truth = {q: set(top(exact_distances(embeddings[q], embeddings, space), k, q).tolist()) for q in queries}
+    report = []
+    for kind in kinds:
+        codes, scales = quantize(embeddings, kind)
+        index = QuantizedIndex(np.arange(n), codes, scales, np.full(n, ''), kind, space=space)
+        approx_embeddings = dequantize(codes, scales)
+        hits = hits_rescored = 0
+        for q in queries:
+            approx = exact_distances(embeddings[q], approx_embeddings, space)
+            hits += len(truth[q] & set(top(approx, k, q).tolist()))
+            candidates = top(approx, min(k * RESCORE_FACTOR, n - 1), q)
+            rescored = candidates[np.argsort(exact_distances(embeddings[q], embeddings[candidates], space))][:k]
+            hits_rescored += len(truth[q] & set(rescored.tolist()))
+        total = len(queries) * k
+        report.append({
+            "kind": kind,
+            "vectors": n,
+            "float32_mb": embeddings.nbytes / 1e6,
+            "quantized_mb": index.nbytes() / 1e6,
+            "recall": hits / total,
+            "recall_rescored": hits_rescored / total,
+        })
+    return report
+
+
+def _dir_size(path: str, exclude: str = None) -> int:
+    # Bytes ocupados pelos arquivos da pasta (sem a subpasta exclude)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        if exclude:
+            dirs[:] = [name for name in dirs if name != exclude]
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def store_footprint(collection, store_name: str, kind: str, registry=None) -> dict:
+    """
+    Mede o efeito real da busca quantizada no repositório: o índice quantizado é uma
+    cópia adicional (os embeddings float32 e o índice HNSW continuam no ChromaDB),
+    então o disco cresce com o arquivo .npz e o processo passa a carregar os códigos
+    quantizados, em vez de ler os vetores float32 pela busca do ChromaDB.
+    Args:
+        collection: Coleção do ChromaDB.
+        store_name (str): Repositório onde a coleção está gravada.
+        kind (str): QUANTIZATION_FLOAT16 ou QUANTIZATION_INT8.
+    Returns:
+        dict: store_disk_mb (repositório ChromaDB, sem os índices quantizados),
+        index_disk_mb (arquivo do índice quantizado) e index_rss_mb (acréscimo de
+        memória residente ao carregar o índice; None sem psutil nem /proc). Um índice
+        construído só para a medição é apagado em seguida.
+    """
+    # Importado aqui: onnx_backend só é necessário para a medição de memória
+    from onnx_backend import current_rss_mb
+
+    registry = registry or get_registry()
+    path = index_path(store_name, collection.name, kind, registry)
+    existed = os.path.exists(path)
+    get_quantized_index(collection, store_name, kind, registry)
+    with _indexes_lock:
+        _indexes.pop(path, None)
+    before = current_rss_mb()
+    index = QuantizedIndex.load(path)
+    after = current_rss_mb()
+    footprint = {
+        "store_disk_mb": _dir_size(registry.client_path(store_name), exclude=QUANTIZED_DIRNAME) / 1e6,
+        "index_disk_mb": os.path.getsize(path) / 1e6,
+        "index_rss_mb": after - before if before is not None and after is not None else None,
+    }
+    if existed:
+        with _indexes_lock:
+            _indexes[path] = index
+    else:
+        os.remove(path)
+    return footprint
@@ -0,0 +1,194 @@
+# query_cache.py - Cache das consultas (embeddings e palavras-chave) no caminho de recuperação
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Limites dos caches de consulta: quantidade de entradas e validade (segundos)
+QUERY_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_TTL = 6 * 60 * 60
+
+# Quantidade de palavras-chave extraídas de cada consulta
+QUERY_KEYWORDS_TOP_N = 3
+
+# Stopwords usadas quando o corpus do NLTK não estiver disponível
+_FALLBACK_STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "em", "no", "na",
+    "nos", "nas", "por", "para", "com", "sem", "sobre", "entre", "e", "ou", "que", "se", "qual", "quais",
+    "quem", "onde", "quando", "como", "foi", "é", "ser", "ao", "aos", "à", "às", "seu", "sua", "seus",
+    "suas", "ele", "ela", "eles", "elas", "isso", "isto", "esse", "essa", "este", "esta", "há", "tem",
+}
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class QueryCache:
+    """
+    Cache LRU com validade (TTL), seguro para uso entre threads, com contadores de
+    acertos e falhas. Usado para os embeddings e as palavras-chave das consultas.
+    """
+
+    def __init__(self, name: str, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            O valor guardado, ou None se ausente ou expirado.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """
+        Retorna o valor guardado para key ou calcula, guarda e retorna compute().
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Tamanho, acertos, falhas e taxa de acerto do cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"cache": self.name, "entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+# Caches compartilhados por todas as funções de recuperação
+query_embedding_cache = QueryCache("embeddings de consulta")
+query_keyword_cache = QueryCache("palavras-chave de consulta")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normaliza a consulta para uso como chave (espaços e maiúsculas/minúsculas).
+    """
+    return ' '.join(text.split()).lower()
+
+
+def get_query_embedding(text: str, model) -> list:
+    """
+    Codifica a consulta com o modelo informado, reaproveitando o resultado de
+    consultas repetidas (mesmo texto, ignorando espaços e maiúsculas).
+    Args:
+        text (str): Consulta (ou trecho) a ser codificada.
+        model: Modelo de embedding.
+    Returns:
+        list: Embedding da consulta.
+    """
+    # Modelo, versão e backend (embedding_utils.load_embedding_model): a chave não muda
+    # com a recarga do mesmo modelo e nunca coincide entre modelos diferentes
+    key = (getattr(model, "embedding_model_key", None) or f"id:{id(model)}", normalize_query(text))
+    return query_embedding_cache.get_or_compute(key, lambda: model.encode(text).tolist())
+
+
+_stopwords = None
+_stopwords_lock = threading.Lock()
+
+
+def portuguese_stopwords() -> set:
+    """
+    Returns:
+        set: Stopwords em português (do NLTK, ou uma lista reduzida se o corpus não
+        estiver disponível), carregadas uma única vez.
+    """
+    global _stopwords
+    with _stopwords_lock:
+        if _stopwords is None:
+            try:
+                import nltk
+                from nltk.corpus import stopwords
+                try:
+                    _stopwords = set(stopwords.words('portuguese'))
+                except LookupError:
+                    # Corpus ausente: baixa uma única vez (antes era baixado a cada importação)
+                    nltk.download('stopwords', quiet=True)
+                    _stopwords = set(stopwords.words('portuguese'))
+            except Exception:
+                logger.warning("[query_cache] Stopwords do NLTK indisponíveis; usando lista reduzida.")
+                _stopwords = set(_FALLBACK_STOPWORDS)
+        return _stopwords
+
+
+def strip_accents(text: str) -> str:
+    """
+    Remove os acentos do texto (ex.: "São João" -> "Sao Joao").
+    """
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+
+def extract_query_keywords(query: str, top_n: int = QUERY_KEYWORDS_TOP_N) -> list:
+    """
+    Extração leve de palavras-chave da consulta, sem modelo: remove stopwords e
+    devolve os bigramas e palavras restantes, priorizando os termos mais longos
+    (em geral mais específicos, como nomes e lugares). O resultado fica em cache.
+    Args:
+        query (str): Consulta do usuário.
+        top_n (int): Quantidade de palavras-chave.
+    Returns:
+        list: Palavras-chave em minúsculas.
+    """
+    key = (normalize_query(query), top_n)
+    cached = query_keyword_cache.get(key)
+    if cached is not None:
+        return cached
+    stopwords = portuguese_stopwords()
+
+    words = [word for word in _WORD_RE.findall(query.lower()) if not word.isdigit()]
+    content = [word for word in words if word not in stopwords and strip_accents(word) not in stopwords
+               and len(word) > 2]
+    # Bigramas só de palavras consecutivas na consulta, como os candidatos do KeyBERT nos documentos
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:]) if a in content and b in content]
+    candidates = list(dict.fromkeys(bigrams + sorted(content, key=len, reverse=True)))
+    keywords = candidates[:top_n]
+    query_keyword_cache.put(key, keywords)
+    return keywords
+
+
+def cache_stats() -> list:
+    """
+    Returns:
+        list: Estatísticas (ver QueryCache.stats) de todos os caches de consulta.
+    """
+    return [query_embedding_cache.stats(), query_keyword_cache.stats()]
@@ -0,0 +1,565 @@
+# vector_store.py - Organização das coleções no ChromaDB (por arquivo, por desaparecido ou global)
+# Autor: Hercules Monteiro
+# Data: 17/10/2026
+# Versão: 1.0
+# ============================================================================
+# 1. IMPORTAÇÕES NECESSÁRIAS
+# ============================================================================
+import os
+import math
+import logging
+from config import (STORAGE_LAYOUT, CONSOLIDATED_COLLECTION_NAME, GLOBAL_STORE_NAME,
+                    LAYOUT_PER_FILE, LAYOUT_PER_PERSON, LAYOUT_GLOBAL, LAYOUTS,
+                    VECTOR_QUANTIZATION, QUANTIZED_RESCORE, PDF_DIR)
+from chroma_registry import get_registry
+from chroma_utils import sanitize_collection_name, query_all_collections
+from chunking import make_chunk_key, chunk_id
+from extractors import get_document_type
+from bm25_index import get_bm25_index, reciprocal_rank_fusion
+from answer_cache import get_answer_cache
+from quantized_store import quantized_query
+from embedding_utils import (collection_model_metadata, collection_embedding_model, embeddings_for_collection,
+                             get_embedding_model_for)
+
+# Configuração do logger para este módulo
+logger = logging.getLogger(__name__)
+
+# Nas organizações consolidadas (ver LAYOUTS em config.py), arquivo e tipo de documento
+# ficam nos metadados (source_file, document_type) e o escopo é aplicado com filtros where
+CONSOLIDATED_LAYOUTS = (LAYOUT_PER_PERSON, LAYOUT_GLOBAL)
+
+# Tamanho das páginas lidas do ChromaDB na listagem de arquivos e na migração
+READ_PAGE_SIZE = 1000
+
+# Busca híbrida: candidatos de cada lado (vetorial e BM25) antes da fusão por RRF
+HYBRID_CANDIDATES = 20
+
+
+def and_where(*clauses):
+    """
+    Combina filtros where do ChromaDB, ignorando os vazios.
+    """
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def collection_layout(collection) -> str:
+    """
+    Returns:
+        str: Organização registrada nos metadados da coleção (por arquivo, se ausente).
+    """
+    return (collection.metadata or {}).get("layout", LAYOUT_PER_FILE)
+
+
+def person_where(collection, client_name: str):
+    """
+    Filtro que restringe a coleção aos chunks do desaparecido (só necessário na coleção global).
+    """
+    if collection_layout(collection) == LAYOUT_GLOBAL:
+        return {"autor": client_name}
+    return None
+
+
+def document_key(client_name: str, file_path: str) -> str:
+    """
+    Identificação de um arquivo do desaparecido: o caminho relativo à pasta de upload
+    dele (PDF_DIR/<desaparecido>), com "/" como separador, para que arquivos de mesmo
+    nome em subpastas diferentes (ex.: ingestão em massa) não se sobrescrevam.
+    Arquivos na raiz da pasta mantêm o próprio nome, como antes; outros arquivos
+    existentes (ex.: ingestão no local) são identificados pelo nome; o restante
+    (ex.: source_file gravado nos metadados) já é a identificação.
+    """
+    upload_dir = os.path.abspath(os.path.join(PDF_DIR, client_name))
+    path = os.path.abspath(file_path)
+    try:
+        inside = os.path.commonpath([upload_dir, path]) == upload_dir
+    except ValueError:
+        # Unidades diferentes (Windows)
+        inside = False
+    if inside:
+        return os.path.relpath(path, upload_dir).replace(os.sep, '/')
+    if os.path.isabs(file_path) or os.path.exists(file_path):
+        return os.path.basename(path)
+    return file_path.replace(os.sep, '/')
+
+
+def document_where(collection, client_name: str, file_path: str):
+    """
+    Filtro que restringe a coleção aos chunks de um arquivo (None na organização por arquivo).
+    """
+    if collection_layout(collection) not in CONSOLIDATED_LAYOUTS:
+        return None
+    return and_where({"source_file": document_key(client_name, file_path)}, person_where(collection, client_name))
+
+
+def document_id_prefix(collection, client_name: str, file_path: str) -> str:
+    """
+    Prefixo dos ids dos chunks de um arquivo (cada parte de document_key sanitizada).
+    Na coleção global inclui o desaparecido, para que arquivos de mesmo nome de
+    desaparecidos diferentes não se misturem.
+    """
+    prefix = '/'.join(sanitize_collection_name(part) for part in document_key(client_name, file_path).split('/'))
+    if collection_layout(collection) == LAYOUT_GLOBAL:
+        prefix = f"{sanitize_collection_name(client_name)}/{prefix}"
+    return prefix
+
+
+def ingest_store_name(client_name: str, layout: str = None) -> str:
+    """
+    Repositório onde open_ingest_collection grava os arquivos do desaparecido, para
+    obter a trava de gravação (ChromaRegistry.writing) antes de abrir a coleção.
+    """
+    return GLOBAL_STORE_NAME if (layout or STORAGE_LAYOUT) == LAYOUT_GLOBAL else client_name
+
+
+def open_ingest_collection(client_name: str, file_path: str, layout: str = None, registry=None):
+    """
+    Abre (criando, se necessário) a coleção onde um arquivo deve ser gravado.
+    Args:
+        client_name (str): Nome do desaparecido.
+        file_path (str): Arquivo a ser gravado.
+        layout (str, opcional): Organização (padrão: STORAGE_LAYOUT).
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+    Returns:
+        Coleção do ChromaDB.
+    """
+    layout = layout or STORAGE_LAYOUT
+    registry = registry or get_registry()
+    if layout not in LAYOUTS:
+        raise ValueError(f"Organização de armazenamento desconhecida: {layout}")
+    # Coleções novas registram o modelo de embedding com que são gravadas
+    if layout == LAYOUT_PER_FILE:
+        return registry.get_collection(client_name, sanitize_collection_name(document_key(client_name, file_path)),
+                                       create=True, metadata=collection_model_metadata())
+    store_name = GLOBAL_STORE_NAME if layout == LAYOUT_GLOBAL else client_name
+    return registry.get_collection(store_name, CONSOLIDATED_COLLECTION_NAME, create=True,
+                                   metadata=dict(collection_model_metadata(), layout=layout))
+
+
+def collection_store_name(collection, client_name: str) -> str:
+    """
+    Repositório (pasta em BASE_CHROMA_PERSIST_DIR) onde a coleção está gravada.
+    """
+    return GLOBAL_STORE_NAME if collection_layout(collection) == LAYOUT_GLOBAL else client_name
+
+
+def lexical_index_for(collection, client_name: str, registry=None):
+    """
+    Returns:
+        BM25Index: Índice léxico do repositório onde a coleção está gravada.
+    """
+    registry = registry or get_registry()
+    return get_bm25_index(registry.client_path(collection_store_name(collection, client_name)))
+
+
+def notify_collection_changed(client_name: str, collection_name: str, store_name: str = None):
+    """
+    Registra que a ingestão alterou uma coleção do desaparecido, invalidando as
+    respostas guardadas no cache de respostas que dependiam dela. Também incrementa
+    o contador de alterações da coleção no repositório onde está gravada (store_name,
+    o próprio desaparecido se omitido; ver quantized_store._stamp).
+    """
+    try:
+        answer_cache = get_answer_cache()
+        answer_cache.bump_version(client_name, collection_name)
+        if store_name and store_name != client_name:
+            answer_cache.bump_version(store_name, collection_name)
+    except Exception as e:
+        logger.error(f"[notify_collection_changed] Falha ao invalidar respostas de {client_name}/{collection_name}: {str(e)}")
+
+
+def has_document(collection, client_name: str, file_path: str) -> bool:
+    """
+    Returns:
+        bool: True se a coleção já contém chunks do arquivo.
+    """
+    where = document_where(collection, client_name, file_path)
+    if where is None:
+        return collection.count() > 0
+    return bool(collection.get(where=where, limit=1, include=[])['ids'])
+
+
+def discard_document(collection, client_name: str, file_path: str, registry=None):
+    """
+    Remove da coleção consolidada (e do índice léxico) todos os chunks de um arquivo.
+    """
+    where = document_where(collection, client_name, file_path)
+    if where is None:
+        raise ValueError("discard_document só se aplica a coleções consolidadas.")
+    collection.delete(where=where)
+    lexical_index_for(collection, client_name, registry).remove_prefix(
+        document_id_prefix(collection, client_name, file_path))
+    # Importado aqui: case_index depende deste módulo
+    from case_index import remove_collection_cases
+    remove_collection_cases(client_name, collection.name, file_path, registry)
+    notify_collection_changed(client_name, collection.name, collection_store_name(collection, client_name))
+
+
+def delete_file_collection(client_name: str, collection_name: str, registry=None):
+    """
+    Remove uma coleção por arquivo e os seus chunks do índice léxico.
+    """
+    registry = registry or get_registry()
+    registry.delete_collection(client_name, collection_name)
+    get_bm25_index(registry.client_path(client_name)).remove_collection(collection_name)
+    from case_index import remove_collection_cases
+    remove_collection_cases(client_name, collection_name, registry=registry)
+    notify_collection_changed(client_name, collection_name)
+
+
+def consolidated_collections(client_name: str, registry) -> list:
+    """
+    Coleções consolidadas que podem conter chunks do desaparecido (dele e a global).
+    """
+    collections = []
+    if CONSOLIDATED_COLLECTION_NAME in registry.list_collections(client_name):
+        collections.append(registry.get_collection(client_name, CONSOLIDATED_COLLECTION_NAME))
+    global_dir = registry.client_path(GLOBAL_STORE_NAME)
+    if os.path.isdir(global_dir) and CONSOLIDATED_COLLECTION_NAME in registry.list_collections(GLOBAL_STORE_NAME):
+        collections.append(registry.get_collection(GLOBAL_STORE_NAME, CONSOLIDATED_COLLECTION_NAME))
+    return collections
+
+
+def per_file_collections(client_name: str, registry) -> list:
+    """
+    Coleções por arquivo do desaparecido (todas as do repositório dele, exceto a consolidada).
+    """
+    return [name for name in registry.list_collections(client_name) if name != CONSOLIDATED_COLLECTION_NAME]
+
+
+def person_collections(client_name: str, registry=None) -> list:
+    """
+    Returns:
+        list: Nomes de todas as coleções consultadas na pesquisa em todos os
+        documentos do desaparecido (por arquivo e consolidadas).
+    """
+    registry = registry or get_registry()
+    names = per_file_collections(client_name, registry)
+    names.extend(collection.name for collection in consolidated_collections(client_name, registry))
+    return sorted(set(names))
+
+
+def list_source_files(collection, client_name: str) -> list:
+    """
+    Lista os arquivos presentes em uma coleção consolidada, para um desaparecido.
+    Returns:
+        list: Nomes dos arquivos (source_file), ordenados.
+    """
+    where = person_where(collection, client_name)
+    files, offset = set(), 0
+    while True:
+        page = collection.get(where=where, include=['metadatas'], limit=READ_PAGE_SIZE, offset=offset)
+        files.update((meta or {}).get('source_file', '') for meta in page['metadatas'])
+        if len(page['ids']) < READ_PAGE_SIZE:
+            break
+        offset += READ_PAGE_SIZE
+    files.discard('')
+    return sorted(files)
+
+
+def list_scopes(client_name: str, registry=None) -> list:
+    """
+    Lista o que pode ser selecionado como "coleção" de um desaparecido: as coleções
+    por arquivo e os arquivos das coleções consolidadas.
+    Returns:
+        list: Nomes exibidos na interface.
+    """
+    registry = registry or get_registry()
+    scopes = per_file_collections(client_name, registry)
+    for collection in consolidated_collections(client_name, registry):
+        scopes.extend(name for name in list_source_files(collection, client_name) if name not in scopes)
+    return scopes
+
+
+def resolve_scope(client_name: str, scope: str, registry=None):
+    """
+    Converte um nome exibido por list_scopes na coleção e no filtro a consultar.
+    Returns:
+        tuple: (coleção, where) — where é None para coleções por arquivo.
+    """
+    registry = registry or get_registry()
+    if scope in per_file_collections(client_name, registry):
+        return registry.get_collection(client_name, scope), None
+    for collection in consolidated_collections(client_name, registry):
+        where = document_where(collection, client_name, scope)
+        if collection.get(where=where, limit=1, include=[])['ids']:
+            return collection, where
+    raise ValueError(f"Coleção {scope} não existe")
+
+
+def _vector_distance(collection, a, b) -> float:
+    """
+    Distância entre dois embeddings na métrica da coleção (l2 ao quadrado, padrão do ChromaDB, ou cosseno).
+    """
+    if (collection.metadata or {}).get("hnsw:space") == "cosine":
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return 1.0 - dot / norm if norm else 1.0
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def _lexical_hits(client_name: str, query_text: str, query_embedding, n_results: int, registry,
+                  memo: dict = None) -> list:
+    """
+    Busca BM25 no repositório do desaparecido e na coleção global, devolvendo os
+    chunks no formato de search_all. A distância vetorial dos chunks encontrados só
+    pelo índice léxico é calculada a partir dos embeddings gravados (com a consulta
+    codificada pelo modelo da coleção).
+    """
+    searches = []
+    if os.path.isdir(registry.client_path(client_name)):
+        searches.append((client_name, get_bm25_index(registry.client_path(client_name)).search(
+            query_text, top_n=n_results)))
+    if os.path.isdir(registry.client_path(GLOBAL_STORE_NAME)):
+        searches.append((GLOBAL_STORE_NAME, get_bm25_index(registry.client_path(GLOBAL_STORE_NAME)).search(
+            query_text, top_n=n_results, person=client_name)))
+    hits = []
+    for store_name, results in searches:
+        by_collection = {}
+        for chunk_id, col_name, _ in results:
+            by_collection.setdefault(col_name, []).append(chunk_id)
+        for col_name, chunk_ids in by_collection.items():
+            try:
+                collection = registry.get_collection(store_name, col_name)
+                found = collection.get(ids=chunk_ids, include=['documents', 'metadatas', 'embeddings'])
+                collection_embedding = embeddings_for_collection(collection, [query_embedding], [query_text], memo)[0]
+            except Exception as e:
+                logger.error(f"[search_all] Erro ao ler chunks do índice léxico em {col_name}: {str(e)}")
+                continue
+            for chunk_id, doc, meta, embedding in zip(found['ids'], found['documents'], found['metadatas'],
+                                                      found['embeddings']):
+                meta = meta or {}
+                display = meta.get('source_file', col_name) if col_name == CONSOLIDATED_COLLECTION_NAME else col_name
+                hits.append({"collection": display, "id": chunk_id, "document": doc, "metadata": meta,
+                             "distance": _vector_distance(collection, collection_embedding, list(embedding))})
+    # Mantém a ordem do BM25 (as leituras por coleção a desfazem)
+    order = {chunk_id: rank for _, results in searches for rank, (chunk_id, _, _) in enumerate(results)}
+    hits.sort(key=lambda hit: order.get(hit['id'], len(order)))
+    return hits
+
+
+def search_all(client_name: str, query_embedding, n_results: int = 3, where: dict = None, registry=None,
+               query_text: str = None, lexical: bool = True) -> list:
+    """
+    Pesquisa em todos os documentos de um desaparecido. Coleções consolidadas são
+    consultadas com uma única busca ANN; coleções por arquivo ainda não migradas
+    são consultadas em paralelo (query_all_collections). O resultado é o top-k global.
+
+    Com query_text (e lexical), a busca é híbrida: os candidatos vetoriais e os do
+    índice BM25 (termos exatos como nomes, documentos e telefones, independentemente
+    do top-k vetorial) são combinados por Reciprocal Rank Fusion. query_embedding é
+    calculado com o modelo em uso; coleções gravadas com outro modelo (durante a
+    troca do reprocessamento) recebem query_text codificado com o seu modelo.
+    Args:
+        client_name (str): Nome do desaparecido.
+        query_embedding (list): Embedding da consulta.
+        n_results (int): Quantidade total de resultados.
+        where (dict, opcional): Filtro adicional de metadados (ex.: {"document_type": "pdf"}).
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+        query_text (str, opcional): Texto da consulta, para a busca léxica e para
+            coleções gravadas com outro modelo.
+        lexical (bool): Se False, apenas busca vetorial, mesmo com query_text.
+    Returns:
+        list: Dicionários com collection, id, document, metadata e distance
+        (e score, a pontuação da fusão, na busca híbrida).
+    """
+    registry = registry or get_registry()
+    with registry.pinned():
+        if hasattr(query_embedding, 'tolist'):
+            query_embedding = query_embedding.tolist()
+        hybrid = bool(query_text) and lexical
+        texts = [query_text] if query_text else None
+        memo = {}
+        candidates = max(n_results, HYBRID_CANDIDATES) if hybrid else n_results
+        hits = []
+        per_file = per_file_collections(client_name, registry)
+        if per_file:
+            if where:
+                logger.debug("[search_all] Filtro where ignorado nas coleções por arquivo.")
+            # Coleções agrupadas pelo modelo com que foram gravadas (um só grupo fora da troca)
+            groups = {}
+            for col_name in per_file:
+                try:
+                    collection = registry.get_collection(client_name, col_name)
+                except Exception as e:
+                    logger.error(f"[search_all] Erro ao abrir a coleção {col_name}: {str(e)}")
+                    continue
+                groups.setdefault(collection_embedding_model(collection), []).append(collection)
+            for members in groups.values():
+                embedding = embeddings_for_collection(members[0], [query_embedding], texts, memo)
+                if embedding is None:
+                    continue
+                hits.extend(query_all_collections(client_name, embedding[0], n_results=candidates, registry=registry,
+                                                  collection_names=[collection.name for collection in members]))
+        for collection in consolidated_collections(client_name, registry):
+            embedding = embeddings_for_collection(collection, [query_embedding], texts, memo)
+            if embedding is None:
+                continue
+            collection_embedding = embedding[0]
+            if VECTOR_QUANTIZATION and not where:
+                # Busca compacta: força bruta nos vetores quantizados (sem filtros where)
+                try:
+                    for hit in quantized_query(collection, collection_store_name(collection, client_name),
+                                               collection_embedding, candidates, VECTOR_QUANTIZATION,
+                                               rescore=QUANTIZED_RESCORE,
+                                               person=client_name if person_where(collection, client_name) else None,
+                                               registry=registry):
+                        hits.append(dict(hit, collection=hit['metadata'].get('source_file', collection.name)))
+                    continue
+                except Exception as e:
+                    logger.error(f"[search_all] Busca quantizada falhou em {collection.name}, "
+                                 f"usando o ChromaDB: {str(e)}")
+            try:
+                results = collection.query(
+                    query_embeddings=[collection_embedding],
+                    n_results=candidates,
+                    where=and_where(person_where(collection, client_name), where),
+                    include=['documents', 'metadatas', 'distances']
+                )
+                for chunk_id, doc, meta, distance in zip(results['ids'][0], results['documents'][0],
+                                                         results['metadatas'][0], results['distances'][0]):
+                    meta = meta or {}
+                    hits.append({"collection": meta.get('source_file', collection.name), "id": chunk_id,
+                                 "document": doc, "metadata": meta, "distance": distance})
+            except Exception as e:
+                logger.error(f"[search_all] Erro ao pesquisar na coleção {collection.name}: {str(e)}")
+        hits.sort(key=lambda hit: hit['distance'])
+        if not hybrid:
+            return hits[:n_results]
+
+        lexical_hits = _lexical_hits(client_name, query_text, query_embedding, candidates, registry, memo)
+        if where:
+            lexical_hits = [hit for hit in lexical_hits if all(hit['metadata'].get(k) == v for k, v in where.items()
+                                                               if not isinstance(v, dict))]
+        fused = reciprocal_rank_fusion([[hit['id'] for hit in hits[:candidates]], [hit['id'] for hit in lexical_hits]])
+        by_id = {hit['id']: hit for hit in lexical_hits}
+        by_id.update({hit['id']: hit for hit in hits})
+        ranked = sorted(fused, key=lambda chunk_id: -fused[chunk_id])[:n_results]
+        return [dict(by_id[chunk_id], score=fused[chunk_id]) for chunk_id in ranked]
+
+
+def rebuild_lexical_index(client_name: str, registry=None) -> int:
+    """
+    Reconstrói o índice BM25 do desaparecido (ou do repositório global, com
+    GLOBAL_STORE_NAME) a partir das coleções gravadas, ex.: para repositórios
+    criados antes do índice léxico.
+    Returns:
+        int: Quantidade de chunks indexados.
+    """
+    registry = registry or get_registry()
+    index = get_bm25_index(registry.client_path(client_name))
+    indexed = 0
+    for col_name in registry.list_collections(client_name):
+        collection = registry.get_collection(client_name, col_name)
+        index.remove_collection(col_name)
+        offset = 0
+        while True:
+            page = collection.get(include=['documents', 'metadatas'], limit=READ_PAGE_SIZE, offset=offset)
+            if not page['ids']:
+                break
+            # Na coleção global, cada chunk pertence ao desaparecido indicado em "autor"
+            groups = {}
+            for chunk_id, doc, meta in zip(page['ids'], page['documents'], page['metadatas']):
+                person = (meta or {}).get('autor', client_name) if client_name == GLOBAL_STORE_NAME else client_name
+                groups.setdefault(person, ([], []))
+                groups[person][0].append(chunk_id)
+                groups[person][1].append(doc)
+            for person, (chunk_ids, documents) in groups.items():
+                index.add(chunk_ids, documents, col_name, person)
+            indexed += len(page['ids'])
+            if len(page['ids']) < READ_PAGE_SIZE:
+                break
+            offset += READ_PAGE_SIZE
+    logger.info(f"[rebuild_lexical_index] {client_name}: {indexed} chunks indexados.")
+    return indexed
+
+
+def _migrated_metadata(meta: dict, client_name: str, col_name: str) -> dict:
+    """
+    Completa os metadados de um chunk antigo com os campos da organização consolidada.
+    """
+    meta = dict(meta or {})
+    # Mesma identificação da ingestão, para que arquivos de mesmo nome em subpastas não se misturem
+    file_path = meta.get('file_path')
+    source_file = (document_key(client_name, file_path) if file_path else '') or meta.get('titulo') or col_name
+    meta['source_file'] = meta.get('source_file') or source_file
+    meta['document_type'] = meta.get('document_type') or get_document_type(meta['source_file'])
+    meta['autor'] = client_name
+    return meta
+
+
+def migrate_person(client_name: str, layout: str = LAYOUT_PER_PERSON, delete_source: bool = False,
+                   batch_size: int = 256, progress_callback=None, registry=None) -> list:
+    """
+    Move as coleções por arquivo de um desaparecido para a coleção consolidada.
+    Os embeddings são copiados (sem passar pelo modelo) e os ids são refeitos a partir
+    do conteúdo, no mesmo formato usado na ingestão, para que uma reingestão posterior
+    reconheça os chunks migrados.
+    Args:
+        client_name (str): Nome do desaparecido.
+        layout (str): Organização de destino (por desaparecido ou global).
+        delete_source (bool): Se True, remove cada coleção por arquivo após a cópia.
+        batch_size (int): Quantidade de chunks por gravação.
+        progress_callback (callable, opcional): Função (etapa, feitos, total) de progresso.
+        registry (ChromaRegistry, opcional): Registro de clientes/coleções abertos.
+    Returns:
+        list: Um dicionário por coleção migrada (collection, source_file, chunks).
+    """
+    if layout not in CONSOLIDATED_LAYOUTS:
+        raise ValueError(f"A migração exige uma organização consolidada: {CONSOLIDATED_LAYOUTS}")
+    registry = registry or get_registry()
+    with registry.pinned(), registry.writing(client_name, ingest_store_name(client_name, layout)):
+        collection_names = per_file_collections(client_name, registry)
+        report = []
+        for position, col_name in enumerate(collection_names):
+            if progress_callback:
+                progress_callback("migração", position, len(collection_names))
+            source = registry.get_collection(client_name, col_name)
+            target = None
+            occurrences = {}
+            copied, offset = 0, 0
+            source_file = col_name
+            while True:
+                page = source.get(include=['documents', 'metadatas', 'embeddings'], limit=READ_PAGE_SIZE, offset=offset)
+                if not page['ids']:
+                    break
+                metadatas = [_migrated_metadata(meta, client_name, col_name) for meta in page['metadatas']]
+                source_file = metadatas[0]['source_file']
+                if target is None:
+                    target = open_ingest_collection(client_name, source_file, layout=layout, registry=registry)
+                prefix = document_id_prefix(target, client_name, source_file)
+                ids = []
+                for doc in page['documents']:
+                    key = make_chunk_key(doc)
+                    occurrence = occurrences.get(key, 0)
+                    occurrences[key] = occurrence + 1
+                    ids.append(chunk_id(prefix, make_chunk_key(doc, occurrence)))
+                # Embeddings copiados sem o modelo, a menos que as coleções usem modelos
+                # diferentes (durante a troca do reprocessamento)
+                same_model = collection_embedding_model(source) == collection_embedding_model(target)
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    if same_model:
+                        embeddings = [list(emb) for emb in page['embeddings'][start:end]]
+                    else:
+                        embeddings = get_embedding_model_for(target).encode(page['documents'][start:end]).tolist()
+                    target.upsert(ids=ids[start:end], documents=page['documents'][start:end],
+                                  metadatas=metadatas[start:end], embeddings=embeddings)
+                lexical_index_for(target, client_name, registry).add(ids, page['documents'], target.name, client_name)
+                copied += len(ids)
+                if len(page['ids']) < READ_PAGE_SIZE:
+                    break
+                offset += READ_PAGE_SIZE
+            if delete_source and copied == source.count():
+                delete_file_collection(client_name, col_name, registry)
+            if target is not None:
+                from case_index import sync_document_cases
+                sync_document_cases(target, client_name, source_file, registry)
+                notify_collection_changed(client_name, target.name, collection_store_name(target, client_name))
+            report.append({"collection": col_name, "source_file": source_file, "chunks": copied})
+            logger.info(f"[migrate_person] {client_name}/{col_name}: {copied} chunks migrados ({layout}).")
+        if progress_callback:
+            progress_callback("migração", len(collection_names), len(collection_names))
+        return report